@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+import DBConfig
+
+
+class AnswerCache:
+    '''
+    以問題向量的 cosine 相似度查詢的回答快取 (每個行程一份，LRU + TTL)
+
+    同一個 (user_id, topic_id, 排序後的 file_id, gate_mode) 下，新問題與已回答問題的相似度
+    達到 threshold 時直接回傳當時 ask_LLM 的回答，不再檢索與呼叫 LLM。
+    超過 max_entries 時刪除最久未使用的回答；新增 / 刪除檔案或主題時以 invalidate 清除相關項目。
+    '''
+
+    def __init__(self, threshold=DBConfig.ANSWER_CACHE_THRESHOLD, max_entries=DBConfig.ANSWER_CACHE_MAX_ENTRIES,
+                 ttl=DBConfig.ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()       # entry id -> (group key, 寫入時間, 正規化後的問題向量, 回答)
+        self._groups = {}                   # group key -> {entry id}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(user_id, topic_id, file_ids, gate_mode):
+        return (int(user_id), int(topic_id), tuple(sorted({int(file_id) for file_id in file_ids})), gate_mode)
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id):
+        key = self._entries.pop(entry_id)[0]
+        group = self._groups[key]
+        group.discard(entry_id)
+        if not group:
+            del self._groups[key]
+
+    def get(self, user_id, topic_id, file_ids, gate_mode, embedding):
+        '''
+        回傳 (回答, 相似度)，沒有相似度達到 threshold 的已回答問題時回傳 (None, 最高相似度)
+        '''
+        key = self.make_key(user_id, topic_id, file_ids, gate_mode)
+        query = self._unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            for entry_id in [entry_id for entry_id in self._groups.get(key, ())
+                             if now - self._entries[entry_id][1] >= self.ttl]:
+                self._remove(entry_id)
+            entry_ids = list(self._groups.get(key, ()))
+            if not entry_ids:
+                self.misses += 1
+                return None, 0.0
+
+            similarities = np.stack([self._entries[entry_id][2] for entry_id in entry_ids]) @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, similarity
+            self._entries.move_to_end(entry_ids[best])
+            self.hits += 1
+            return self._entries[entry_ids[best]][3], similarity
+
+    def put(self, user_id, topic_id, file_ids, gate_mode, embedding, answer):
+        key = self.make_key(user_id, topic_id, file_ids, gate_mode)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (key, time.monotonic(), self._unit(embedding), answer)
+            self._groups.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, user_id, topic_id=None, file_ids=None):
+        '''
+        清除該使用者 (指定 topic_id 時只限該主題、指定 file_ids 時只限包含其中任一檔案) 的項目
+        '''
+        user_id = int(user_id)
+        topic_id = None if topic_id is None else int(topic_id)
+        file_ids = None if file_ids is None else {int(file_id) for file_id in file_ids}
+        with self._lock:
+            stale = [key for key in self._groups
+                     if key[0] == user_id
+                     and (topic_id is None or key[1] == topic_id)
+                     and (file_ids is None or not file_ids.isdisjoint(key[2]))]
+            for key in stale:
+                for entry_id in list(self._groups[key]):
+                    self._remove(entry_id)
+                    self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'invalidations': self.invalidations,
+            }
+
+
+answer_cache = AnswerCache() if DBConfig.ANSWER_CACHE_ENABLED else None
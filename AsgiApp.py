@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+'''
+以 ASGI server 執行 app 的進入點:
+
+    hypercorn AsgiApp:asgi_app --bind 0.0.0.0:5000 --workers 2
+
+POST /ask 直接在 server 的 event loop 上以 coroutine 處理 (app.ask_payload)，等待 embedding / LLM 時
+不佔用任何執行緒，一個 worker 可同時處理多個問題；只有 SQL 查詢與向量檢索以 asyncio.to_thread 短暫使用執行緒。
+其餘路由 (頁面、上傳、/ask_stream 等) 仍由 Flask 處理，經 asgiref 的 WsgiToAsgi 在執行緒中執行。
+'''
+import json
+import asyncio
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_login import current_user
+
+import DBConfig
+from app import app, ask_payload
+
+
+flask_asgi = WsgiToAsgi(app)
+
+
+def load_user_id(headers):
+    '''
+    以 request 的 cookie 還原 Flask session 與 Flask-Login 的使用者 (會查詢 SQL，需在執行緒中呼叫)，未登入時回傳 None
+    '''
+    with app.test_request_context('/ask', method='POST', headers=headers):
+        if current_user.is_authenticated:
+            return int(current_user.id)
+        return None
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            return body
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def ask(scope, receive, send):
+    headers = [(key.decode('latin-1'), value.decode('latin-1')) for key, value in scope['headers']]
+    user_id = await asyncio.to_thread(load_user_id, headers)
+    if user_id is None:
+        # 未登入的回應 (例如導向登入頁) 與 Flask 相同
+        await flask_asgi(scope, receive, send)
+        return
+
+    body = await read_body(receive)
+    if body is None:
+        return
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        await send_json(send, {'success': False, 'error': 'Invalid JSON'}, status=400)
+        return
+
+    payload = await ask_payload(user_id, data.get('fileIds', []), data.get('topicId', ''), data.get('question', ''),
+                                data.get('gateMode', DBConfig.ASK_GATE_MODE), not data.get('bypassCache', False))
+    await send_json(send, payload)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def asgi_app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/ask' and scope['method'] == 'POST':
+        await ask(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
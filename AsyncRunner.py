@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import os
+import asyncio
+import threading
+
+
+_loop = None
+_pid = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    '''
+    取得背景執行緒中共用的 event loop (每個行程一個，fork 後重新建立)
+
+    Flask 的 async view 每個 request 都會建立新的 event loop，ClientPool 的 AsyncOpenAI client
+    是依 event loop 快取的，因此改為所有 request 共用同一個長駐的 loop，連線池才能重複使用
+
+    注意: 這只是供 WSGI view 使用的共用 loop，view 呼叫 run_async 時該 request 的執行緒會阻塞到 coroutine 完成。
+    不佔用執行緒的 /ask 需以 ASGI 執行 (見 AsgiApp)，此時 coroutine 直接在 server 的 event loop 上執行
+    '''
+    global _loop, _pid
+    with _lock:
+        if _loop is None or _pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name='async-runner', daemon=True).start()
+        return _loop
+
+
+def run_async(coro, timeout=None):
+    '''
+    在共用的 event loop 上執行 coroutine，呼叫端執行緒阻塞等待結果 (供同步的 Flask view 呼叫)
+    '''
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+import DBConfig
+
+
+IMAGE_PATH_PATTERN = re.compile(r'D:[^\"\s]*?\.(?:png|jpe?g|gif)', re.IGNORECASE)
+# 串流切分時，連續這麼多字都沒有空白就不再等待分隔字元
+MAX_UNSEPARATED_CHARS = 4096
+
+
+class ImageSpanIndex:
+    '''
+    文字中所有圖片路徑 (D:...png) 的區間，依起點排序且互不重疊，以 bisect 查詢
+    '''
+
+    def __init__(self, text):
+        self.starts = []
+        self.ends = []
+        for m in IMAGE_PATH_PATTERN.finditer(text):
+            self.starts.append(m.start())
+            self.ends.append(m.end())
+
+    def adjust_position(self, pos):
+        """ 如果 pos 落在圖片路徑中，則返回圖片結尾位置 """
+        i = bisect_right(self.starts, pos) - 1
+        if i >= 0 and pos < self.ends[i]:
+            return self.ends[i]
+        return pos
+
+
+def iter_sliding_window(text, window_size=100, overlap=30):
+    """
+    sliding_window 的 generator 版本，逐一產生切割後的子字串。
+
+    圖片路徑的區間依起點排序且互不重疊，以 bisect 查詢 pos 所在的圖片，
+    整體為 O(windows * log(images))，結果與原本逐一掃描 image_positions 的版本相同。
+    """
+    step = window_size - overlap
+    text_len = len(text)
+    start = 0
+    title_end = text.find("##")
+    title = text if title_end < 0 else text[:title_end]
+
+    # 找出所有 D 開頭、png/jpg/gif/jpeg 結尾的圖片路徑
+    images = ImageSpanIndex(text)
+
+    while start < text_len:
+        # Step 1: 調整 start 點：不能落在圖片中
+        start = images.adjust_position(start)
+
+        # Step 2: 確認 end 點
+        end = min(start + window_size, text_len)
+
+        # Step 3: 調整 end 點：如果 end 在圖片中，就延伸到圖片結尾
+        end = images.adjust_position(end)
+
+        # Step 4: 產生結果
+        yield title + text[start:end]
+
+        # Step 5: 更新 start 到下一段起點（保持 overlap）
+        start = start + step
+
+def sliding_window(text, window_size=100, overlap=30):
+    """
+    對單一字符串進行滑動窗口切割，並避開圖片路徑（D:...\.(png|jpe?g|gif)）被切斷。
+
+    參數:
+        text (str): 要切割的字串
+        window_size (int): 每個窗口大小（預設100）
+        overlap (int): 窗口間的重疊大小（預設30）
+
+    回傳:
+        list: 切割後的子字串列表
+    """
+    return list(iter_sliding_window(text, window_size, overlap))
+
+
+def window_title(head, eof, title_max_chars=DBConfig.STREAM_TITLE_MAX_CHARS):
+    '''
+    iter_sliding_window_stream 加在每一段前面的 title: head 為文件開頭 (至少讀到 ## 或超過 title_max_chars)，
+    eof 表示 head 即為全文
+    '''
+    title_end = head.find('##')
+    if 0 <= title_end <= title_max_chars:
+        return head[:title_end]
+    if title_end < 0 and eof and len(head) <= title_max_chars:
+        return head
+    return ''
+
+
+def read_window_title(file_path, title_max_chars=DBConfig.STREAM_TITLE_MAX_CHARS):
+    '''
+    以 window 策略切分 file_path 時每一段開頭的 title (與 iter_file_chunks 相同的讀檔方式)
+    '''
+    with open(file_path, 'r', encoding='utf-8') as file:
+        # ## 最晚從第 title_max_chars 字開始，多讀兩字即可判斷
+        head = file.read(title_max_chars + 2)
+        eof = file.read(1) == ''
+    return window_title(head, eof, title_max_chars)
+
+
+def iter_sliding_window_stream(blocks, window_size=100, overlap=30,
+                               title_max_chars=DBConfig.STREAM_TITLE_MAX_CHARS):
+    """
+    iter_sliding_window 的串流版本，blocks 為依序讀入的文字區塊 (例如 file.read(block_size))
+
+    只保留尚未切完的文字在記憶體中。圖片路徑不含空白與引號，因此只掃描到目前區塊中
+    最後一個空白/引號為止，跨區塊的圖片路徑會等下一個區塊讀入後才判斷，不會被切斷。
+    title 為第一個 ## 之前的文字，但只在前 title_max_chars 字內尋找，
+    超過則不加 title (避免沒有 ## 的檔案把整份文件接到每一段前面)；
+    其餘情況輸出與 iter_sliding_window 相同。
+    """
+    step = window_size - overlap
+    blocks = iter(blocks)
+    buf = ''            # 目前保留的文字，對應全文 [buf_start, buf_start + len(buf))
+    buf_start = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, eof
+        block = next(blocks, None)
+        if block is None:
+            eof = True
+        else:
+            buf += block
+
+    # 讀到 ## 或超過 title_max_chars 為止
+    while not eof and '##' not in buf and len(buf) <= title_max_chars:
+        fill()
+    title = window_title(buf, eof, title_max_chars)
+
+    image_starts = []
+    image_ends = []
+    scanned = 0         # 全文中 [0, scanned) 的圖片路徑皆已找出
+
+    def scan():
+        nonlocal scanned
+        buf_end = buf_start + len(buf)
+        safe = buf_end
+        if not eof:
+            separator = None
+            for i in range(len(buf) - 1, scanned - buf_start - 1, -1):
+                if buf[i] == '"' or buf[i].isspace():
+                    separator = i
+                    break
+            if separator is not None:
+                safe = buf_start + separator
+            elif buf_end - scanned > MAX_UNSEPARATED_CHARS:
+                # 極長且沒有空白的內容，不再等待分隔字元以免緩衝區無限成長
+                safe = buf_end - MAX_UNSEPARATED_CHARS // 2
+            else:
+                safe = scanned
+        if safe > scanned:
+            for m in IMAGE_PATH_PATTERN.finditer(buf, scanned - buf_start, safe - buf_start):
+                image_starts.append(buf_start + m.start())
+                image_ends.append(buf_start + m.end())
+            scanned = safe
+
+    def adjust_position(pos):
+        i = bisect_right(image_starts, pos) - 1
+        if i >= 0 and pos < image_ends[i]:
+            return image_ends[i]
+        return pos
+
+    scan()
+    start = 0
+    start_adjusted = False
+    while True:
+        buf_end = buf_start + len(buf)
+        if eof and start >= buf_end:
+            break
+
+        if not start_adjusted and (start < scanned or eof):
+            start = adjust_position(start)
+            start_adjusted = True
+
+        if start_adjusted and (start + window_size < scanned or eof):
+            end = adjust_position(min(start + window_size, buf_end))
+            yield title + buf[start - buf_start:end - buf_start]
+            start = start + step
+            start_adjusted = False
+
+            # 丟掉已經用不到的文字與圖片區間
+            if start - buf_start > len(buf) // 2 and start <= scanned:
+                buf = buf[start - buf_start:]
+                buf_start = start
+                drop = bisect_right(image_ends, start)
+                del image_starts[:drop]
+                del image_ends[:drop]
+            continue
+
+        fill()
+        scan()
+
+
+def iter_lines(blocks, max_line_chars=DBConfig.STREAM_BLOCK_SIZE):
+    '''
+    將文字區塊轉為逐行輸出 (保留換行)，單行超過 max_line_chars 時分段輸出
+    '''
+    pending = ''
+    for block in blocks:
+        pending += block
+        lines = pending.splitlines(keepends=True)
+        pending = ''
+        if lines and not lines[-1].endswith(('\n', '\r')):
+            pending = lines.pop()
+        yield from lines
+        while len(pending) > max_line_chars:
+            yield pending[:max_line_chars]
+            pending = pending[max_line_chars:]
+    if pending:
+        yield pending
+
+
+def iter_line_sections(lines, is_boundary, max_chars=DBConfig.SECTION_MAX_CHARS):
+    '''
+    逐行累積，遇到 is_boundary(line) 為 True 的行開始新的一段；
+    單段超過 max_chars 時以行為單位再切開，單行超長則直接硬切
+    '''
+    current = ''
+    line_start = True
+    for line in lines:
+        if line_start and current.strip() and is_boundary(line):
+            yield current
+            current = ''
+        line_start = line.endswith(('\n', '\r'))
+
+        if current and len(current) + len(line) > max_chars:
+            if current.strip():
+                yield current
+            current = ''
+        while len(line) > max_chars:
+            yield line[:max_chars]
+            line = line[max_chars:]
+        current += line
+
+    if current.strip():
+        yield current
+
+
+def iter_md_sections(blocks, max_chars=DBConfig.SECTION_MAX_CHARS):
+    '''
+    以##來做區分，與 DBServer/DBUpdater.read_file_md_foramt 相同；
+    第一個 ## 之前的內容自成一段，過長的 section 再依行切開
+    '''
+    return iter_line_sections(iter_lines(blocks), lambda line: line.strip().startswith('##'), max_chars)
+
+
+def iter_code_functions(blocks, max_chars=DBConfig.SECTION_MAX_CHARS):
+    '''
+    以行首的函數定義 (def ) 切分程式碼，與 DBServer/DBUpdater.split_code 相同
+    '''
+    return iter_line_sections(iter_lines(blocks), lambda line: line.startswith('def '), max_chars)
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer(tokenizer_name=DBConfig.TOKENIZER_NAME):
+    '''
+    tokenizer_name 為本機 tokenizer.json 路徑時直接讀檔，否則依名稱從 HF hub 下載
+    '''
+    if Tokenizer is None:
+        raise RuntimeError("token 切分需要安裝 tokenizers 套件 (pip install tokenizers)")
+    if os.path.isfile(tokenizer_name):
+        return Tokenizer.from_file(tokenizer_name)
+    return Tokenizer.from_pretrained(tokenizer_name)
+
+
+def token_windows(text, window_tokens, overlap_tokens, final=True):
+    '''
+    回傳 (windows, rest_start)：text 內完整的 token 窗口，以及下一個窗口在 text 中的起點；
+    final 為 False 時最後不足一個窗口的部分不輸出，留給下一個區塊接續
+    '''
+    encoding = get_tokenizer().encode(text, add_special_tokens=False)
+    offsets = [offset for offset in encoding.offsets if offset[1] > offset[0]]
+    if not offsets:
+        return [], len(text)
+
+    images = ImageSpanIndex(text)
+    step = window_tokens - overlap_tokens
+    windows = []
+    last_end = 0
+    for i in range(0, len(offsets), step):
+        if not final and i + window_tokens >= len(offsets):
+            return windows, offsets[i][0]
+        start = images.adjust_position(offsets[i][0])
+        end = offsets[min(i + window_tokens, len(offsets)) - 1][1]
+        end = images.adjust_position(end)
+        if end > last_end:
+            windows.append(text[start:end])
+            last_end = end
+        if i + window_tokens >= len(offsets):
+            break
+    return windows, len(text)
+
+
+def iter_token_window(blocks, window_tokens=DBConfig.TOKEN_WINDOW_SIZE, overlap_tokens=DBConfig.TOKEN_WINDOW_OVERLAP,
+                      block_size=DBConfig.STREAM_BLOCK_SIZE):
+    '''
+    以 embedding 模型 (bge-m3) 的 tokenizer 計算長度的滑動窗口，
+    依 token offset 切回原文，並避免圖片路徑被切斷。
+
+    每累積 block_size 字就在最後一個換行處切開做 tokenize，未滿一個窗口的尾段接到下一個區塊
+    '''
+    pending = ''
+    for block in blocks:
+        pending += block
+        if len(pending) < block_size:
+            continue
+        cut = pending.rfind('\n') + 1 or len(pending)
+        windows, rest_start = token_windows(pending[:cut], window_tokens, overlap_tokens, final=False)
+        yield from windows
+        pending = pending[rest_start:]
+
+    if pending:
+        windows, _ = token_windows(pending, window_tokens, overlap_tokens)
+        yield from windows
+
+
+CHUNK_STRATEGIES = {
+    'window': iter_sliding_window_stream,
+    'section': iter_md_sections,
+    'code': iter_code_functions,
+}
+# 未安裝 tokenizers 時不提供 token 策略，避免選了之後才在背景工作中失敗
+if Tokenizer is not None:
+    CHUNK_STRATEGIES['token'] = iter_token_window
+
+
+def chunk_text(text, strategy=DBConfig.DEFAULT_CHUNK_STRATEGY):
+    '''
+    依策略名稱切分文字，回傳 generator
+    '''
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Unknown chunk strategy: {strategy}")
+    return CHUNK_STRATEGIES[strategy]([text])
+
+
+def iter_file_blocks(file, block_size=DBConfig.STREAM_BLOCK_SIZE):
+    while True:
+        block = file.read(block_size)
+        if not block:
+            return
+        yield block
+
+
+def iter_file_chunks(file_path, strategy=DBConfig.DEFAULT_CHUNK_STRATEGY, block_size=DBConfig.STREAM_BLOCK_SIZE):
+    '''
+    逐區塊讀檔並切分，記憶體用量只與 block_size 有關，與檔案大小無關
+    '''
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Unknown chunk strategy: {strategy}")
+    with open(file_path, 'r', encoding='utf-8') as file:
+        yield from CHUNK_STRATEGIES[strategy](iter_file_blocks(file, block_size))
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import base64
+import random
+import asyncio
+import logging
+import threading
+import weakref
+
+import httpx
+import numpy as np
+from openai import OpenAI, AsyncOpenAI
+from openai import APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+
+import DBConfig
+
+
+# 可重試的錯誤: 連線失敗、逾時、429、5xx
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+_sync_clients = {}
+_async_clients = weakref.WeakKeyDictionary()   # event loop -> {key: AsyncOpenAI}
+_lock = threading.Lock()
+_pid = None
+
+
+def _limits():
+    return httpx.Limits(max_connections=DBConfig.OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=DBConfig.OPENAI_MAX_KEEPALIVE,
+                        keepalive_expiry=DBConfig.OPENAI_KEEPALIVE_EXPIRY)
+
+
+def _timeout(read_timeout):
+    return httpx.Timeout(read_timeout, connect=DBConfig.OPENAI_CONNECT_TIMEOUT)
+
+
+def _reset_after_fork():
+    '''
+    fork 後的子行程不可沿用父行程的連線，發現 pid 改變就清空快取
+    '''
+    global _pid
+    if _pid != os.getpid():
+        _sync_clients.clear()
+        _async_clients.clear()
+        _pid = os.getpid()
+
+
+def get_client(api_key, base_url, read_timeout):
+    '''
+    取得共用的 OpenAI client (每個行程一份)，保留 HTTP keep-alive 連線
+    重試交給 call_with_retry，client 本身不重試
+    '''
+    key = (api_key, base_url, read_timeout)
+    with _lock:
+        _reset_after_fork()
+        client = _sync_clients.get(key)
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                            timeout=_timeout(read_timeout),
+                            http_client=httpx.Client(limits=_limits(), timeout=_timeout(read_timeout)))
+            _sync_clients[key] = client
+        return client
+
+
+def get_async_client(api_key, base_url, read_timeout):
+    '''
+    取得目前 event loop 共用的 AsyncOpenAI client；httpx.AsyncClient 不可跨 event loop 使用
+    '''
+    loop = asyncio.get_running_loop()
+    key = (api_key, base_url, read_timeout)
+    with _lock:
+        _reset_after_fork()
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                 timeout=_timeout(read_timeout),
+                                 http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout(read_timeout)))
+            clients[key] = client
+        return client
+
+
+def get_embedding_client():
+    return get_client(DBConfig.EMBEDDING_API_KEY, DBConfig.EMBEDDING_API_BASE, DBConfig.EMBEDDING_TIMEOUT)
+
+
+def embeddings_to_array(data):
+    '''
+    embeddings.create 回傳的 response.data -> (n, dim) 的 float32 陣列 (連續記憶體)
+
+    encoding_format="base64" 時每筆以 np.frombuffer 直接複製到陣列，不建立 Python float；
+    server 不支援 base64 而回傳數字 list 時也能處理
+    '''
+    if not data:
+        return np.empty((0, DBConfig.DIMENSION), dtype=np.float32)
+    vectors = (np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32)
+               if isinstance(item.embedding, str) else item.embedding for item in data)
+    first = next(vectors)
+    embeddings = np.empty((len(data), len(first)), dtype=np.float32)
+    embeddings[0] = first
+    for row, vector in enumerate(vectors, 1):
+        embeddings[row] = vector
+    return embeddings
+
+
+def get_llm_client():
+    return get_client(DBConfig.LLM_API_KEY, DBConfig.LLM_API_BASE, DBConfig.LLM_TIMEOUT)
+
+
+def get_async_embedding_client():
+    return get_async_client(DBConfig.EMBEDDING_API_KEY, DBConfig.EMBEDDING_API_BASE, DBConfig.EMBEDDING_TIMEOUT)
+
+
+def get_async_llm_client():
+    return get_async_client(DBConfig.LLM_API_KEY, DBConfig.LLM_API_BASE, DBConfig.LLM_TIMEOUT)
+
+
+def backoff_delay(attempt):
+    '''
+    指數退避加上 full jitter: 在 [0, min(max_delay, base * 2^attempt)] 之間隨機
+    '''
+    cap = min(DBConfig.OPENAI_RETRY_MAX_DELAY, DBConfig.OPENAI_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def call_with_retry(func, *args, **kwargs):
+    '''
+    呼叫 func，遇到 RETRYABLE_ERRORS 時依 backoff_delay 重試，最多 DBConfig.OPENAI_MAX_RETRIES 次
+    '''
+    for attempt in range(DBConfig.OPENAI_MAX_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == DBConfig.OPENAI_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"OpenAI request failed ({e.__class__.__name__}), retry in {delay:.2f}s")
+            time.sleep(delay)
+
+
+async def acall_with_retry(func, *args, **kwargs):
+    '''
+    call_with_retry 的 async 版本，func 為 coroutine function
+    '''
+    for attempt in range(DBConfig.OPENAI_MAX_RETRIES + 1):
+        try:
+            return await func(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == DBConfig.OPENAI_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"OpenAI request failed ({e.__class__.__name__}), retry in {delay:.2f}s")
+            await asyncio.sleep(delay)
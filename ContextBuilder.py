@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from functools import lru_cache
+
+import DBConfig
+from Chunker import get_tokenizer
+
+
+PASSAGE_SEPARATOR = '\n\n---\n\n'
+
+
+@lru_cache(maxsize=1)
+def _budget_tokenizer():
+    '''
+    計算 token 預算用的 tokenizer；無法載入 (未安裝 tokenizers 或無法下載) 時回傳 None，改以字數估算
+    '''
+    try:
+        return get_tokenizer()
+    except Exception as e:
+        print(f"[WARNING] 無法載入 tokenizer ({e})，context 預算改以字數估算")
+        return None
+
+
+def count_tokens(text):
+    '''
+    以 embedding 模型的 tokenizer 計算 token 數；無 tokenizer 時以字數估算 (中文約一字一 token，偏保守)
+    '''
+    tokenizer = _budget_tokenizer()
+    if tokenizer is None:
+        return len(text)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def truncate_to_tokens(text, max_tokens):
+    tokenizer = _budget_tokenizer()
+    if tokenizer is None:
+        return text[:max_tokens]
+    offsets = [offset for offset in tokenizer.encode(text, add_special_tokens=False).offsets if offset[1] > offset[0]]
+    if len(offsets) <= max_tokens:
+        return text
+    return text[:offsets[max_tokens - 1][1]] if max_tokens > 0 else ''
+
+
+def unique_hits(hits):
+    '''
+    去掉空白段落，相同 id 只保留一次
+    '''
+    result = []
+    seen = set()
+    for hit in hits:
+        if not hit['text'] or hit['id'] in seen:
+            continue
+        seen.add(hit['id'])
+        result.append(hit)
+    return result
+
+
+def overlap_length(left, right, max_overlap=DBConfig.CONTEXT_MAX_OVERLAP_CHARS,
+                   min_overlap=DBConfig.CONTEXT_MIN_OVERLAP_CHARS):
+    '''
+    left 的結尾與 right 的開頭重疊的最長長度 (至少 min_overlap 字，否則回傳 0)
+    '''
+    for k in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+
+def merge_file_hits(hits, title=''):
+    '''
+    合併同一檔案的命中段落，回傳 {'file_id', 'score', 'title', 'bodies'}
+
+    title 為 window 策略切分時加在每段前面的文字 (Chunker.read_window_title)，以該字串開頭的段落
+    先去掉 title，合併後只保留一次；其他策略的段落沒有 title，傳入空字串即不做任何裁切。
+    milvus 的 auto_id 依寫入順序遞增，同檔案依 id 排序即為原文順序，
+    相鄰段落以 sliding window 的重疊部分接起來，被前一段完整包含的段落直接丟掉
+    '''
+    if not title or not any(hit['text'].startswith(title) for hit in hits):
+        title = ''
+    bodies = []
+    for hit in sorted(hits, key=lambda hit: hit['id']):
+        body = hit['text'][len(title):] if title and hit['text'].startswith(title) else hit['text']
+        if not body or (bodies and body in bodies[-1]):
+            continue
+        k = overlap_length(bodies[-1], body) if bodies else 0
+        if k:
+            bodies[-1] += body[k:]
+        else:
+            bodies.append(body)
+    return {
+        'file_id': hits[0]['file_id'],
+        'score': max(hit['score'] for hit in hits),
+        'title': title,
+        'bodies': bodies,
+    }
+
+
+def build_context(hits, max_tokens=DBConfig.CONTEXT_MAX_TOKENS, titles=None):
+    '''
+    由檢索結果 (VectorStore.search 的 [{'id', 'file_id', 'score', 'text'}]) 組出給 LLM 的 context，
+    取代直接把 SearchResult 的 repr 放進 prompt；titles 為 {file_id: window 策略的 title}
+
+    去除重複與重疊 -> 合併同檔案的相鄰段落 -> 依最高分數排序 -> 截斷到 max_tokens 以內
+
+    回傳 (context 文字, 各命中段落的相似度分數)；沒有任何命中時 context 為空字串
+    '''
+    hits = unique_hits(hits)
+    scores = [hit['score'] for hit in hits]
+
+    by_file = {}
+    for hit in hits:
+        by_file.setdefault(hit['file_id'], []).append(hit)
+    titles = titles or {}
+    files = sorted((merge_file_hits(file_hits, titles.get(file_id, '')) for file_id, file_hits in by_file.items()),
+                   key=lambda item: item['score'], reverse=True)
+
+    passages = []
+    remaining = max_tokens
+    for item in files:
+        text = item['title'] + '\n...\n'.join(item['bodies'])
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            text = truncate_to_tokens(text, remaining)
+            tokens = remaining
+        if text.strip():
+            passages.append(text)
+        remaining -= tokens
+        if remaining <= 0:
+            break
+
+    context = PASSAGE_SEPARATOR.join(passages)
+    print(f"[INFO] context: {len(hits)} 段命中 -> {len(passages)} 個檔案段落，{len(context)} 字")
+    return context, scores
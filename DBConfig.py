@@ -28,4 +28,113 @@ FOLDER_DB_MAP = {
         "板框": "panel",
         "鑽孔": "drill",
         "防焊": "mask"
-    }
\ No newline at end of file
+    }
+
+# 背景寫入佇列 (IngestionQueue) 的執行緒數量
+INGESTION_WORKERS = 2
+# 進行中的工作由執行的行程 (owner) 每 INGESTION_HEARTBEAT_SECONDS 秒更新 updated_at 續約；
+# 超過 INGESTION_LEASE_SECONDS 秒未續約視為該行程已中斷，其他行程才能接手
+INGESTION_HEARTBEAT_SECONDS = 30
+INGESTION_LEASE_SECONDS = 180
+
+# embedding 批次上限: 每批最多 BATCH_SIZE 筆，且總字元數不超過 EMBEDDING_BATCH_MAX_CHARS
+EMBEDDING_BATCH_MAX_CHARS = 60000
+# 同時送往 embedding server 的批次數量上限
+EMBEDDING_MAX_IN_FLIGHT = 4
+
+# embedding 回傳格式: base64 (float32 bytes，直接解碼為 NumPy 陣列) / float (JSON 數字，server 不支援 base64 時使用)
+EMBEDDING_ENCODING_FORMAT = "base64"
+
+# embedding 快取 (SQLite)，以 (模型名稱, 正規化文字 hash) 為 key，超過上限時依最近使用時間淘汰
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = "instance/embedding_cache.db"
+EMBEDDING_CACHE_MAX_ENTRIES = 200000
+
+# 上傳檔案的切分策略: window (100 字滑動窗口) / section (## 段落) / code (函數) / token (bge-m3 token 窗口)
+DEFAULT_CHUNK_STRATEGY = "window"
+SECTION_MAX_CHARS = 2000
+# HF hub 上的 tokenizer 名稱，或本機 tokenizer.json 路徑 (離線環境，避免切分時下載)
+TOKENIZER_NAME = "BAAI/bge-m3"
+TOKEN_WINDOW_SIZE = 256
+TOKEN_WINDOW_OVERLAP = 32
+
+# 串流讀檔切分: 每次讀入的字數，以及 window 策略尋找 title (第一個 ## 之前) 的最大字數
+STREAM_BLOCK_SIZE = 65536
+STREAM_TITLE_MAX_CHARS = 1000
+
+# 共用 OpenAI client (ClientPool) 的連線池、逾時 (秒) 與重試設定
+OPENAI_MAX_CONNECTIONS = 32
+OPENAI_MAX_KEEPALIVE = 16
+OPENAI_KEEPALIVE_EXPIRY = 60
+OPENAI_CONNECT_TIMEOUT = 5
+EMBEDDING_TIMEOUT = 60
+LLM_TIMEOUT = 300
+OPENAI_MAX_RETRIES = 3
+OPENAI_RETRY_BASE_DELAY = 0.5
+OPENAI_RETRY_MAX_DELAY = 8
+
+# /ask 判斷「找不到相關資訊」的方式: two_phase / single / score (見 LLM.ASK_GATE_MODES)
+ASK_GATE_MODE = "single"
+# score 模式: 檢索結果的最高相似度 (IP) 低於此值時不呼叫 LLM
+ASK_SCORE_THRESHOLD = 0.5
+
+# 組合 context 時的 token 上限 (無 tokenizer 時以字數計)
+CONTEXT_MAX_TOKENS = 3000
+# 合併相鄰段落時檢查的重疊字數範圍
+CONTEXT_MIN_OVERLAP_CHARS = 10
+CONTEXT_MAX_OVERLAP_CHARS = 200
+
+# Milvus 連線逾時 (秒) 與連線中斷時的重試次數 / 間隔 (秒)
+MILVUS_CONNECT_TIMEOUT = 10
+MILVUS_RECONNECT_RETRIES = 1
+MILVUS_RECONNECT_DELAY = 1
+
+# 向量資料庫: milvus (遠端 Milvus) / milvus_lite (本機檔案，需安裝 milvus-lite) / numpy (本機 mmap shard)
+VECTOR_STORE_BACKEND = "milvus"
+MILVUS_LITE_PATH = "instance/milvus_lite.db"
+# 每次檢索回傳的段落數
+SEARCH_LIMIT = 5
+# numpy backend 的 shard 目錄與儲存精度 (float32 / float16 / int8，見 VectorCodec)
+SHARD_STORE_PATH = "instance/vector_shards"
+SHARD_DTYPE = "float32"
+# float16 / int8 shard 檢索時每次轉成 float32 計算的列數 (避免整個 shard 一次複製)
+SHARD_SEARCH_BLOCK_ROWS = 4096
+
+# Milvus collection 結構: partition (每個使用者一個 partition) / partition_key (user_id 為 partition key)
+MILVUS_COLLECTION_NAME = "NoteBookLM"
+MILVUS_SCHEMA = "partition"
+# 新建 collection 的向量欄位: float32 (FLOAT_VECTOR) / float16 (FLOAT16_VECTOR) / int8 (INT8_VECTOR，HNSW 索引)
+# 已存在的 collection 依其 schema 讀寫，改設定後需重建或以 MilvusMigration 遷移；Milvus Lite 只支援 float32
+MILVUS_VECTOR_DTYPE = "float32"
+# partition_key 結構的 partition 數量
+MILVUS_NUM_PARTITIONS = 64
+# 線上遷移期間設為新 collection 名稱 (寫入 / 刪除同時套用)，遷移完成後改回 None
+MILVUS_MIGRATION_TARGET = None
+
+# 一般檢索的 consistency level (Bounded / Strong / Eventually)
+MILVUS_SEARCH_CONSISTENCY = "Bounded"
+# 使用者寫入後這麼多秒內的檢索要讀到自己的寫入 (session)
+MILVUS_SESSION_WINDOW = 60
+
+# 檢索結果快取 (每個行程一份): 有效秒數與最多筆數
+RETRIEVAL_CACHE_ENABLED = True
+RETRIEVAL_CACHE_TTL = 300
+RETRIEVAL_CACHE_MAX_ENTRIES = 1000
+
+# 語意回答快取: 問題向量 cosine 相似度達到 ANSWER_CACHE_THRESHOLD 時直接回傳之前的回答
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_TTL = 3600
+ANSWER_CACHE_MAX_ENTRIES = 2000
+
+# 掃描 Milvus 全部資料 (GarbageCollector / MilvusMigration) 時每批讀取的筆數
+MILVUS_SCAN_BATCH_SIZE = 1000
+# 定期比對 SQL / 向量庫 / uploads 回收孤兒資料的間隔秒數 (0 表示不執行)，以及上傳檔案的保留時間
+GC_INTERVAL = 6 * 60 * 60
+GC_GRACE_SECONDS = 60 * 60
+# 跨行程的檔案鎖: 持有 GC_LEADER_LOCK_PATH 的行程才執行定期 reconcile；GC_LOCK_PATH 確保同時只有一個 reconcile
+GC_LEADER_LOCK_PATH = "instance/gc_leader.lock"
+GC_LOCK_PATH = "instance/gc.lock"
+
+# Reconciler 每批讀取的 FileItem / 向量 / 上傳檔案數
+RECONCILE_PAGE_SIZE = 500
@@ -15,4 +15,32 @@ MILVUS_PASSWORD = 'AutoCAM_admin'
 DB_NAME = 'AutoCAM'
 COLLECTION_NAME = "test"
 DIMENSION = 1024
-BATCH_SIZE = 256
\ No newline at end of file
+BATCH_SIZE = 256
+
+# 共用 OpenAI client (ClientPool) 的連線池、逾時 (秒) 與重試設定
+OPENAI_MAX_CONNECTIONS = 32
+OPENAI_MAX_KEEPALIVE = 16
+OPENAI_KEEPALIVE_EXPIRY = 60
+OPENAI_CONNECT_TIMEOUT = 5
+EMBEDDING_TIMEOUT = 60
+LLM_TIMEOUT = 300
+OPENAI_MAX_RETRIES = 3
+OPENAI_RETRY_BASE_DELAY = 0.5
+OPENAI_RETRY_MAX_DELAY = 8
+
+# 平行建立索引: 切分檔案的 process 數、同時送出的 embedding 請求數，與記錄進度的 manifest
+PARSE_WORKERS = 4
+EMBED_WORKERS = 4
+INDEX_MANIFEST_PATH = "index_manifest.jsonl"
+
+# embedding / 寫入 pipeline: 寫入 Milvus 的執行緒數，與各階段之間佇列可暫存的批次數
+# (Milvus Lite 同時寫入時可能遺失資料，使用 Milvus Lite 時 INSERT_WORKERS 設為 1)
+INSERT_WORKERS = 2
+PIPELINE_QUEUE_SIZE = 8
+
+# embedding 回傳格式: base64 (float32 bytes，直接解碼為 NumPy 陣列) / float (JSON 數字，server 不支援 base64 時使用)
+EMBEDDING_ENCODING_FORMAT = "base64"
+
+# 向量欄位的儲存格式: float32 (FLOAT_VECTOR) / float16 (FLOAT16_VECTOR) / int8 (INT8_VECTOR)，見 VectorCodec
+# 與既有 collection 不同時，create_db_collection 會重建 collection
+VECTOR_DTYPE = "float32"
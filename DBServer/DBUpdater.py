@@ -2,13 +2,25 @@
 #%%-----------------------------------------------------------------------------
 import os
 import re
+import sys
+import json
+import argparse
+import time
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from openai import OpenAI
 from pymilvus import MilvusClient
 from pymilvus import DataType
 from tqdm import tqdm
 import DBConfig
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ClientPool import get_embedding_client, call_with_retry, embeddings_to_array
+from IndexPipeline import EmbedInsertPipeline
+from VectorCodec import MILVUS_VECTOR_TYPES, encode_vectors, milvus_vector_dtype, milvus_vector_index
+
 
 LLM_API_KEY = DBConfig.LLM_API_KEY
 LLM_API_BASE = DBConfig.LLM_API_BASE
@@ -28,13 +40,18 @@ MILVUS_PASSWORD = DBConfig.MILVUS_PASSWORD
 
 #%%-----------------------------------------------------------------------------
 def post_embedding_model(text):
-    client = OpenAI(api_key = EMBEDDING_API_KEY, base_url = EMBEDDING_API_BASE)
-    responses = client.embeddings.create(input = text, model = EMBEDDING_MODEL_NAME)
-    return [res_data.embedding for res_data in responses.data]
+    client = get_embedding_client()
+    responses = call_with_retry(client.embeddings.create, input = text, model = EMBEDDING_MODEL_NAME,
+                                encoding_format = DBConfig.EMBEDDING_ENCODING_FORMAT)
+    return embeddings_to_array(responses.data)
 
 
 #%%
-def create_db_collection():
+def create_db_collection(drop_existing=True):
+    '''
+    drop_existing=False 時保留已存在的 collection (增量更新)；
+    但 collection 沒有 file_path 欄位 (無法逐檔刪除)，或向量欄位不是 DBConfig.VECTOR_DTYPE 時仍會重建
+    '''
     DB_NAME = DBConfig.DB_NAME
     COLLECTION_NAME = DBConfig.COLLECTION_NAME
     DIMENSION = DBConfig.DIMENSION
@@ -43,6 +60,14 @@ def create_db_collection():
     milvus_client = MilvusClient(uri = MILVUS_BASE, db_name = DB_NAME, user = MILVUS_USER, password = MILVUS_PASSWORD)
 
     if milvus_client.has_collection(COLLECTION_NAME):
+        if not drop_existing:
+            fields = {field['name']: field for field in milvus_client.describe_collection(COLLECTION_NAME)['fields']}
+            if 'file_path' not in fields:
+                print(f"[WARNING] {COLLECTION_NAME} 沒有 file_path 欄位，無法增量更新，重建 collection")
+            elif milvus_vector_dtype(fields['embedding']['type']) != DBConfig.VECTOR_DTYPE:
+                print(f"[WARNING] {COLLECTION_NAME} 的向量欄位不是 {DBConfig.VECTOR_DTYPE}，重建 collection")
+            else:
+                return
         milvus_client.drop_collection(COLLECTION_NAME)
 
     schema = MilvusClient.create_schema(
@@ -51,10 +76,10 @@ def create_db_collection():
     )
 
     schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
-    schema.add_field(field_name="embedding", datatype=DataType.FLOAT_VECTOR, dim=DIMENSION)
+    schema.add_field(field_name="embedding", datatype=MILVUS_VECTOR_TYPES[DBConfig.VECTOR_DTYPE], dim=DIMENSION)
     schema.add_field(field_name="text", datatype=DataType.VARCHAR, max_length=64000)
     # schema.add_field(field_name="type", datatype=DataType.VARCHAR, max_length=64000)
-    # schema.add_field(field_name="file_path", datatype=DataType.VARCHAR, max_length=64000)
+    schema.add_field(field_name="file_path", datatype=DataType.VARCHAR, max_length=4096)
     # schema.add_field(field_name="act", datatype=DataType.VARCHAR, max_length=3200)
     # schema.add_field(field_name="class", datatype=DataType.VARCHAR, max_length=3200)
 
@@ -67,8 +92,9 @@ def create_db_collection():
 
     index_params = milvus_client.prepare_index_params()
 
+    index_type, params = milvus_vector_index(DBConfig.VECTOR_DTYPE)
     index_params.add_index(
-        field_name="embedding", metric_type="IP", index_type="AUTOINDEX", params={}
+        field_name="embedding", metric_type="IP", index_type=index_type, params=params
     )
 
     # index_params.add_index(
@@ -84,40 +110,207 @@ def create_db_collection():
 
     milvus_client.create_index(collection_name=COLLECTION_NAME, index_params=index_params)
     milvus_client.load_collection(collection_name=COLLECTION_NAME, replica_number=1)
+
+    # collection 重建後之前的進度全部失效
+    if os.path.exists(DBConfig.INDEX_MANIFEST_PATH):
+        os.remove(DBConfig.INDEX_MANIFEST_PATH)
 #%%
-def batch_insert_embeddings(text_list):
-    
+def batch_insert_embeddings(text_list, file_path=''):
+    '''
+    將 text_list 以 EmbedInsertPipeline 同時 embedding 與寫入 (共用一個 MilvusClient)
+    '''
     DB_NAME = DBConfig.DB_NAME
     COLLECTION_NAME = DBConfig.COLLECTION_NAME
-    DIMENSION = DBConfig.DIMENSION
-    BATCH_SIZE = DBConfig.BATCH_SIZE
     milvus_client = MilvusClient(uri = MILVUS_BASE, db_name = DB_NAME, user = MILVUS_USER, password = MILVUS_PASSWORD)
-    
-    batch = []
 
-    # Embed and insert in batches
-    for i in tqdm(range(0, len(text_list))):
-        batch.append(
-            {
-                "text": text_list[i],
+    def insert(batch, embeddings):
+        milvus_client.insert(collection_name=COLLECTION_NAME, data=[
+            {'text': text, 'file_path': path, 'embedding': embedding}
+            for (path, text), embedding in zip(batch, encode_vectors(embeddings, DBConfig.VECTOR_DTYPE))
+        ])
+
+    return EmbedInsertPipeline(post_embedding_model, insert).run((file_path, text) for text in tqdm(text_list))
+#%%
+def escape_filter_string(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def load_manifest(path=None):
+    '''
+    讀取建立索引的進度 (JSON lines，同一個檔案以最後一筆為準):
+        {"path", "mtime", "sha256", "chunks"}  該檔案已全部寫入
+        {"path", "started": true}              開始寫入但尚未完成 (重新執行時先刪除已寫入的部分)
+        {"path", "deleted": true}              檔案已刪除，向量也已刪除
+    '''
+    path = path or DBConfig.INDEX_MANIFEST_PATH
+    manifest = {}
+    if not os.path.exists(path):
+        return manifest
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 寫到一半中斷的最後一行
+                continue
+            if record.get('deleted'):
+                manifest.pop(record['path'], None)
+            else:
+                manifest[record['path']] = record
+    return manifest
+
+
+def compact_manifest(path=None):
+    '''
+    每個檔案只保留最後一筆記錄 (先寫入暫存檔再取代，中斷時不影響原本的 manifest)
+    '''
+    path = path or DBConfig.INDEX_MANIFEST_PATH
+    manifest = load_manifest(path)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        for record in manifest.values():
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(path + '.tmp', path)
+
+
+class ManifestWriter:
+    '''
+    manifest 的 append-only 寫入；切分執行緒與 insert worker 會同時呼叫 write，以 lock 保證每筆紀錄完整寫入一行
+    '''
 
-            }
-        )
+    def __init__(self, path=None):
+        self.file = open(path or DBConfig.INDEX_MANIFEST_PATH, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
 
-        if len(batch) % BATCH_SIZE == 0 or i == len(text_list) - 1:
-            embeddings = post_embedding_model([item["text"] for item in batch])
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self.file.write(line)
+            self.file.flush()
 
-            for item, emb in zip(batch, embeddings):
-                item["embedding"] = emb
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_file(file_path, raw_name, parser):
+    '''
+    在 process pool 中執行: 讀取並切分檔案，回傳 (file_path, mtime, sha256, text_list)
+    '''
+    mtime = os.path.getmtime(file_path)
+    text_list = PARSERS[parser](file_path, [], raw_name)
+    return file_path, mtime, file_sha256(file_path), text_list
+
+
+def index_files(tasks, milvus_client=None, manifest_path=None, scope=None):
+    '''
+    平行建立索引，tasks 為 [(file_path, raw_name, parser)]，parser 為 PARSERS 的 key
+
+    1. 與 manifest 比對，mtime 未變的檔案直接略過；
+       scope (資料夾) 底下曾建立索引、但不在 tasks 中的檔案視為已刪除，刪除其向量
+    2. 其餘檔案在 process pool (DBConfig.PARSE_WORKERS) 中切分並計算 sha256，內容未變的檔案略過
+    3. 切分結果 (可跨檔案) 每 BATCH_SIZE 段一批，經 EmbedInsertPipeline 同時 embedding 與寫入
+       (各階段的 worker 數見 DBConfig.EMBED_WORKERS / INSERT_WORKERS)
+    4. 檔案的段落全部寫入後才記錄到 manifest，中斷後重新執行會從未完成的檔案繼續
+    新增 / 內容變更的檔案先以 file_path 刪除舊的向量再寫入，不需要重建 collection
+    '''
+    COLLECTION_NAME = DBConfig.COLLECTION_NAME
+    if milvus_client is None:
+        milvus_client = MilvusClient(uri = MILVUS_BASE, db_name = DBConfig.DB_NAME, user = MILVUS_USER, password = MILVUS_PASSWORD)
+
+    manifest = load_manifest(manifest_path)
+    pending = []
+    for file_path, raw_name, parser in tasks:
+        record = manifest.get(file_path)
+        if record is not None and record.get('mtime') == os.path.getmtime(file_path):
+            continue
+        pending.append((file_path, raw_name, parser))
+
+    writer = ManifestWriter(manifest_path)
+    deleted = []
+    if scope is not None:
+        prefix = os.path.join(scope, '')
+        task_paths = {file_path for file_path, _, _ in tasks}
+        deleted = [path for path in manifest if path.startswith(prefix) and path not in task_paths]
+    for file_path in deleted:
+        milvus_client.delete(collection_name=COLLECTION_NAME, filter=f'file_path == "{escape_filter_string(file_path)}"')
+        writer.write({'path': file_path, 'deleted': True})
+    stats = {'added': 0, 'modified': 0, 'unchanged': len(tasks) - len(pending), 'deleted': len(deleted)}
+
+    remaining = {}          # file_path -> 尚未寫入的段落數
+    done_records = {}       # file_path -> 全部寫入後要記錄的 manifest
+    lock = threading.Lock()
+
+    def iter_chunks(parse_pool):
+        futures = [parse_pool.submit(parse_file, *task) for task in pending]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="建立索引"):
+            try:
+                file_path, mtime, digest, text_list = future.result()
+            except Exception as e:
+                print(f"[WARNING] 無法讀取檔案: {e}")
+                continue
+
+            record = manifest.get(file_path)
+            done = {'path': file_path, 'mtime': mtime, 'sha256': digest, 'chunks': len(text_list)}
+            if record is not None and record.get('sha256') == digest:
+                # 只有 mtime 改變
+                writer.write(done)
+                stats['unchanged'] += 1
+                continue
+            stats['modified' if record is not None and 'sha256' in record else 'added'] += 1
+            if record is not None:
+                # 內容已變更，或上次寫入到一半: 先刪除該檔案已寫入的段落
+                milvus_client.delete(collection_name=COLLECTION_NAME,
+                                     filter=f'file_path == "{escape_filter_string(file_path)}"')
+            if not text_list:
+                writer.write(done)
+                continue
+
+            writer.write({'path': file_path, 'started': True})
+            with lock:
+                remaining[file_path] = len(text_list)
+                done_records[file_path] = done
+            for text in text_list:
+                yield file_path, text
+
+    def insert(batch, embeddings):
+        milvus_client.insert(collection_name=COLLECTION_NAME, data=[
+            {'text': text, 'file_path': file_path, 'embedding': embedding}
+            for (file_path, text), embedding in zip(batch, encode_vectors(embeddings, DBConfig.VECTOR_DTYPE))
+        ])
+        with lock:
+            for file_path, _ in batch:
+                remaining[file_path] -= 1
+                if remaining[file_path] == 0:
+                    writer.write(done_records.pop(file_path))
+                    del remaining[file_path]
+
+    start = time.perf_counter()
+    try:
+        # spawn: 不 fork 已建立 gRPC 連線的行程 (Windows 本來就是 spawn)
+        with ProcessPoolExecutor(max_workers=DBConfig.PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn')) as parse_pool:
+            pipeline_stats = EmbedInsertPipeline(post_embedding_model, insert).run(iter_chunks(parse_pool))
+    finally:
+        writer.close()
+    compact_manifest(manifest_path)
+
+    print(f"[INFO] 新增 {stats['added']}、變更 {stats['modified']}、刪除 {stats['deleted']}、未變更 {stats['unchanged']} 個檔案；"
+          f"寫入 {pipeline_stats['insert'].items} 段，耗時 {time.perf_counter() - start:.1f}s")
+    return stats
 
-            milvus_client.insert(collection_name=COLLECTION_NAME, data=batch)
-            batch = []
 #%%
 def update_documentation(folder_path):
     # txt_path = './sorting_data/first_data'
     # table_path = './sorting_data/tabel_data'
     # folder_path = r'I:\2025\Anti系列\說明文件'
-    text_list = []
+    tasks = []
   
     # for folder_path in folder_list:
     for root, dirs, files in os.walk(folder_path):
@@ -128,24 +321,24 @@ def update_documentation(folder_path):
             if filename.endswith('.md'):
                 # raw_name = filename[:-4].split(' ')[-1]
                 raw_name = file_topic + '---' + filename.split('.')[0]
-                text_list = read_file_md_foramt(file_path, text_list, raw_name)
+                tasks.append((file_path, raw_name, 'md'))
             # text_list = read_file_line(file_path, text_list, raw_name)
 
-    batch_insert_embeddings(text_list)
+    return index_files(tasks, scope=folder_path)
 
 #%%
 def update_code_info(directory_path):
     file_path_list = get_folder_files(directory_path)
     
-    text_list = []
+    tasks = []
     # for folder_path in folder_list:
     for file_path in file_path_list:
         # raw_name = filename[:-4].split(' ')[-1]
         raw_name = file_path.split('\\')[4]
-        text_list = read_code_foramt(file_path, text_list, raw_name)
+        tasks.append((file_path, raw_name, 'code'))
         # text_list = read_file_line(file_path, text_list, raw_name)
 
-    batch_insert_embeddings(text_list)
+    return index_files(tasks, scope=directory_path)
 
 def get_folder_files(directory_path):
     # 遍歷目錄及其子目錄
@@ -212,6 +405,12 @@ def read_file_md_foramt(file_path, text_list, raw_name):
             text_list.append(current_section)
     return text_list
 
+# parse_file 使用的切分方式
+PARSERS = {
+    'md': read_file_md_foramt,
+    'code': read_code_foramt,
+}
+
 def read_file_line(file_path, text_list, raw_name):
     with open(file_path, 'r', encoding='utf-8') as file:
                     # content = file.read()
@@ -336,13 +535,21 @@ def upload_file_in_milvus(current_user_id, topic_id, file_id, file_path):
 
 #%%
 
-def main():
-   
-    
-    create_db_collection()
+def main(rebuild=False):
+    '''
+    預設為增量更新: 保留 collection，只重新寫入新增 / 變更的檔案並刪除已移除檔案的向量
+    (中斷後再執行一次即從中斷處繼續)；rebuild=True 時刪除並重建 collection 後重新建立全部索引
+    '''
+    create_db_collection(drop_existing=rebuild)
     folder_path = r'I:\2025\AutoCAMBot\文檔'
     rename_file(folder_path)
     update_documentation(folder_path)
     
     directory_path = r'I:\2025\AutoCAMBot\程式'
-    update_code_info(directory_path)
\ No newline at end of file
+    update_code_info(directory_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rebuild', action='store_true', help='刪除並重建 collection 後重新建立全部索引')
+    main(rebuild=parser.parse_args().rebuild)
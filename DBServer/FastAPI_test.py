@@ -5,9 +5,11 @@
 # sys.path.append(os.path.dirname(__file__))
 # print(os.path.dirname(__file__))
 
+import os
+import sys
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from openai import AsyncOpenAI, OpenAI
 from pymilvus import MilvusClient
 
 import asyncio
@@ -24,6 +26,10 @@ try:
 except:
     from DBServer import DBConfig
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ClientPool import (get_embedding_client, get_llm_client, get_async_embedding_client,
+                        call_with_retry, acall_with_retry)
+
 app = FastAPI()
 
 # 配置常數
@@ -47,10 +53,6 @@ BATCH_SIZE = DBConfig.BATCH_SIZE
 # 建立執行緒池來處理同步函數
 executor = ThreadPoolExecutor()
 
-# 建立 async client
-openai_client = AsyncOpenAI(api_key=LLM_API_KEY, base_url=LLM_API_BASE)
-embedding_client = AsyncOpenAI(api_key=EMBEDDING_API_KEY, base_url=EMBEDDING_API_BASE)
-
 # 儲存進行中的任務
 active_tasks = {}
 
@@ -96,13 +98,14 @@ async def get_result(task_id: str):
 
 # 包裝同步的 post_embedding_model 為 async
 def post_embedding_model_sync(text):
-    client = OpenAI(api_key=EMBEDDING_API_KEY, base_url=EMBEDDING_API_BASE)
-    responses = client.embeddings.create(input=text, model=EMBEDDING_MODEL_NAME)
+    client = get_embedding_client()
+    responses = call_with_retry(client.embeddings.create, input=text, model=EMBEDDING_MODEL_NAME)
     return [res_data.embedding for res_data in responses.data]
 
 async def post_embedding_model_async(text):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(executor, post_embedding_model_sync, text)
+    client = get_async_embedding_client()
+    responses = await acall_with_retry(client.embeddings.create, input=text, model=EMBEDDING_MODEL_NAME)
+    return [res_data.embedding for res_data in responses.data]
 
 # 包裝同步的 user_chat 為 async
 def user_chat_sync(input_str, milvus_client, collection_name):
@@ -152,8 +155,9 @@ def user_chat_sync(input_str, milvus_client, collection_name):
     - 若無相關資訊，請回覆「找不到相關資訊」。
     - 請使用條列式或分段方式，讓回答清晰易讀。
     """
-    openai_client = OpenAI(api_key=LLM_API_KEY, base_url=LLM_API_BASE)
-    response = openai_client.chat.completions.create(
+    openai_client = get_llm_client()
+    response = call_with_retry(
+        openai_client.chat.completions.create,
         model=LLM_MODEL_NAME,
         temperature=0.3,
         messages=[
@@ -207,8 +211,9 @@ asyncio.run(run_server())
 
 def ask_LLM(USER_PROMPT):
     SYSTEM_PROMPT = """你是一位全能助理"""
-    openai_client = OpenAI(api_key=LLM_API_KEY, base_url=LLM_API_BASE)
-    response = openai_client.chat.completions.create(
+    openai_client = get_llm_client()
+    response = call_with_retry(
+        openai_client.chat.completions.create,
         model=LLM_MODEL_NAME,
         temperature=1.5,
         messages=[
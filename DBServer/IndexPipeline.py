@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import time
+import queue
+import threading
+
+import DBConfig
+
+
+# 佇列結束標記
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name, workers, unit):
+        self.name = name
+        self.workers = workers
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.busy += seconds
+
+    def summary(self, elapsed):
+        '''
+        throughput 以整體經過時間計算；使用率 = 忙碌時間 / (經過時間 x worker 數)，接近 100% 的階段即為瓶頸
+        '''
+        rate = self.items / elapsed if elapsed > 0 else 0.0
+        utilization = self.busy / (elapsed * self.workers) if elapsed > 0 else 0.0
+        return f"{self.name:6s}: {self.items} {self.unit}，{rate:.1f} {self.unit}/s，{self.workers} workers，使用率 {utilization:.0%}"
+
+
+class EmbedInsertPipeline:
+    '''
+    chunk -> embed -> insert 的 producer / consumer pipeline，各階段之間以有界佇列 (queue_size 個批次) 連接
+
+        chunk : 呼叫 run() 的執行緒，從 items 取出 (key, text) 並湊成 batch_size 段的批次
+        embed : embed_workers 個執行緒，embed([text, ...]) 回傳向量
+        insert: insert_workers 個執行緒，insert(batch, embeddings)，batch 為 [(key, text)]
+
+    下游較慢時上游會在佇列上等待 (backpressure)，記憶體中最多只有約 2 x queue_size 個批次。
+    任一階段發生錯誤時停止送出新的批次，清空佇列後在 run() 中重新拋出。
+    '''
+
+    def __init__(self, embed, insert, batch_size=DBConfig.BATCH_SIZE, embed_workers=DBConfig.EMBED_WORKERS,
+                 insert_workers=DBConfig.INSERT_WORKERS, queue_size=DBConfig.PIPELINE_QUEUE_SIZE):
+        self.embed = embed
+        self.insert = insert
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.insert_workers = insert_workers
+        self.queue_size = queue_size
+
+    def run(self, items):
+        '''
+        回傳 {階段名稱: StageStats}，並印出各階段的 throughput
+        '''
+        embed_queue = queue.Queue(self.queue_size)
+        insert_queue = queue.Queue(self.queue_size)
+        stop = threading.Event()
+        errors = []
+        stats = {
+            'chunk': StageStats('chunk', 1, 'chunks'),
+            'embed': StageStats('embed', self.embed_workers, 'vectors'),
+            'insert': StageStats('insert', self.insert_workers, 'rows'),
+        }
+
+        def fail(error):
+            errors.append(error)
+            stop.set()
+
+        def embed_worker():
+            while True:
+                batch = embed_queue.get()
+                if batch is _DONE:
+                    return
+                if stop.is_set():
+                    continue
+                start = time.perf_counter()
+                try:
+                    embeddings = self.embed([text for _, text in batch])
+                except Exception as e:
+                    fail(e)
+                    continue
+                stats['embed'].add(len(batch), time.perf_counter() - start)
+                insert_queue.put((batch, embeddings))
+
+        def insert_worker():
+            while True:
+                item = insert_queue.get()
+                if item is _DONE:
+                    return
+                if stop.is_set():
+                    continue
+                batch, embeddings = item
+                start = time.perf_counter()
+                try:
+                    self.insert(batch, embeddings)
+                except Exception as e:
+                    fail(e)
+                    continue
+                stats['insert'].add(len(batch), time.perf_counter() - start)
+
+        embed_threads = [threading.Thread(target=embed_worker, name=f'embed-{i}', daemon=True)
+                         for i in range(self.embed_workers)]
+        insert_threads = [threading.Thread(target=insert_worker, name=f'insert-{i}', daemon=True)
+                          for i in range(self.insert_workers)]
+        for thread in embed_threads + insert_threads:
+            thread.start()
+
+        start = time.perf_counter()
+        try:
+            batch = []
+            iterator = iter(items)
+            while not stop.is_set():
+                chunk_start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                batch.append(item)
+                stats['chunk'].add(1, time.perf_counter() - chunk_start)
+                if len(batch) >= self.batch_size:
+                    embed_queue.put(batch)
+                    batch = []
+            if batch and not stop.is_set():
+                embed_queue.put(batch)
+        except BaseException as e:
+            # 包含 KeyboardInterrupt: 停止並丟棄佇列中的批次
+            fail(e)
+        finally:
+            # 依序關閉各階段: 上游的批次全部處理 (或在錯誤時丟棄) 後才送出下游的結束標記
+            for _ in embed_threads:
+                embed_queue.put(_DONE)
+            for thread in embed_threads:
+                thread.join()
+            for _ in insert_threads:
+                insert_queue.put(_DONE)
+            for thread in insert_threads:
+                thread.join()
+
+        elapsed = time.perf_counter() - start
+        for stage in stats.values():
+            print(f"[INFO] {stage.summary(elapsed)}")
+        if errors:
+            raise errors[0]
+        return stats
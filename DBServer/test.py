@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 #%%-----------------------------------------------------------------------------
 import os
+import sys
 
-from openai import OpenAI
 from pymilvus import MilvusClient
 from pymilvus import DataType
 from tqdm import tqdm
 import DBConfig
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ClientPool import get_embedding_client, get_llm_client, call_with_retry
+
 
 LLM_API_KEY = DBConfig.LLM_API_KEY
 LLM_API_BASE = DBConfig.LLM_API_BASE
@@ -33,8 +36,8 @@ BATCH_SIZE = DBConfig.BATCH_SIZE
 
 #%%-----------------------------------------------------------------------------
 def post_embedding_model(text):
-    client = OpenAI(api_key = EMBEDDING_API_KEY, base_url = EMBEDDING_API_BASE)
-    responses = client.embeddings.create(input = text, model = EMBEDDING_MODEL_NAME)
+    client = get_embedding_client()
+    responses = call_with_retry(client.embeddings.create, input = text, model = EMBEDDING_MODEL_NAME)
     return [res_data.embedding for res_data in responses.data]
 
     # %%
@@ -81,8 +84,9 @@ def user_chat(input_str, milvus_client, COLLECTION_NAME):
     {question_zh}
     </question>
     """
-    openai_client = OpenAI(api_key = LLM_API_KEY, base_url = LLM_API_BASE)
-    response = openai_client.chat.completions.create(
+    openai_client = get_llm_client()
+    response = call_with_retry(
+        openai_client.chat.completions.create,
         model = LLM_MODEL_NAME,
         temperature = 0.3,
         messages=[
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+
+from DBUpdater import ManifestWriter
+
+
+def test_manifest_writer_concurrent_writes(tmp_path):
+    # 切分執行緒與多個 insert worker 同時寫入，每行都是完整的一筆紀錄
+    path = tmp_path / 'manifest.jsonl'
+    writer = ManifestWriter(str(path))
+
+    def write_records(worker):
+        for i in range(500):
+            writer.write({'path': f'{worker}/{i}' + 'x' * 200, 'chunks': i})
+
+    threads = [threading.Thread(target=write_records, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    records = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert len(records) == 8 * 500
+    assert len({record['path'] for record in records}) == 8 * 500
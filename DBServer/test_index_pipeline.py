@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+import pytest
+
+from IndexPipeline import EmbedInsertPipeline
+
+
+def make_items(count):
+    return [(i, f'text {i}') for i in range(count)]
+
+
+def fake_embed(texts):
+    return [[float(text.split()[1])] for text in texts]
+
+
+def test_all_batches_inserted():
+    inserted = []
+    lock = threading.Lock()
+
+    def insert(batch, embeddings):
+        assert [key for key, _ in batch] == [int(vector[0]) for vector in embeddings]
+        with lock:
+            inserted.extend(key for key, _ in batch)
+
+    pipeline = EmbedInsertPipeline(fake_embed, insert, batch_size=7, embed_workers=3, insert_workers=2, queue_size=2)
+    stats = pipeline.run(make_items(100))
+    assert sorted(inserted) == list(range(100))
+    assert stats['chunk'].items == stats['embed'].items == stats['insert'].items == 100
+
+
+def test_backpressure_bounds_batches_in_memory():
+    produced = 0
+    inserted = 0
+    in_flight = []
+    lock = threading.Lock()
+
+    def items():
+        nonlocal produced
+        for item in make_items(200):
+            with lock:
+                produced += 1
+                in_flight.append(produced - inserted)
+            yield item
+
+    def insert(batch, embeddings):
+        nonlocal inserted
+        time.sleep(0.005)
+        with lock:
+            inserted += len(batch)
+
+    batch_size, queue_size = 5, 2
+    EmbedInsertPipeline(fake_embed, insert, batch_size=batch_size, embed_workers=1, insert_workers=1,
+                        queue_size=queue_size).run(items())
+    # 兩個佇列各 queue_size 批，加上每個 worker 手上與 chunk 正在湊的一批
+    assert max(in_flight) <= (2 * queue_size + 3) * batch_size
+    assert inserted == 200
+
+
+@pytest.mark.parametrize('stage', ['embed', 'insert'])
+def test_error_stops_pipeline_and_is_raised(stage):
+    consumed = []
+
+    def items():
+        for item in make_items(10000):
+            consumed.append(item)
+            yield item
+
+    def embed(texts):
+        if stage == 'embed' and texts[0] == 'text 20':
+            raise RuntimeError('embed failed')
+        return fake_embed(texts)
+
+    def insert(batch, embeddings):
+        if stage == 'insert' and batch[0][0] == 20:
+            raise RuntimeError('insert failed')
+
+    pipeline = EmbedInsertPipeline(embed, insert, batch_size=10, embed_workers=2, insert_workers=1, queue_size=2)
+    with pytest.raises(RuntimeError, match=f'{stage} failed'):
+        pipeline.run(items())
+    assert len(consumed) < 10000
+
+
+def test_interrupt_in_producer_is_raised():
+    def items():
+        yield from make_items(15)
+        raise KeyboardInterrupt
+
+    pipeline = EmbedInsertPipeline(fake_embed, lambda batch, embeddings: None, batch_size=4,
+                                   embed_workers=1, insert_workers=1, queue_size=1)
+    with pytest.raises(KeyboardInterrupt):
+        pipeline.run(items())
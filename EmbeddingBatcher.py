@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import DBConfig
+
+
+def iter_batches(texts, max_count=DBConfig.BATCH_SIZE, max_chars=DBConfig.EMBEDDING_BATCH_MAX_CHARS):
+    '''
+    依筆數與總字元數切分批次，texts 可以是 list 或 generator
+
+    單筆超過 max_chars 的文字會自成一批，由 embedding server 自行截斷
+    '''
+    batch = []
+    batch_chars = 0
+    for text in texts:
+        if batch and (len(batch) >= max_count or batch_chars + len(text) > max_chars):
+            yield batch
+            batch = []
+            batch_chars = 0
+        batch.append(text)
+        batch_chars += len(text)
+
+    if batch:
+        yield batch
+
+
+def embed_in_batches(texts, embed_fn, max_count=DBConfig.BATCH_SIZE,
+                     max_chars=DBConfig.EMBEDDING_BATCH_MAX_CHARS,
+                     max_in_flight=DBConfig.EMBEDDING_MAX_IN_FLIGHT):
+    '''
+    將 texts 切成批次並行呼叫 embed_fn(batch) -> (len(batch), dim) 的 float32 陣列
+
+    依輸入順序逐批 yield (batch, vectors)；同時最多 max_in_flight 個請求，
+    未被取走的結果不會無限累積，記憶體用量與批次大小成正比
+    '''
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='embedding') as executor:
+        for batch in iter_batches(texts, max_count, max_chars):
+            if len(pending) >= max_in_flight:
+                done_batch, future = pending.popleft()
+                yield done_batch, future.result()
+            pending.append((batch, executor.submit(embed_fn, batch)))
+
+        while pending:
+            done_batch, future = pending.popleft()
+            yield done_batch, future.result()
+
+
+def embed_all(texts, embed_fn, **kwargs):
+    '''
+    embed_in_batches 的便利版本，依序回傳所有向量 ((len(texts), dim) 的 float32 陣列)
+    收到第一批時配置整個陣列，之後每批直接複製到對應位置
+    '''
+    texts = list(texts)
+    embeddings = np.empty((len(texts), DBConfig.DIMENSION), dtype=np.float32)
+    start = 0
+    for batch, vectors in embed_in_batches(texts, embed_fn, **kwargs):
+        if start == 0 and vectors.shape[1] != embeddings.shape[1]:
+            embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        embeddings[start:start + len(batch)] = vectors
+        start += len(batch)
+    return embeddings
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+
+import numpy as np
+
+import DBConfig
+
+
+def normalize_text(text):
+    '''
+    NFKC 正規化並合併連續空白，讓只差在全形/半形或空白的文字共用同一筆快取
+    '''
+    text = unicodedata.normalize('NFKC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def cache_key(model_name, text):
+    digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return f"{model_name}:{digest}"
+
+
+class EmbeddingCache:
+    '''
+    以 SQLite 儲存 embedding 向量 (float32 bytes)，超過 max_entries 時刪除最久未使用的資料
+
+    每個執行緒 (及 fork 後的行程) 使用各自的連線
+    '''
+
+    # 每新增這麼多筆才檢查一次總數，避免每次寫入都 COUNT(*)
+    EVICT_CHECK_INTERVAL = 1000
+
+    def __init__(self, path=DBConfig.EMBEDDING_CACHE_PATH, max_entries=DBConfig.EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts_since_check = 0
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        conn.commit()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, model_name, texts):
+        '''
+        回傳與 texts 等長的 list (每筆為唯讀的 float32 陣列)，未命中的位置為 None
+        '''
+        keys = [cache_key(model_name, text) for text in texts]
+        found = {}
+        conn = self._connect()
+        unique_keys = list(set(keys))
+        # SQLite 預設參數上限 999
+        for i in range(0, len(unique_keys), 900):
+            chunk = unique_keys[i:i + 900]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk)
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        if found:
+            now = time.time()
+            conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                             [(now, key) for key in found])
+            conn.commit()
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model_name, texts, vectors):
+        now = time.time()
+        rows = [(cache_key(model_name, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for text, vector in zip(texts, vectors)]
+        conn = self._connect()
+        conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows)
+        conn.commit()
+
+        with self._lock:
+            self._puts_since_check += len(rows)
+            if self._puts_since_check < self.EVICT_CHECK_INTERVAL:
+                return
+            self._puts_since_check = 0
+        self.evict()
+
+    def evict(self):
+        '''
+        超過 max_entries 時，刪除最久未使用的資料直到剩下 90%
+        '''
+        conn = self._connect()
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return 0
+
+        remove = count - int(self.max_entries * 0.9)
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN"
+            " (SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)", (remove,))
+        conn.commit()
+        return remove
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    '''
+    取得共用的 EmbeddingCache，DBConfig.EMBEDDING_CACHE_ENABLED 為 False 時回傳 None
+    '''
+    global _cache
+    if not DBConfig.EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
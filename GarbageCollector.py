@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+import DBConfig
+from VectorStore import get_vector_store
+from Reconciler import Reconciler, ORPHAN_KINDS, remove_file
+
+
+class FileLock:
+    '''
+    跨行程的獨占檔案鎖 (fcntl.flock；Windows 使用 msvcrt.locking)，行程結束時由作業系統自動釋放
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=True):
+        '''
+        取得鎖；blocking=False 時若已被其他行程持有立即回傳 False
+        '''
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        file = open(self.path, 'a+')
+        try:
+            while True:
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                    else:
+                        file.seek(0)
+                        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        file.close()
+                        return False
+                    time.sleep(1)
+        except BaseException:
+            file.close()
+            raise
+        self._file = file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+class GarbageCollector:
+    '''
+    刪除主題後的背景清理，以及定期比對 SQL、向量庫與 uploads/ 回收孤兒資料
+
+    purge_topic(): delete_topic 刪除 SQL 資料後呼叫，在背景執行緒以 topic_id 條件一次刪除該主題的向量，並移除上傳檔案
+    reconcile():  start() 之後每 interval 秒以 Reconciler 比對一次並修正 SQL、向量庫與 uploads/ 之間的孤兒資料
+    清理途中程式結束而留下的資料，會在下一次 reconcile 回收
+
+    多個 worker 行程各自 start() 時，只有取得 leader_lock_path 的行程執行定期 reconcile，
+    其餘行程的執行緒等待該鎖，leader 結束後由其中一個接手；reconcile() 本身再以 lock_path 互斥 (含 flask reconcile 指令)
+    '''
+
+    def __init__(self, app, db, file_model, topic_model, job_model, upload_folder, enqueue=None,
+                 interval=DBConfig.GC_INTERVAL, lock_path=DBConfig.GC_LOCK_PATH,
+                 leader_lock_path=DBConfig.GC_LEADER_LOCK_PATH):
+        self.reconciler = Reconciler(app, db, file_model, topic_model, job_model, upload_folder, enqueue=enqueue)
+        self.interval = interval
+        self.lock_path = lock_path
+        self.leader_lock_path = leader_lock_path
+        self.last_report = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._reconcile_lock = threading.Lock()
+
+    def _get_executor(self):
+        # 與 IngestionQueue 相同，fork 後的子行程重新建立執行緒
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gc')
+                self._pid = os.getpid()
+            return self._executor
+
+    def purge_topic(self, user_id, topic_id, file_paths):
+        '''
+        排入背景: 刪除 (user_id, topic_id) 的所有向量與 file_paths 中的上傳檔案
+        '''
+        return self._get_executor().submit(self._purge_topic, user_id, topic_id, list(file_paths))
+
+    def _purge_topic(self, user_id, topic_id, file_paths):
+        start = time.perf_counter()
+        try:
+            get_vector_store().delete_topic(user_id, topic_id)
+        except Exception as e:
+            # 留給下一次 reconcile 回收
+            logging.error(f"Purge topic {topic_id} vectors error: {e}")
+        reclaimed = sum(remove_file(path) for path in file_paths)
+        print(f"[INFO] 已清除 user_id={user_id}, topic_id={topic_id}: {len(file_paths)} 個檔案 "
+              f"({reclaimed / 1024 / 1024:.1f} MB)，耗時 {time.perf_counter() - start:.2f}s")
+
+    def start(self):
+        '''
+        啟動定期 reconcile 的背景執行緒 (interval <= 0 時不啟動)；執行緒先等待成為 leader 才開始計時
+        '''
+        if self.interval <= 0:
+            return
+
+        def loop():
+            # 鎖在執行緒存活期間持有 (leader 需保留 FileLock 物件的參考)
+            leader = FileLock(self.leader_lock_path)
+            leader.acquire()
+            logging.info(f"GC leader: pid {os.getpid()}")
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    logging.error(f"Reconcile error: {e}")
+
+        threading.Thread(target=loop, name='gc-reconcile', daemon=True).start()
+
+    def reconcile(self, fix=True, compact=True, blocking=False):
+        '''
+        比對一次並修正孤兒資料 (見 Reconciler)，回傳統計；
+        其他行程正在 reconcile 時，blocking=False 直接略過並回傳 None，blocking=True 則等待其完成
+        '''
+        with self._reconcile_lock:
+            lock = FileLock(self.lock_path)
+            if not lock.acquire(blocking=blocking):
+                print("[INFO] reconcile: 其他行程執行中，略過")
+                return None
+            try:
+                report = self.reconciler.run(fix=fix, compact=compact)
+            finally:
+                lock.release()
+            self.last_report = report
+            print(f"[INFO] reconcile: {', '.join(f'{kind} {report[kind]}' for kind in ORPHAN_KINDS)}，"
+                  f"向量 {report['vector_chunks']} 段、上傳檔案 {report['upload_bytes'] / 1024 / 1024:.1f} MB，"
+                  f"耗時 {report['seconds']}s")
+            return report
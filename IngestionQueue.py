@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import DBConfig
+
+
+JOB_QUEUED = 'queued'
+JOB_CHUNKING = 'chunking'
+JOB_EMBEDDING = 'embedding'
+JOB_INDEXING = 'indexing'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_CHUNKING, JOB_EMBEDDING, JOB_INDEXING)
+RUNNING_STATES = (JOB_CHUNKING, JOB_EMBEDDING, JOB_INDEXING)
+
+
+class IngestionQueue:
+    '''
+    檔案寫入 milvus 的背景佇列
+
+    工作狀態存放在 SQL (job_model, 例如 app.IngestionJob)，每個 FileItem 一筆，
+    上傳請求只負責建立工作並排入佇列，切分 / embedding / 寫入 milvus 由執行緒池在背景完成。
+    程式重啟後，尚未完成的工作可透過 resume_pending() 重新排入佇列。
+
+    進行中的工作以租約 (lease) 保護: 取得工作的行程記錄在 owner (hostname:pid)，
+    執行期間由 heartbeat 執行緒定期更新 updated_at；只有超過 INGESTION_LEASE_SECONDS 未續約的工作
+    才會被其他行程接手，避免執行較久的工作被重複處理。
+
+    handler(**job.to_task(), progress_callback=...) 即 upload_file_in_milvus，
+    回傳的 dict (例如 chunk_count / avg_chunk_chars) 會寫回工作的同名欄位
+    '''
+
+    def __init__(self, app, db, job_model, handler, max_workers=DBConfig.INGESTION_WORKERS,
+                 lease_seconds=DBConfig.INGESTION_LEASE_SECONDS,
+                 heartbeat_seconds=DBConfig.INGESTION_HEARTBEAT_SECONDS):
+        self.app = app
+        self.db = db
+        self.job_model = job_model
+        self.handler = handler
+        self.max_workers = max_workers
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # gunicorn fork 後的子行程不會繼承執行緒，需在子行程內重新建立執行緒池
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='ingestion')
+                self._pid = os.getpid()
+            return self._executor
+
+    def enqueue(self, job_id):
+        '''
+        將已寫入 SQL 的工作排入背景執行
+        '''
+        self._get_executor().submit(self._run, job_id)
+
+    @staticmethod
+    def _owner():
+        # 每次取用時計算，fork 後的子行程會得到自己的 pid
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _lease_expired(self, job, now=None):
+        if job.updated_at is None:
+            return True
+        now = now or datetime.now()
+        return job.updated_at < now - timedelta(seconds=self.lease_seconds)
+
+    def resume_pending(self):
+        '''
+        重新排入尚未完成的工作: 所有 queued 的工作，以及租約已過期 (執行的行程已中斷) 的進行中工作；
+        實際接手與否由 _claim 的條件式 UPDATE 決定，這裡不修改狀態
+        '''
+        with self.app.app_context():
+            model = self.job_model
+            jobs = model.query.filter(model.status.in_(ACTIVE_STATES)).all()
+            now = datetime.now()
+            job_ids = [job.id for job in jobs
+                       if job.status == JOB_QUEUED or self._lease_expired(job, now)]
+
+        for job_id in job_ids:
+            self.enqueue(job_id)
+        if job_ids:
+            logging.info(f"Resumed {len(job_ids)} ingestion jobs")
+        return job_ids
+
+    def _claim(self, job_id, owner):
+        '''
+        以條件式 UPDATE 取得工作，避免多個 worker 行程重複處理同一筆:
+        queued 的工作直接取得；進行中的工作只有在租約過期後才接手。
+        條件包含讀到的 status 與 updated_at，期間若原 owner 續約或已被他人取得，UPDATE 不會生效
+        '''
+        model = self.job_model
+        job = self.db.session.get(model, job_id)
+        if job is None:
+            return False
+        now = datetime.now()
+        if job.status != JOB_QUEUED and not (job.status in RUNNING_STATES and self._lease_expired(job, now)):
+            return False
+        if job.status != JOB_QUEUED:
+            logging.warning(f"Ingestion job {job_id}: lease of {job.owner} expired, taking over")
+        claimed = model.query.filter_by(id=job_id, status=job.status, updated_at=job.updated_at).update(
+            {'status': JOB_CHUNKING, 'owner': owner, 'updated_at': now},
+            synchronize_session=False)
+        self.db.session.commit()
+        return claimed == 1
+
+    def _heartbeat(self, job_id, owner):
+        '''
+        續約: 只更新仍由 owner 持有的進行中工作，回傳租約是否仍有效
+        '''
+        with self.app.app_context():
+            model = self.job_model
+            renewed = model.query.filter(model.id == job_id, model.owner == owner,
+                                         model.status.in_(RUNNING_STATES)).update(
+                {'updated_at': datetime.now()}, synchronize_session=False)
+            self.db.session.commit()
+            return renewed == 1
+
+    def _keep_alive(self, job_id, owner, stop):
+        while not stop.wait(self.heartbeat_seconds):
+            try:
+                if not self._heartbeat(job_id, owner):
+                    logging.warning(f"Ingestion job {job_id}: lease lost")
+                    return
+            except Exception as e:
+                logging.error(f"Ingestion job {job_id}: heartbeat failed: {e}")
+
+    def _set_status(self, job_id, status, error=None, result=None, owner=None):
+        '''
+        owner 不為 None 時，只有仍持有租約才會更新 (回傳 False 表示工作已被其他行程接手)
+        '''
+        with self.app.app_context():
+            job = self.db.session.get(self.job_model, job_id)
+            if job is None or (owner is not None and job.owner != owner):
+                return False
+            job.status = status
+            job.error = error
+            for key, value in (result or {}).items():
+                if hasattr(job, key):
+                    setattr(job, key, value)
+            job.updated_at = datetime.now()
+            if status in (JOB_DONE, JOB_FAILED):
+                job.finished_at = job.updated_at
+            self.db.session.commit()
+            return True
+
+    def _run(self, job_id):
+        owner = self._owner()
+        with self.app.app_context():
+            if not self._claim(job_id, owner):
+                return
+            job = self.db.session.get(self.job_model, job_id)
+            task = job.to_task()
+
+        def progress_callback(stage):
+            if stage != JOB_CHUNKING and not self._set_status(job_id, stage, owner=owner):
+                # 租約已被其他行程接手，中止本次處理
+                raise RuntimeError(f"Ingestion job {job_id}: lease lost")
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_alive, args=(job_id, owner, stop),
+                                     name=f'ingestion-heartbeat-{job_id}', daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handler(**task, progress_callback=progress_callback)
+        except Exception as e:
+            logging.error(f"Ingestion job {job_id} failed: {e}")
+            self._set_status(job_id, JOB_FAILED, str(e), owner=owner)
+            return
+        finally:
+            stop.set()
+
+        if self._set_status(job_id, JOB_DONE, result=result if isinstance(result, dict) else None, owner=owner):
+            logging.info(f"Ingestion job {job_id} done (file_id={task['file_id']}): {result}")
+        else:
+            logging.warning(f"Ingestion job {job_id}: lease lost before completion, result discarded")
@@ -1,13 +1,158 @@
 # -*- coding: utf-8 -*-
+import time
 
-from openai import AsyncOpenAI, OpenAI
 import DBConfig
+from ClientPool import get_llm_client, get_async_llm_client, call_with_retry, acall_with_retry
+from Metrics import latency_stats
 
 LLM_API_KEY = DBConfig.LLM_API_KEY
 LLM_API_BASE = DBConfig.LLM_API_BASE
 LLM_MODEL_NAME = DBConfig.LLM_MODEL_NAME
 
-def ask_LLM(context, question_zh):
+NOT_FOUND_MESSAGE = '找不到相關資訊'
+# single 模式下模型判斷無法回答時輸出的標記
+NOT_FOUND_SENTINEL = '[[NOT_FOUND]]'
+
+# two_phase: 先呼叫一次 LLM 判斷 True/False 再回答 (原本的做法)
+# single: 只呼叫一次 LLM，無法回答時輸出 NOT_FOUND_SENTINEL
+# score: 以 milvus 回傳的相似度分數在本地判斷，分數夠高才以 single 模式回答
+ASK_GATE_MODES = ('two_phase', 'single', 'score')
+
+
+def ask_LLM(context, question_zh, gate_mode=DBConfig.ASK_GATE_MODE, scores=None):
+    '''
+    根據 context 回答問題，gate_mode 決定如何判斷「找不到相關資訊」(見 ASK_GATE_MODES)
+
+    scores: 檢索結果的相似度分數 (score 模式使用)，未提供時直接回答
+    '''
+    if gate_mode not in ASK_GATE_MODES:
+        raise ValueError(f"Unknown gate mode: {gate_mode}")
+
+    start = time.perf_counter()
+    if gate_mode == 'two_phase':
+        answer = ask_LLM_two_phase(context, question_zh)
+    elif is_below_score_threshold(gate_mode, scores):
+        answer = NOT_FOUND_MESSAGE
+    else:
+        answer = ask_LLM_single(context, question_zh)
+
+    record_ask_latency('ask_llm', gate_mode, start)
+    return answer
+
+
+async def ask_LLM_async(context, question_zh, gate_mode=DBConfig.ASK_GATE_MODE, scores=None):
+    '''
+    ask_LLM 的 async 版本，使用 AsyncOpenAI，等待 LLM 回應時不佔用 worker thread
+    '''
+    if gate_mode not in ASK_GATE_MODES:
+        raise ValueError(f"Unknown gate mode: {gate_mode}")
+
+    start = time.perf_counter()
+    if gate_mode == 'two_phase':
+        relevance = await achat_completion(build_relevance_prompt(context, question_zh), temperature=1.5)
+        if 'False' in relevance:
+            answer = NOT_FOUND_MESSAGE
+        else:
+            answer = await achat_completion(build_two_phase_answer_prompt(context, question_zh))
+    elif is_below_score_threshold(gate_mode, scores):
+        answer = NOT_FOUND_MESSAGE
+    else:
+        answer = resolve_single_answer(await achat_completion(build_single_prompt(context, question_zh)))
+
+    record_ask_latency('ask_llm_async', gate_mode, start)
+    return answer
+
+
+def is_below_score_threshold(gate_mode, scores):
+    return gate_mode == 'score' and scores is not None and max(scores, default=0) < DBConfig.ASK_SCORE_THRESHOLD
+
+
+def record_ask_latency(name, gate_mode, start):
+    elapsed = time.perf_counter() - start
+    latency_stats.record(f'{name}.{gate_mode}', elapsed)
+    print(f"[INFO] {name} mode={gate_mode} 耗時 {elapsed * 1000:.0f} ms")
+
+
+def chat_completion(messages, temperature=0.3):
+    openai_client = get_llm_client()
+    response = call_with_retry(
+        openai_client.chat.completions.create,
+        model=LLM_MODEL_NAME,
+        temperature=temperature,
+        messages=messages,
+    )
+    content = response.choices[0].message.content
+    print("response : \n", content)
+    return content
+
+
+async def achat_completion(messages, temperature=0.3):
+    openai_client = get_async_llm_client()
+    response = await acall_with_retry(
+        openai_client.chat.completions.create,
+        model=LLM_MODEL_NAME,
+        temperature=temperature,
+        messages=messages,
+    )
+    content = response.choices[0].message.content
+    print("response : \n", content)
+    return content
+
+
+def build_single_prompt(context, question_zh):
+    SYSTEM_PROMPT = """你是一個專業的資訊整理員，請根據提供的上下文列出並整理所有符合的相似要點，並以清晰易懂的中文回答。"""
+
+    USER_PROMPT = f"""
+    請根據以下<context>中的資訊，回答<question>中的問題。
+
+    <context>
+    {context}
+    </context>
+
+    <question>
+    {question_zh}
+    </question>
+
+    請求：
+    - 只根據<context>提供的內容回答(包含圖片路徑)。
+    - 若<context>中沒有可以回答問題的資訊，請只輸出 {NOT_FOUND_SENTINEL}，不要輸出其他文字。
+    - 請使用條列式或分段方式，讓回答清晰易讀。
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT},
+    ]
+
+
+def ask_LLM_single(context, question_zh):
+    '''
+    單次呼叫：同一次生成中判斷是否相關並回答
+    '''
+    return resolve_single_answer(chat_completion(build_single_prompt(context, question_zh)))
+
+
+def is_not_found(content):
+    '''
+    去除開頭空白後以 NOT_FOUND_SENTINEL 開頭即視為無法回答；/ask (resolve_single_answer) 與
+    /ask_stream (filter_not_found) 共用此規則，串流時只需暫存開頭即可判斷
+    '''
+    return content.lstrip().startswith(NOT_FOUND_SENTINEL)
+
+
+def resolve_single_answer(content):
+    if is_not_found(content):
+        return NOT_FOUND_MESSAGE
+    return content
+
+
+def is_context_relevant(context, question_zh):
+    '''
+    two_phase 模式的第一次呼叫：請 LLM 只回傳 True / False
+    '''
+    return 'False' not in chat_completion(build_relevance_prompt(context, question_zh), temperature=1.5)
+
+
+def build_relevance_prompt(context, question_zh):
     SYSTEM_PROMPT = """你是一個專業的資訊分析員，負責判斷問題是否與提供的上下文有關。請僅回傳 'True' 或 'False'。"""
 
     # 使用者提示詞：只回傳 True 或 False
@@ -32,20 +177,13 @@ def ask_LLM(context, question_zh):
     - 不需要說明理由或提供額外資訊。
     - 僅允許輸出 'True' 或 'False'。
     """
-    openai_client = OpenAI(api_key=LLM_API_KEY, base_url=LLM_API_BASE)
-    response = openai_client.chat.completions.create(
-        model=LLM_MODEL_NAME,
-        temperature=1.5,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": USER_PROMPT},
-        ],
-    )
-    print("response : \n", response.choices[0].message.content)
-    
-    if 'False' in response.choices[0].message.content:
-        return '找不到相關資訊'
-    
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT},
+    ]
+
+
+def build_two_phase_answer_prompt(context, question_zh):
     SYSTEM_PROMPT = """你是一個專業的資訊整理員，請根據提供的上下文列出並整理所有符合的相似要點，並以清晰易懂的中文回答。"""
 
     # 使用者提示詞：明確要求格式
@@ -65,16 +203,91 @@ def ask_LLM(context, question_zh):
     - 若無相關資訊，請回覆「找不到相關資訊」。
     - 請使用條列式或分段方式，讓回答清晰易讀。
     """
-    openai_client = OpenAI(api_key=LLM_API_KEY, base_url=LLM_API_BASE)
-    response = openai_client.chat.completions.create(
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT},
+    ]
+
+
+def ask_LLM_two_phase(context, question_zh):
+    if not is_context_relevant(context, question_zh):
+        return NOT_FOUND_MESSAGE
+    return chat_completion(build_two_phase_answer_prompt(context, question_zh))
+
+
+def stream_completion(messages, temperature=0.3):
+    '''
+    以串流方式呼叫 LLM，逐段 yield 生成的文字
+    '''
+    openai_client = get_llm_client()
+    stream = call_with_retry(
+        openai_client.chat.completions.create,
         model=LLM_MODEL_NAME,
-        temperature=0.3,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": USER_PROMPT},
-        ],
+        temperature=temperature,
+        messages=messages,
+        stream=True,
     )
-    print("response : \n", response.choices[0].message.content)
-    return response.choices[0].message.content
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()
+
+
+def filter_not_found(pieces):
+    '''
+    先暫存開頭的文字，確認不是 NOT_FOUND_SENTINEL 後才往下傳；若是則改為輸出 NOT_FOUND_MESSAGE (判斷規則見 is_not_found)
+    '''
+    pieces = iter(pieces)
+    buffer = ''
+    for piece in pieces:
+        buffer += piece
+        stripped = buffer.lstrip()
+        if len(stripped) < len(NOT_FOUND_SENTINEL) and NOT_FOUND_SENTINEL.startswith(stripped):
+            continue
+        if is_not_found(stripped):
+            yield NOT_FOUND_MESSAGE
+            return
+        yield buffer
+        yield from pieces
+        return
+
+    if buffer.strip():
+        yield NOT_FOUND_MESSAGE if is_not_found(buffer) else buffer
+
+
+def stream_answer(context, question_zh, gate_mode, scores):
+    if gate_mode == 'two_phase':
+        if not is_context_relevant(context, question_zh):
+            yield NOT_FOUND_MESSAGE
+            return
+        yield from stream_completion(build_two_phase_answer_prompt(context, question_zh))
+    elif is_below_score_threshold(gate_mode, scores):
+        yield NOT_FOUND_MESSAGE
+    else:
+        yield from filter_not_found(stream_completion(build_single_prompt(context, question_zh)))
+
+
+def stream_ask_LLM(context, question_zh, gate_mode=DBConfig.ASK_GATE_MODE, scores=None, start=None):
+    '''
+    ask_LLM 的串流版本，逐段 yield 回答文字，並記錄 time-to-first-token 與總耗時
+
+    start: 計時起點 (time.perf_counter())，預設為呼叫當下；/ask_stream 傳入收到請求的時間
+    '''
+    if gate_mode not in ASK_GATE_MODES:
+        raise ValueError(f"Unknown gate mode: {gate_mode}")
 
+    start = time.perf_counter() if start is None else start
+    first_token = True
+    for piece in stream_answer(context, question_zh, gate_mode, scores):
+        if first_token:
+            ttft = time.perf_counter() - start
+            latency_stats.record(f'ask_llm_stream.ttft.{gate_mode}', ttft)
+            print(f"[INFO] stream_ask_LLM mode={gate_mode} time-to-first-token {ttft * 1000:.0f} ms")
+            first_token = False
+        yield piece
 
+    elapsed = time.perf_counter() - start
+    latency_stats.record(f'ask_llm_stream.{gate_mode}', elapsed)
+    print(f"[INFO] stream_ask_LLM mode={gate_mode} 耗時 {elapsed * 1000:.0f} ms")
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+class LatencyStats:
+    '''
+    依名稱記錄最近 window 筆耗時 (秒)，snapshot() 回傳各名稱的次數與 avg / p50 / p95 / max (毫秒)
+    '''
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples[name].append(seconds)
+            self._counts[name] += 1
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            items = {name: (self._counts[name], sorted(samples)) for name, samples in self._samples.items()}
+
+        result = {}
+        for name, (count, samples) in items.items():
+            if not samples:
+                continue
+            result[name] = {
+                'count': count,
+                'avg_ms': round(sum(samples) / len(samples) * 1000, 2),
+                'p50_ms': round(samples[len(samples) // 2] * 1000, 2),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2),
+                'max_ms': round(samples[-1] * 1000, 2),
+            }
+        return result
+
+
+latency_stats = LatencyStats()
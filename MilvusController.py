@@ -1,8 +1,22 @@
 from pymilvus import MilvusClient, connections, Collection
 import DBConfig
 from pymilvus import DataType
+from pymilvus.exceptions import MilvusUnavailableException, ConnectionNotExistException
+import grpc
 import re
-from openai import OpenAI
+import os
+import time
+import asyncio
+import threading
+from collections import Counter
+import numpy as np
+from ClientPool import get_embedding_client, get_async_embedding_client, call_with_retry, acall_with_retry, embeddings_to_array
+from EmbeddingBatcher import embed_all, embed_in_batches
+from EmbeddingCache import get_embedding_cache
+from Metrics import latency_stats
+from Chunker import sliding_window, iter_sliding_window, chunk_text, iter_file_chunks
+from VectorStore import VectorStore, get_vector_store
+from VectorCodec import MILVUS_VECTOR_TYPES, encode_vectors, score_scale, milvus_vector_dtype, milvus_vector_index
 
 
 MILVUS_BASE = DBConfig.MILVUS_BASE
@@ -11,7 +25,7 @@ MILVUS_PASSWORD = DBConfig.MILVUS_PASSWORD
 
 DB_NAME = DBConfig.DB_NAME
 
-collection_name = "NoteBookLM"
+collection_name = DBConfig.MILVUS_COLLECTION_NAME
 
 DIMENSION = DBConfig.DIMENSION
 
@@ -27,9 +41,79 @@ def parse_milvus_uri(uri: str):
     host, port = match.groups()
     return host, port
 
-host, port = parse_milvus_uri(MILVUS_BASE)
-connections.connect(host=host, port=port, user=MILVUS_USER, password=MILVUS_PASSWORD, db_name= DB_NAME)
-collection = Collection(name=collection_name)
+# 連線中斷類的錯誤，重新連線後可以再試
+RETRYABLE_MILVUS_ERRORS = (MilvusUnavailableException, ConnectionNotExistException, grpc.RpcError)
+
+_collections = {}          # collection 名稱 -> Collection (目前行程)
+_collection_pid = None
+_collection_lock = threading.Lock()
+
+
+def _connection_alias():
+    # 每個行程使用自己的 alias，fork 出來的 worker 不會沿用父行程的 gRPC channel
+    return f"notemind-{os.getpid()}"
+
+
+def get_collection(name=None):
+    '''
+    取得 collection (預設為 collection_name)，第一次使用時才連線 (import 時不連線，Milvus 未啟動也能啟動 app)；
+    每個行程各自連線，fork 後會重新建立
+    '''
+    global _collection_pid
+    name = name or collection_name
+    with _collection_lock:
+        if _collection_pid != os.getpid():
+            _collections.clear()
+            host, port = parse_milvus_uri(MILVUS_BASE)
+            start = time.perf_counter()
+            connections.connect(alias=_connection_alias(), host=host, port=port, user=MILVUS_USER, password=MILVUS_PASSWORD,
+                                db_name= DB_NAME, timeout=DBConfig.MILVUS_CONNECT_TIMEOUT)
+            _collection_pid = os.getpid()
+            print(f"[INFO] Milvus 連線完成 (pid={_collection_pid})，耗時 {(time.perf_counter() - start) * 1000:.0f} ms")
+        if name not in _collections:
+            _collections[name] = Collection(name=name, using=_connection_alias())
+        return _collections[name]
+
+
+def reset_collection():
+    '''
+    丟掉目前的連線，下次 get_collection() 時重新連線
+    '''
+    global _collection_pid
+    with _collection_lock:
+        _collections.clear()
+        _collection_pid = None
+        try:
+            connections.disconnect(_connection_alias())
+        except Exception as e:
+            print(f"[WARNING] Milvus disconnect 失敗: {e}")
+
+
+def call_milvus(func, *args, retry=True, name=None, **kwargs):
+    '''
+    呼叫 func(get_collection(name), *args, **kwargs)，連線失敗時重新連線，最多再試 DBConfig.MILVUS_RECONNECT_RETRIES 次
+
+    retry=False 時 (例如 insert，重送可能造成重複資料) 只重試連線階段的失敗，
+    操作本身失敗仍會重設連線讓下一次呼叫重新連線，但錯誤直接往上拋
+    '''
+    for attempt in range(DBConfig.MILVUS_RECONNECT_RETRIES + 1):
+        last_attempt = attempt == DBConfig.MILVUS_RECONNECT_RETRIES
+        try:
+            collection = get_collection(name)
+        except Exception as e:
+            if last_attempt:
+                raise
+            print(f"[WARNING] Milvus 連線失敗 ({e})，{DBConfig.MILVUS_RECONNECT_DELAY}s 後重試")
+            time.sleep(DBConfig.MILVUS_RECONNECT_DELAY)
+            continue
+
+        try:
+            return func(collection, *args, **kwargs)
+        except RETRYABLE_MILVUS_ERRORS as e:
+            reset_collection()
+            if not retry or last_attempt:
+                raise
+            print(f"[WARNING] Milvus 連線中斷 ({e.__class__.__name__})，重新連線後重試")
 
 def main():
     
@@ -67,9 +151,10 @@ def main():
 
     connections.disconnect()
 
-def create_db_collection(milvus_client, collection_name):
+def create_db_collection(milvus_client, collection_name, vector_dtype=DBConfig.MILVUS_VECTOR_DTYPE):
     '''
     創建collection到milvus db，如果存在會刪掉重建
+    vector_dtype: 向量欄位的儲存格式 (VectorCodec.VECTOR_DTYPES)
     '''
     if milvus_client.has_collection(collection_name):
         milvus_client.drop_collection(collection_name)
@@ -82,7 +167,7 @@ def create_db_collection(milvus_client, collection_name):
     schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True, auto_id=True)
     schema.add_field(field_name="topic_id", datatype=DataType.INT64)
     schema.add_field(field_name="file_id", datatype=DataType.INT64)
-    schema.add_field(field_name="embedding", datatype=DataType.FLOAT_VECTOR, dim=DIMENSION)
+    schema.add_field(field_name="embedding", datatype=MILVUS_VECTOR_TYPES[vector_dtype], dim=DIMENSION)
     schema.add_field(field_name="text", datatype=DataType.VARCHAR, max_length=64000)
 
 
@@ -94,8 +179,9 @@ def create_db_collection(milvus_client, collection_name):
 
     index_params = milvus_client.prepare_index_params()
 
+    index_type, params = milvus_vector_index(vector_dtype)
     index_params.add_index(
-        field_name="embedding", metric_type="IP", index_type="AUTOINDEX", params={}
+        field_name="embedding", metric_type="IP", index_type=index_type, params=params
     )
 
     milvus_client.create_index(collection_name=collection_name, index_params=index_params)
@@ -117,9 +203,10 @@ def insert_data_to_partition(collection, user_id, data):
     else:
         print(f"Partition {partition_name} 已存在")
 
-    collection.insert(data, partition_name= partition_name)
+    return collection.insert(data, partition_name= partition_name)
 
-def search_data_by_partition(collection, user_id, query_vector, target_topic_id, file_id_list):
+def search_data_by_partition(collection, user_id, query_vector, target_topic_id, file_id_list, limit=DBConfig.SEARCH_LIMIT,
+                             **search_kwargs):
     '''
     從特定partition 搜尋資料且指定topic_id和file_id
     '''
@@ -128,72 +215,310 @@ def search_data_by_partition(collection, user_id, query_vector, target_topic_id,
     data=[query_vector],
     anns_field='embedding',
     param={'nprobe': 10},
-    limit=5,
+    limit=limit,
     expr = f"topic_id == {target_topic_id} && file_id in {file_id_list}",
-    output_fields=['text'],
-    partition_names=[partition_name]  # ← 指定 partition
+    output_fields=['text', 'file_id'],
+    partition_names=[partition_name],  # ← 指定 partition
+    **search_kwargs
     )
     return results
 
 
-def sliding_window(text, window_size=100, overlap=30):
-   """
-   對單一字符串進行滑動窗口切割，並避開圖片路徑（D:...\.(png|jpe?g|gif)）被切斷。
-   
-   參數:
-       text (str): 要切割的字串
-       window_size (int): 每個窗口大小（預設100）
-       overlap (int): 窗口間的重疊大小（預設30）
-
-   回傳:
-       list: 切割後的子字串列表
-   """
-   step = window_size - overlap
-   result = []
-   start = 0
-   title = text.split("##")[0]
-
-   # 找出所有 D 開頭、png/jpg/gif/jpeg 結尾的圖片路徑
-   image_pattern = r'D:[^\"\s]*?\.(?:png|jpe?g|gif)'
-   image_positions = [(m.start(), m.end()) for m in re.finditer(image_pattern, text, re.IGNORECASE)]
-
-   def adjust_position(pos):
-       """ 如果 pos 落在圖片路徑中，則返回圖片結尾位置作為新的 start """
-       for img_start, img_end in image_positions:
-           if img_start <= pos < img_end:
-               return img_end  # 跳過整張圖片，從圖片結尾開始
-       return pos
-
-   def adjust_end(pos, img_end_limit):
-       """ 如果 pos 落在圖片路徑中，則延伸到圖片結尾 """
-       for img_start, img_end in image_positions:
-           if pos >= img_start and pos <= img_end:
-               return min(img_end, img_end_limit)  # 不超過最大文本長度
-       return pos
-
-   while start < len(text):
-       # Step 1: 調整 start 點：不能落在圖片中
-       adjusted_start = adjust_position(start)
-       if adjusted_start > start:
-           start = adjusted_start
-
-       # Step 2: 確認 end 點
-       end = start + window_size
-       if end > len(text):
-           end = len(text)
-
-       # Step 3: 調整 end 點：如果 end 在圖片中，就延伸到圖片結尾
-       end = adjust_position(end)
-
-       # Step 4: 加入結果
-       result.append(title + text[start:end])
-
-       # Step 5: 更新 start 到下一段起點（保持 overlap）
-       start = start + step
-
-   return result
+def is_milvus_lite(uri):
+    '''
+    與 pymilvus 相同的判斷: 以 .db 結尾的 uri 為本機檔案，由 Milvus Lite 開啟
+    '''
+    return str(uri).endswith('.db')
+
+
+def scalar_index_type(uri):
+    '''
+    整數純量欄位的索引類型: Milvus standalone / cluster 使用 STL_SORT；Milvus Lite 不支援 STL_SORT，改用 INVERTED
+    '''
+    return 'INVERTED' if is_milvus_lite(uri) else 'STL_SORT'
+
+
+def create_partition_key_collection(milvus_client, collection_name, num_partitions=DBConfig.MILVUS_NUM_PARTITIONS,
+                                    vector_dtype=DBConfig.MILVUS_VECTOR_DTYPE, uri=MILVUS_BASE):
+    '''
+    創建以 user_id 為 partition key 的 collection (已存在則不動)，向量欄位的儲存格式為 vector_dtype
+
+    Milvus 依 user_id 的 hash 分散到 num_partitions 個 partition，使用者數量不受 partition 上限限制；
+    user_id / file_id 建 STL_SORT (uri 為 Milvus Lite 時改為 INVERTED)、topic_id 建 INVERTED 純量索引，過濾條件不必逐筆掃描。
+    uri 為 milvus_client 連線的位址，用來判斷後端類型
+    '''
+    if milvus_client.has_collection(collection_name):
+        return
+
+    schema = MilvusClient.create_schema(
+        auto_id=True,
+        enable_dynamic_field=False,
+    )
+
+    schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True, auto_id=True)
+    schema.add_field(field_name="user_id", datatype=DataType.INT64, is_partition_key=True)
+    schema.add_field(field_name="topic_id", datatype=DataType.INT64)
+    schema.add_field(field_name="file_id", datatype=DataType.INT64)
+    schema.add_field(field_name="embedding", datatype=MILVUS_VECTOR_TYPES[vector_dtype], dim=DIMENSION)
+    schema.add_field(field_name="text", datatype=DataType.VARCHAR, max_length=64000)
+
+    index_params = milvus_client.prepare_index_params()
+    index_type, params = milvus_vector_index(vector_dtype)
+    index_params.add_index(field_name="embedding", metric_type="IP", index_type=index_type, params=params)
+    index_params.add_index(field_name="user_id", index_type=scalar_index_type(uri))
+    index_params.add_index(field_name="topic_id", index_type="INVERTED")
+    index_params.add_index(field_name="file_id", index_type=scalar_index_type(uri))
+
+    milvus_client.create_collection(
+        collection_name=collection_name,
+        schema=schema,
+        index_params=index_params,
+        num_partitions=num_partitions,
+        consistency_level="Strong")
+    print(f"[INFO] 已建立 partition key collection {collection_name} ({num_partitions} partitions)")
+
+
+def insert_data_with_partition_key(collection, user_id, data):
+    '''
+    data 與 insert_data_to_partition 相同 (topic_id, file_id, embedding, text)，前面補上 user_id 欄位
+    '''
+    return collection.insert([[user_id] * len(data[0])] + data)
+
+def search_data_by_partition_key(collection, user_id, query_vector, target_topic_id, file_id_list, limit=DBConfig.SEARCH_LIMIT,
+                                 **search_kwargs):
+    return collection.search(
+        data=[query_vector],
+        anns_field='embedding',
+        param={'nprobe': 10},
+        limit=limit,
+        expr=f"user_id == {user_id} && topic_id == {target_topic_id} && file_id in {file_id_list}",
+        output_fields=['text', 'file_id'],
+        **search_kwargs
+    )
+
+def delete_vector_by_partition_key(collection, user_id, topic_id, file_id):
+    result = collection.delete(expr=f"user_id == {user_id} && topic_id == {topic_id} && file_id == {file_id}")
+    print(f"[INFO] 已刪除 user_id={user_id}, topic_id={topic_id}, file_id={file_id} 的資料 ({collection.name})")
+    return result
+
+def delete_topic_by_partition_key(collection, user_id, topic_id):
+    result = collection.delete(expr=f"user_id == {user_id} && topic_id == {topic_id}")
+    print(f"[INFO] 已刪除 user_id={user_id}, topic_id={topic_id} 的所有資料 ({collection.name})")
+    return result
+
+
+def iterate_rows(collection, output_fields, batch_size, expr='id >= 0', partition_names=None):
+    iterator = collection.query_iterator(batch_size=batch_size, expr=expr, output_fields=output_fields,
+                                         partition_names=partition_names)
+    try:
+        while True:
+            batch = iterator.next()
+            if not batch:
+                return
+            yield batch
+    finally:
+        iterator.close()
+
+
+def iter_file_counts_by_partition(collection, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+    '''
+    依主鍵順序逐批掃描 partition 結構的 collection (只讀純量欄位)，
+    每批回傳 Counter{(user_id, topic_id, file_id): 段落數}，user_id 取自 partition 名稱
+    '''
+    for partition in collection.partitions:
+        if not partition.name.isdigit():
+            if partition.name != '_default':
+                print(f"[WARNING] 略過無法對應 user_id 的 partition '{partition.name}'")
+            continue
+        user_id = int(partition.name)
+        for batch in iterate_rows(collection, ['topic_id', 'file_id'], batch_size, partition_names=[partition.name]):
+            yield Counter((user_id, row['topic_id'], row['file_id']) for row in batch)
+
+
+def iter_file_counts_by_partition_key(collection, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+    for batch in iterate_rows(collection, ['user_id', 'topic_id', 'file_id'], batch_size):
+        yield Counter((row['user_id'], row['topic_id'], row['file_id']) for row in batch)
+
+
+def count_files_by_partition(collection, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+    '''
+    partition 結構的 collection 中每個 (user_id, topic_id, file_id) 的段落數
+    '''
+    counts = Counter()
+    for page in iter_file_counts_by_partition(collection, batch_size):
+        counts.update(page)
+    return counts
+
+
+def count_files_by_partition_key(collection, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+    counts = Counter()
+    for page in iter_file_counts_by_partition_key(collection, batch_size):
+        counts.update(page)
+    return counts
+
+
+def count_chunks_by_partition(collection, user_id, topic_id, file_ids, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+    '''
+    使用者 partition 內指定檔案的段落數 Counter{file_id: 段落數}
+    '''
+    counts = Counter()
+    if not collection.has_partition(str(user_id)):
+        return counts
+    for batch in iterate_rows(collection, ['file_id'], batch_size,
+                              expr=f"topic_id == {topic_id} && file_id in {list(file_ids)}",
+                              partition_names=[str(user_id)]):
+        counts.update(row['file_id'] for row in batch)
+    return counts
+
+
+def count_chunks_by_partition_key(collection, user_id, topic_id, file_ids, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+    counts = Counter()
+    for batch in iterate_rows(collection, ['file_id'], batch_size,
+                              expr=f"user_id == {user_id} && topic_id == {topic_id} && file_id in {list(file_ids)}"):
+        counts.update(row['file_id'] for row in batch)
+    return counts
+
+
+_user_write_ts = {}         # user_id -> (最後一次寫入 / 刪除的 Milvus timestamp, time.monotonic())
+_user_write_lock = threading.Lock()
+
+
+def record_user_write(user_id, mutation_result):
+    '''
+    記錄使用者最後一次寫入的 timestamp，讓之後的檢索能讀到自己的寫入 (見 search_consistency)
+    '''
+    ts = getattr(mutation_result, 'timestamp', 0)
+    with _user_write_lock:
+        _user_write_ts[user_id] = (ts, time.monotonic())
+
+
+def search_consistency(user_id, fresh=False):
+    '''
+    決定單次檢索的 consistency，回傳 (mode, search 參數):
+
+    session : 這個使用者在本行程 MILVUS_SESSION_WINDOW 秒內寫入過，等到該次寫入的 timestamp 即可
+              (以 Customized + guarantee_timestamp 實作，只影響該使用者，不會等其他人的寫入)
+    strong  : fresh=True (呼叫端知道剛上傳過，例如其他 worker 完成的 ingestion) 但本行程沒有 timestamp，
+              或寫入結果沒有回傳 timestamp (Milvus Lite)
+    其他    : DBConfig.MILVUS_SEARCH_CONSISTENCY (預設 Bounded，容許數秒內的延遲，不必等最新的 timestamp)
+    '''
+    with _user_write_lock:
+        write = _user_write_ts.get(user_id)
+    recent = write is not None and time.monotonic() - write[1] < DBConfig.MILVUS_SESSION_WINDOW
+    if recent and write[0]:
+        return 'session', {'consistency_level': 'Customized', 'guarantee_timestamp': write[0]}
+    if fresh or recent:
+        return 'strong', {'consistency_level': 'Strong'}
+    level = DBConfig.MILVUS_SEARCH_CONSISTENCY
+    return level.lower(), {'consistency_level': level}
+
+
+def hits_from_search_result(search_result, scale=1):
+    '''
+    將 collection.search 的 SearchResult 轉為 VectorStore.search 的格式，score 除以 scale (見 VectorCodec.score_scale)
+    '''
+    return [
+        {'id': hit.id, 'file_id': hit.entity.get('file_id'), 'score': hit.distance / scale, 'text': hit.entity.get('text')}
+        for hits in search_result for hit in hits
+    ]
+
+
+def collection_vector_dtype(collection):
+    '''
+    collection 向量欄位 (embedding) 的儲存格式
+    '''
+    field = next(field for field in collection.schema.fields if field.name == 'embedding')
+    return milvus_vector_dtype(field.dtype)
+
+
+class MilvusVectorStore(VectorStore):
+    '''
+    遠端 Milvus (DBConfig.MILVUS_BASE)，schema 為 MILVUS_SCHEMAS 其中之一
+
+    migration_target: 線上遷移期間 (見 MilvusMigration.py) 的新 collection (partition_key 結構)，
+    寫入與刪除會同時套用到兩邊，檢索仍只查原本的 collection
+    '''
+
+    def __init__(self, schema=DBConfig.MILVUS_SCHEMA, name=None, migration_target=DBConfig.MILVUS_MIGRATION_TARGET,
+                 vector_dtype=DBConfig.MILVUS_VECTOR_DTYPE):
+        if schema not in MILVUS_SCHEMAS:
+            raise ValueError(f"Unknown Milvus schema: {schema}")
+        self.schema = schema
+        self.name = name or collection_name
+        self.migration_target = migration_target or None
+        self.vector_dtype = vector_dtype    # 只用於 create()，讀寫依 collection 實際的 schema
+        self._dtypes = {}                   # collection 名稱 -> 向量欄位的儲存格式
+
+    def _dtype(self, name):
+        if name not in self._dtypes:
+            self._dtypes[name] = call_milvus(collection_vector_dtype, name=name)
+        return self._dtypes[name]
+
+    def _targets(self):
+        yield self.name, MILVUS_SCHEMAS[self.schema]
+        if self.migration_target:
+            yield self.migration_target, MILVUS_SCHEMAS['partition_key']
+
+    def create(self, drop_existing=False):
+        milvus_client = MilvusClient(uri = MILVUS_BASE, db_name = DB_NAME, user = MILVUS_USER, password = MILVUS_PASSWORD)
+        if self.schema == 'partition_key':
+            if drop_existing and milvus_client.has_collection(self.name):
+                milvus_client.drop_collection(self.name)
+            create_partition_key_collection(milvus_client, self.name, vector_dtype=self.vector_dtype)
+        elif drop_existing or not milvus_client.has_collection(self.name):
+            create_db_collection(milvus_client, self.name, vector_dtype=self.vector_dtype)
+        self._dtypes.clear()
+        reset_collection()
+
+    def insert(self, user_id, topic_id, file_id, embeddings, texts):
+        for name, functions in self._targets():
+            data = [
+                        [topic_id] * len(texts),
+                        [file_id] * len(texts),
+                        encode_vectors(embeddings, self._dtype(name)),
+                        texts,
+                    ]
+            result = call_milvus(functions['insert'], user_id, data, retry=False, name=name)
+            if name == self.name:
+                record_user_write(user_id, result)
+
+    def search(self, user_id, topic_id, file_ids, embedding, limit=DBConfig.SEARCH_LIMIT, fresh=False):
+        mode, search_kwargs = search_consistency(user_id, fresh)
+        dtype = self._dtype(self.name)
+        start = time.perf_counter()
+        result = call_milvus(MILVUS_SCHEMAS[self.schema]['search'], user_id, encode_vectors(embedding, dtype), topic_id,
+                             file_ids, limit, name=self.name, **search_kwargs)
+        latency_stats.record(f'milvus_search.{mode}', time.perf_counter() - start)
+        return hits_from_search_result(result, score_scale(dtype))
+
+    def delete(self, user_id, topic_id, file_id):
+        for name, functions in self._targets():
+            result = call_milvus(functions['delete'], user_id, topic_id, file_id, name=name)
+            if name == self.name:
+                record_user_write(user_id, result)
+
+    def delete_topic(self, user_id, topic_id):
+        for name, functions in self._targets():
+            result = call_milvus(functions['delete_topic'], user_id, topic_id, name=name)
+            if name == self.name:
+                record_user_write(user_id, result)
+
+    def iter_file_counts(self, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+        yield from MILVUS_SCHEMAS[self.schema]['iter_file_counts'](get_collection(self.name), batch_size)
+
+    def count_chunks(self, user_id, topic_id, file_ids):
+        return call_milvus(MILVUS_SCHEMAS[self.schema]['count_chunks'], user_id, topic_id, file_ids, name=self.name)
+
+    def compact(self):
+        for name, _ in self._targets():
+            call_milvus(lambda collection: collection.compact(), name=name)
+            print(f"[INFO] 已觸發 {name} 的 compaction")
+
 
 def delete_vector(user_id, topic_id, file_id):
+    get_vector_store().delete(user_id, topic_id, file_id)
+
+def delete_vector_from_partition(collection, user_id, topic_id, file_id):
     # user_id, topic_id, file_id = 1, 1, 1
 
     # Step 1: 準備 partition 名稱（假設你用 user_id 做 partition）
@@ -205,54 +530,144 @@ def delete_vector(user_id, topic_id, file_id):
     # Step 3: 確認 partition 存在（可選）
     if collection.has_partition(partition_name):
         # Step 4: 在指定 partition 中執行 delete
-        collection.delete(expr=expr, partition_name=partition_name)
+        result = collection.delete(expr=expr, partition_name=partition_name)
         print(f"[INFO] 已刪除 user_id={user_id}, topic_id={topic_id}, file_id={file_id} 的資料")
+        return result
     else:
         print(f"[WARNING] Partition '{partition_name}' 不存在，無法刪除資料")
 
-def post_embedding_model(text):
-    client = OpenAI(api_key = EMBEDDING_API_KEY, base_url = EMBEDDING_API_BASE)
-    responses = client.embeddings.create(input = text, model = EMBEDDING_MODEL_NAME)
-    return [res_data.embedding for res_data in responses.data]
+def delete_topic_from_partition(collection, user_id, topic_id):
+    '''
+    以 topic_id 條件一次刪除使用者 partition 內該主題的所有段落
+    '''
+    partition_name = str(user_id)
+    if collection.has_partition(partition_name):
+        result = collection.delete(expr=f"topic_id == {topic_id}", partition_name=partition_name)
+        print(f"[INFO] 已刪除 user_id={user_id}, topic_id={topic_id} 的所有資料")
+        return result
+    else:
+        print(f"[WARNING] Partition '{partition_name}' 不存在，無法刪除資料")
 
 
-def upload_file_in_milvus(current_user_id, topic_id, file_id, file_path):
+# 兩種 collection 結構: partition (每個使用者一個 partition，原本的做法) / partition_key (MilvusMigration 遷移後)
+MILVUS_SCHEMAS = {
+    'partition': {
+        'insert': insert_data_to_partition,
+        'search': search_data_by_partition,
+        'delete': delete_vector_from_partition,
+        'delete_topic': delete_topic_from_partition,
+        'iter_file_counts': iter_file_counts_by_partition,
+        'count_chunks': count_chunks_by_partition,
+    },
+    'partition_key': {
+        'insert': insert_data_with_partition_key,
+        'search': search_data_by_partition_key,
+        'delete': delete_vector_by_partition_key,
+        'delete_topic': delete_topic_by_partition_key,
+        'iter_file_counts': iter_file_counts_by_partition_key,
+        'count_chunks': count_chunks_by_partition_key,
+    },
+}
+
+
+def post_embedding_request(text_batch):
     '''
-    file_path = r'I:\\2025\\ThemeCatalog\\uploads\\1\\20250709_102141_BGA_pad__Contact_Pad-OuterBGACompensate.md'
-    
+    回傳 (len(text_batch), DIMENSION) 的 float32 陣列
     '''
-    # milvus_client = MilvusClient(uri = MILVUS_BASE, db_name = DB_NAME, user = MILVUS_USER, password = MILVUS_PASSWORD)
-    # create_db_collection(milvus_client, collection_name)
+    client = get_embedding_client()
+    responses = call_with_retry(client.embeddings.create, input = text_batch, model = EMBEDDING_MODEL_NAME,
+                                encoding_format = DBConfig.EMBEDDING_ENCODING_FORMAT)
+    return embeddings_to_array(responses.data)
 
-    # host, port = parse_milvus_uri(MILVUS_BASE)
+def embed_batch_cached(text_batch):
+    '''
+    單一批次的 embedding：先查快取，未命中的文字 (去除重複後) 再送往 embedding server
+    '''
+    cache = get_embedding_cache()
+    if cache is None:
+        return post_embedding_request(text_batch)
+
+    embeddings = cache.get_many(EMBEDDING_MODEL_NAME, text_batch)
+    missing_texts = list(dict.fromkeys(item for item, emb in zip(text_batch, embeddings) if emb is None))
+    if missing_texts:
+        new_embeddings = post_embedding_request(missing_texts)
+        cache.put_many(EMBEDDING_MODEL_NAME, missing_texts, new_embeddings)
+        computed = dict(zip(missing_texts, new_embeddings))
+        embeddings = [emb if emb is not None else computed[item] for item, emb in zip(text_batch, embeddings)]
+    return np.stack(embeddings)
+
+async def embed_query_async(question):
+    '''
+    問題的 embedding (async)：快取查詢放到 thread 執行，未命中時以 AsyncOpenAI 送出
+    '''
+    cache = get_embedding_cache()
+    if cache is not None:
+        embedding = (await asyncio.to_thread(cache.get_many, EMBEDDING_MODEL_NAME, [question]))[0]
+        if embedding is not None:
+            return embedding
+
+    client = get_async_embedding_client()
+    responses = await acall_with_retry(client.embeddings.create, input = [question], model = EMBEDDING_MODEL_NAME,
+                                       encoding_format = DBConfig.EMBEDDING_ENCODING_FORMAT)
+    embedding = embeddings_to_array(responses.data)[0]
+    if cache is not None:
+        await asyncio.to_thread(cache.put_many, EMBEDDING_MODEL_NAME, [question], [embedding])
+    return embedding
 
-    # connections.connect(host=host, port=port, user=MILVUS_USER, password=MILVUS_PASSWORD, db_name= DB_NAME)
+def post_embedding_model(text):
+    '''
+    依 DBConfig.BATCH_SIZE / EMBEDDING_BATCH_MAX_CHARS 分批並行送出 (每批先查快取)，回傳順序與輸入相同
+    '''
+    return embed_all(text, embed_batch_cached)
 
-    # collection = Collection(name=collection_name)
-    
-    with open(file_path, 'r', encoding='utf-8') as file:
-        file_str = file.read()
-        
-    split_list = sliding_window(file_str, window_size=100, overlap=30)
-    
-    embeddings = post_embedding_model([item for item in split_list])
-    
+
+def upload_file_in_milvus(current_user_id, topic_id, file_id, file_path,
+                          chunk_strategy=DBConfig.DEFAULT_CHUNK_STRATEGY, progress_callback=None):
     '''
-    example_data = [
-                        [101, 102],  # topic_id
-                        [1001, 1002],  # file_id
-                        [[0.1]*DIMENSION, [0.2]*DIMENSION],  # embedding vectors
-                        ["This is a test sentence.", "Another example."]  # text field
-                    ]
+    file_path = r'I:\\2025\\ThemeCatalog\\uploads\\1\\20250709_102141_BGA_pad__Contact_Pad-OuterBGACompensate.md'
+
+    逐區塊讀檔切分 -> 分批 embedding -> 逐批寫入 milvus，記憶體用量與檔案大小無關；
+    中途失敗時會刪除已寫入的部分
+
+    chunk_strategy: Chunker.CHUNK_STRATEGIES 中的切分策略名稱
+    progress_callback(stage): 開始讀檔 (chunking)、收到第一批 embedding (embedding)、
+    最後一批寫入 (indexing) 時呼叫，讓背景佇列 (IngestionQueue) 記錄工作狀態
+
+    回傳 {'chunk_count': 切分數量, 'avg_chunk_chars': 平均字數}
     '''
-    data = [
-                [topic_id] * len(split_list),
-                [file_id] * len(split_list),
-                embeddings,
-                split_list,
-            ]
-    
-    insert_data_to_partition(collection, current_user_id, data)
+    def report(stage):
+        if progress_callback is not None:
+            progress_callback(stage)
+
+    report('chunking')
+    chunks = iter_file_chunks(file_path, chunk_strategy)
+    store = get_vector_store()
+
+    chunk_count = 0
+    total_chars = 0
+    pending = None
+    try:
+        for split_list, embeddings in embed_in_batches(chunks, embed_batch_cached):
+            if pending is None:
+                report('embedding')
+            else:
+                store.insert(current_user_id, topic_id, file_id, *pending)
+
+            chunk_count += len(split_list)
+            total_chars += sum(len(item) for item in split_list)
+            pending = (embeddings, split_list)
+
+        if pending is not None:
+            report('indexing')
+            store.insert(current_user_id, topic_id, file_id, *pending)
+    except Exception:
+        if chunk_count:
+            delete_vector(current_user_id, topic_id, file_id)
+        raise
+
+    avg_chunk_chars = total_chars / chunk_count if chunk_count else 0
+    print(f"[INFO] file_id={file_id} 以 {chunk_strategy} 切分: {chunk_count} 段，平均 {avg_chunk_chars:.1f} 字")
+    return {'chunk_count': chunk_count, 'avg_chunk_chars': avg_chunk_chars}
     
     
 def search_similar_embeddings(current_user_id, topic_id, file_id_list, question):
@@ -265,7 +680,7 @@ def search_similar_embeddings(current_user_id, topic_id, file_id_list, question)
     # connections.connect(host=host, port=port, user=MILVUS_USER, password=MILVUS_PASSWORD, db_name= DB_NAME)
     # collection = Collection(name=collection_name)
     embeddings = post_embedding_model([item for item in [question]])
-    ref_result = search_data_by_partition(collection, current_user_id, embeddings[0], topic_id, file_id_list)
+    ref_result = search_by_embedding(current_user_id, topic_id, file_id_list, embeddings[0])
     
     # for result in ref_result:
     #     for hit in result:
@@ -291,4 +706,16 @@ def search_similar_embeddings(current_user_id, topic_id, file_id_list, question)
     #                 'text': hit.entity.get('text'),
     #                 'file_id': hit.entity.get('file_id')
     #         })
-    return ref_result
\ No newline at end of file
+    return ref_result
+
+
+def search_by_embedding(current_user_id, topic_id, file_id_list, embedding, fresh=False):
+    return get_vector_store().search(current_user_id, topic_id, file_id_list, embedding, fresh=fresh)
+
+
+async def search_similar_embeddings_async(current_user_id, topic_id, file_id_list, question):
+    '''
+    search_similar_embeddings 的 async 版本；pymilvus 為同步 API，搜尋放到 thread 執行
+    '''
+    embedding = await embed_query_async(question)
+    return await asyncio.to_thread(search_by_embedding, current_user_id, topic_id, file_id_list, embedding)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+'''
+將 partition 結構 (每個使用者一個 partition) 的 collection 線上遷移到 partition_key 結構
+
+    1. DBConfig.MILVUS_MIGRATION_TARGET = "NoteBookLM_pk"，重啟 app (之後的寫入 / 刪除會同時套用到新 collection)
+    2. python MilvusMigration.py --source NoteBookLM --target NoteBookLM_pk
+    3. 驗證通過後設定 MILVUS_COLLECTION_NAME = "NoteBookLM_pk"、MILVUS_SCHEMA = "partition_key"、
+       MILVUS_MIGRATION_TARGET = None，重啟 app
+
+遷移期間 app 照常運作。工具以檔案 (user_id, topic_id, file_id) 為單位比對兩邊的段落數，
+不一致的檔案會先清掉新 collection 中的資料再從舊 collection 依 id 順序複製；
+遷移中被刪除的檔案會從新 collection 移除。比對會重複最多 --passes 次直到兩邊一致。
+新 collection 的向量欄位依 DBConfig.MILVUS_VECTOR_DTYPE 建立，可同時轉換儲存格式 (例如 float32 -> float16)。
+'''
+import sys
+import time
+import argparse
+
+from pymilvus import MilvusClient
+
+import DBConfig
+from MilvusController import (MILVUS_BASE, MILVUS_USER, MILVUS_PASSWORD, DB_NAME, collection_name,
+                              get_collection, create_partition_key_collection, insert_data_with_partition_key,
+                              delete_vector_by_partition_key, iterate_rows, count_files_by_partition,
+                              count_files_by_partition_key, collection_vector_dtype)
+from VectorCodec import encode_vectors, decode_vectors
+
+
+def copy_file(source, target, user_id, topic_id, file_id, batch_size):
+    '''
+    以舊 collection 的資料覆蓋新 collection 中的該檔案，依 id 順序寫入 (新 collection 的 auto_id 維持原本的段落順序)
+    '''
+    delete_vector_by_partition_key(target, user_id, topic_id, file_id)
+    source_dtype, target_dtype = collection_vector_dtype(source), collection_vector_dtype(target)
+    copied = 0
+    for batch in iterate_rows(source, ['topic_id', 'file_id', 'embedding', 'text'], batch_size,
+                              expr=f"topic_id == {topic_id} && file_id == {file_id}",
+                              partition_names=[str(user_id)]):
+        batch = sorted(batch, key=lambda row: row['id'])
+        data = [
+                    [row['topic_id'] for row in batch],
+                    [row['file_id'] for row in batch],
+                    encode_vectors(decode_vectors([row['embedding'] for row in batch], source_dtype), target_dtype),
+                    [row['text'] for row in batch],
+                ]
+        insert_data_with_partition_key(target, user_id, data)
+        copied += len(batch)
+    return copied
+
+
+def sync_pass(source, target, batch_size):
+    '''
+    比對一次並修正差異，回傳修正的檔案數
+    '''
+    source_counts = count_files_by_partition(source, batch_size)
+    target_counts = count_files_by_partition_key(target, batch_size)
+
+    fixed = 0
+    for (user_id, topic_id, file_id), count in sorted(source_counts.items()):
+        if target_counts.get((user_id, topic_id, file_id)) == count:
+            continue
+        start = time.perf_counter()
+        copied = copy_file(source, target, user_id, topic_id, file_id, batch_size)
+        print(f"[INFO] 複製 user_id={user_id}, topic_id={topic_id}, file_id={file_id}: "
+              f"{copied} 段，耗時 {time.perf_counter() - start:.2f}s")
+        fixed += 1
+
+    for user_id, topic_id, file_id in sorted(set(target_counts) - set(source_counts)):
+        delete_vector_by_partition_key(target, user_id, topic_id, file_id)
+        fixed += 1
+
+    print(f"[INFO] 舊 collection {len(source_counts)} 個檔案 / {sum(source_counts.values())} 段，修正 {fixed} 個檔案")
+    return fixed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', default=collection_name)
+    parser.add_argument('--target', default=f"{collection_name}_pk")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--passes', type=int, default=3)
+    parser.add_argument('--num-partitions', type=int, default=DBConfig.MILVUS_NUM_PARTITIONS)
+    args = parser.parse_args()
+
+    if DBConfig.MILVUS_MIGRATION_TARGET != args.target:
+        print(f"[WARNING] DBConfig.MILVUS_MIGRATION_TARGET 不是 {args.target}，遷移期間 app 的新寫入不會同步到新 collection")
+
+    milvus_client = MilvusClient(uri = MILVUS_BASE, db_name = DB_NAME, user = MILVUS_USER, password = MILVUS_PASSWORD)
+    create_partition_key_collection(milvus_client, args.target, args.num_partitions)
+
+    source = get_collection(args.source)
+    target = get_collection(args.target)
+    source.load()
+    target.load()
+
+    for i in range(args.passes):
+        print(f"[INFO] 第 {i + 1} 次比對")
+        if sync_pass(source, target, args.batch_size) == 0:
+            print(f"[INFO] {args.source} 與 {args.target} 一致，可切換設定: "
+                  f"MILVUS_COLLECTION_NAME = \"{args.target}\"、MILVUS_SCHEMA = \"partition_key\"、MILVUS_MIGRATION_TARGET = None")
+            return 0
+    print("[WARNING] 仍有差異 (可能有檔案正在上傳)，請稍後再執行一次")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
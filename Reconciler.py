@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from sqlalchemy import insert, select, exists, literal
+
+import DBConfig
+from IngestionQueue import JOB_QUEUED, JOB_DONE, ACTIVE_STATES
+from VectorStore import get_vector_store
+
+
+ORPHAN_KINDS = ('file_no_topic', 'file_no_upload', 'file_no_vectors', 'vectors_no_file', 'upload_no_file')
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def remove_file(path):
+    '''
+    刪除檔案並回傳釋放的 bytes，檔案不存在時回傳 0
+    '''
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+class Reconciler:
+    '''
+    比對 SQL (FileItem)、uploads/ 與向量庫，回報並 (fix=True 時) 修正三者之間的孤兒資料
+
+        flask --app app reconcile          # 只回報
+        flask --app app reconcile --fix    # 修正，有刪除向量時之後觸發 Milvus compaction
+
+    FileItem 依 id、向量庫依主鍵、uploads/ 依目錄逐批讀取 (每批 page_size 筆)，
+    只保留找到的孤兒，記憶體用量與資料量無關。檢查項目:
+        file_no_topic    FileItem 的主題已刪除                       -> 刪除 FileItem、IngestionJob、向量與上傳檔案
+        file_no_upload   FileItem 的上傳檔案不存在                   -> 刪除 FileItem、IngestionJob 與向量
+        file_no_vectors  FileItem 沒有建立中的工作，向量庫卻沒有資料 (例如 embedding 失敗)
+                                                                   -> 建立新的 IngestionJob 重新建立索引
+        vectors_no_file  向量庫中沒有對應 FileItem 的檔案            -> 刪除向量 (主題已刪除時以 topic_id 一次刪除)
+        upload_no_file   uploads/ 中沒有對應 FileItem、且超過 grace_seconds 未修改的檔案 -> 刪除
+    '''
+
+    def __init__(self, app, db, file_model, topic_model, job_model, upload_folder, enqueue=None,
+                 page_size=DBConfig.RECONCILE_PAGE_SIZE, grace_seconds=DBConfig.GC_GRACE_SECONDS):
+        self.app = app
+        self.db = db
+        self.file_model = file_model
+        self.topic_model = topic_model
+        self.job_model = job_model
+        self.upload_folder = upload_folder
+        self.enqueue = enqueue
+        self.page_size = page_size
+        self.grace_seconds = grace_seconds
+
+    def run(self, fix=False, compact=True):
+        start = time.perf_counter()
+        report = dict.fromkeys(ORPHAN_KINDS, 0)
+        report.update({'vector_chunks': 0, 'upload_bytes': 0, 'fixed': fix, 'compacted': False})
+        store = get_vector_store()
+
+        with self.app.app_context():
+            vectors_deleted = self.scan_file_items(store, report, fix)
+            vectors_deleted |= self.scan_vectors(store, report, fix)
+            self.scan_uploads(report, fix)
+
+        if fix and compact and vectors_deleted:
+            store.compact()
+            report['compacted'] = True
+        report['seconds'] = round(time.perf_counter() - start, 2)
+        return report
+
+    def iter_file_pages(self):
+        File = self.file_model
+        last_id = 0
+        while True:
+            page = File.query.filter(File.id > last_id).order_by(File.id).limit(self.page_size).all()
+            if not page:
+                return
+            last_id = page[-1].id
+            yield page
+
+    def scan_file_items(self, store, report, fix):
+        '''
+        FileItem -> 主題 / 上傳檔案 / 向量，回傳是否刪除了向量
+        '''
+        Topic, Job = self.topic_model, self.job_model
+        vectors_deleted = False
+        for page in self.iter_file_pages():
+            topics = {(row.user_id, row.id) for row in self.db.session.query(Topic.user_id, Topic.id).filter(
+                Topic.id.in_({item.topic_id for item in page}))}
+            latest_jobs = {}
+            for job in Job.query.filter(Job.file_id.in_([item.id for item in page])).order_by(Job.id):
+                latest_jobs[job.file_id] = job
+
+            no_topic, no_upload, indexed = [], [], defaultdict(list)
+            for item in page:
+                if (item.user_id, item.topic_id) not in topics:
+                    no_topic.append(item)
+                elif not os.path.exists(item.file_path):
+                    no_upload.append(item)
+                else:
+                    indexed[(item.user_id, item.topic_id)].append(item)
+
+            no_vectors = []
+            for (user_id, topic_id), items in indexed.items():
+                counts = store.count_chunks(user_id, topic_id, [item.id for item in items])
+                for item in items:
+                    job = latest_jobs.get(item.id)
+                    if counts[item.id] or (job is not None and (
+                            job.status in ACTIVE_STATES or (job.status == JOB_DONE and not job.chunk_count))):
+                        continue
+                    no_vectors.append((item, job))
+
+            for kind, items in (('file_no_topic', no_topic), ('file_no_upload', no_upload)):
+                for item in items:
+                    print(f"[INFO] {kind}: user_id={item.user_id}, topic_id={item.topic_id}, "
+                          f"file_id={item.id}, {item.file_path}")
+                report[kind] += len(items)
+            report['upload_bytes'] += sum(file_size(item.file_path) for item in no_topic)
+            for item, job in no_vectors:
+                print(f"[INFO] file_no_vectors: user_id={item.user_id}, topic_id={item.topic_id}, file_id={item.id}, "
+                      f"最後的工作: {job.status if job else '無'}")
+            report['file_no_vectors'] += len(no_vectors)
+
+            if not fix:
+                continue
+            if no_topic or no_upload:
+                self.delete_file_items(store, no_topic, no_upload)
+                vectors_deleted = True
+            if no_vectors:
+                self.requeue(no_vectors)
+        return vectors_deleted
+
+    def delete_file_items(self, store, no_topic, no_upload):
+        Job = self.job_model
+        items = no_topic + no_upload
+        keys = [(item.user_id, item.topic_id, item.id) for item in items]
+        paths = [item.file_path for item in no_topic]
+        Job.query.filter(Job.file_id.in_([item.id for item in items])).delete(synchronize_session=False)
+        for item in items:
+            self.db.session.delete(item)
+        self.db.session.commit()
+
+        # 主題已刪除: 以 topic_id 一次刪除
+        for user_id, topic_id in sorted({(user_id, topic_id) for user_id, topic_id, _ in keys[:len(no_topic)]}):
+            store.delete_topic(user_id, topic_id)
+        for user_id, topic_id, file_id in keys[len(no_topic):]:
+            store.delete(user_id, topic_id, file_id)
+        for path in paths:
+            remove_file(path)
+
+    def requeue(self, no_vectors):
+        '''
+        為沒有向量的檔案建立新工作；以 INSERT ... SELECT ... WHERE NOT EXISTS 在同一個陳述式內
+        再次確認該檔案沒有建立中的工作 (掃描之後可能已由上傳或其他行程建立)，避免重複建立
+        '''
+        Job = self.job_model
+        columns = Job.__table__.c
+        requeued = []
+        for item, last_job in no_vectors:
+            now = datetime.now()
+            values = {'file_id': item.id, 'topic_id': item.topic_id, 'user_id': item.user_id,
+                      'file_path': item.file_path, 'status': JOB_QUEUED,
+                      'chunk_strategy': last_job.chunk_strategy if last_job else DBConfig.DEFAULT_CHUNK_STRATEGY,
+                      'created_at': now, 'updated_at': now}
+            active = exists().where(Job.file_id == item.id, Job.status.in_(ACTIVE_STATES))
+            query = select(*[literal(value, columns[key].type) for key, value in values.items()]).where(~active)
+            if self.db.session.execute(insert(Job).from_select(list(values), query)).rowcount:
+                requeued.append(item.id)
+            else:
+                print(f"[INFO] file_id={item.id} 已有建立中的工作，略過")
+        self.db.session.commit()
+        if not requeued:
+            return
+        if self.enqueue is None:
+            logging.warning(f"{len(requeued)} ingestion jobs queued, they will run when the app restarts")
+            return
+        for job_id, in self.db.session.query(Job.id).filter(Job.file_id.in_(requeued), Job.status == JOB_QUEUED):
+            self.enqueue(job_id)
+
+    def scan_vectors(self, store, report, fix):
+        '''
+        向量庫 -> FileItem，回傳是否刪除了向量
+        '''
+        File = self.file_model
+        orphans = Counter()
+        for page in store.iter_file_counts(self.page_size):
+            owners = {row.id: (row.user_id, row.topic_id) for row in self.db.session.query(
+                File.id, File.user_id, File.topic_id).filter(File.id.in_({file_id for _, _, file_id in page}))}
+            for (user_id, topic_id, file_id), chunks in page.items():
+                if owners.get(file_id) != (user_id, topic_id):
+                    orphans[(user_id, topic_id, file_id)] += chunks
+
+        for (user_id, topic_id, file_id), chunks in sorted(orphans.items()):
+            print(f"[INFO] vectors_no_file: user_id={user_id}, topic_id={topic_id}, file_id={file_id}, {chunks} 段")
+        report['vectors_no_file'] += len(orphans)
+        report['vector_chunks'] += sum(orphans.values())
+        if not fix or not orphans:
+            return False
+
+        # 主題已刪除 (不會再有新檔案寫入) 才以 topic_id 一次刪除，否則逐檔刪除
+        Topic = self.topic_model
+        by_topic = defaultdict(list)
+        for user_id, topic_id, file_id in orphans:
+            by_topic[(user_id, topic_id)].append(file_id)
+        for (user_id, topic_id), file_ids in sorted(by_topic.items()):
+            if Topic.query.filter_by(id=topic_id, user_id=user_id).first() is None:
+                store.delete_topic(user_id, topic_id)
+            else:
+                for file_id in sorted(file_ids):
+                    store.delete(user_id, topic_id, file_id)
+        return True
+
+    def iter_upload_pages(self):
+        stale_before = time.time() - self.grace_seconds
+        page = []
+        for folder, _, names in os.walk(self.upload_folder):
+            for name in names:
+                path = os.path.join(folder, name)
+                if os.path.getmtime(path) > stale_before:
+                    continue
+                page.append(path)
+                if len(page) >= self.page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    def scan_uploads(self, report, fix):
+        '''
+        uploads/ -> FileItem (file_path 與上傳時存入的路徑相同，即 os.path.join(UPLOAD_FOLDER, user_id, 檔名))
+        '''
+        File = self.file_model
+        for page in self.iter_upload_pages():
+            known = {row.file_path for row in self.db.session.query(File.file_path).filter(File.file_path.in_(page))}
+            for path in page:
+                if path in known:
+                    continue
+                print(f"[INFO] upload_no_file: {path}")
+                report['upload_no_file'] += 1
+                report['upload_bytes'] += remove_file(path) if fix else file_size(path)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from collections import OrderedDict
+
+import DBConfig
+from EmbeddingCache import normalize_text
+
+
+class RetrievalCache:
+    '''
+    問題檢索結果的快取 (每個行程一份，LRU + TTL)
+
+    key: (user_id, topic_id, 排序後的 file_id, 正規化後的問題)，value: VectorStore.search 的結果
+    命中時不必重新 embedding 與檢索；新增 / 刪除檔案或主題時以 invalidate 清除相關項目，
+    其他行程的項目則在 ttl 秒後過期 (被刪除的檔案會先被 /ask 的權限檢查擋下，不會用到舊結果)
+    '''
+
+    def __init__(self, max_entries=DBConfig.RETRIEVAL_CACHE_MAX_ENTRIES, ttl=DBConfig.RETRIEVAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()       # key -> (寫入時間, hits)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(user_id, topic_id, file_ids, question):
+        return (int(user_id), int(topic_id), tuple(sorted({int(file_id) for file_id in file_ids})),
+                normalize_text(question))
+
+    def get(self, user_id, topic_id, file_ids, question):
+        key = self.make_key(user_id, topic_id, file_ids, question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, topic_id, file_ids, question, hits):
+        key = self.make_key(user_id, topic_id, file_ids, question)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), hits)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id, topic_id=None, file_ids=None):
+        '''
+        清除該使用者 (指定 topic_id 時只限該主題、指定 file_ids 時只限包含其中任一檔案) 的項目
+        '''
+        user_id = int(user_id)
+        topic_id = None if topic_id is None else int(topic_id)
+        file_ids = None if file_ids is None else {int(file_id) for file_id in file_ids}
+        with self._lock:
+            stale = [key for key in self._entries
+                     if key[0] == user_id
+                     and (topic_id is None or key[1] == topic_id)
+                     and (file_ids is None or not file_ids.isdisjoint(key[2]))]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'invalidations': self.invalidations,
+            }
+
+
+retrieval_cache = RetrievalCache() if DBConfig.RETRIEVAL_CACHE_ENABLED else None
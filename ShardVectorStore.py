@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import threading
+from collections import Counter
+
+import numpy as np
+
+import DBConfig
+from VectorStore import VectorStore
+from VectorCodec import VECTOR_DTYPES, INT8_SCALE, check_vector_dtype, encode_vectors
+
+
+# meta.bin 的每一筆: 段落序號、text 在 texts.bin 中的位置與長度 (bytes)
+META_DTYPE = np.dtype([('row', '<i8'), ('offset', '<i8'), ('length', '<i4')])
+# 回傳的 id = file_id * ROW_ID_SPAN + 段落序號，同檔案內依寫入順序遞增，不同檔案不重複
+ROW_ID_SPAN = 2 ** 32
+
+
+class ShardVectorStore(VectorStore):
+    '''
+    以 NumPy 做精確 (brute-force) 檢索的本機向量庫
+
+    每個 (user_id, topic_id, file_id) 一個 shard 目錄:
+        shard.json  : {'dim', 'dtype'}
+        vectors.bin : N x dim 的 float32 / float16 / int8 矩陣 (row-major，以 np.memmap 讀取；int8 為 x127 量化)
+        meta.bin    : N 筆 META_DTYPE
+        texts.bin   : UTF-8 文字依序串接
+
+    查詢只讀選取檔案的 shard，各做一次矩陣-向量乘積後以 argpartition 取 top-k，
+    候選集合通常只有幾千筆，不需要 ANN 索引。
+    寫入順序為 texts -> meta -> vectors，讀取時筆數取 meta 與 vectors 的最小值，
+    其他行程在寫入途中讀取也只會看到完整的資料。
+    '''
+
+    def __init__(self, root=DBConfig.SHARD_STORE_PATH, dtype=DBConfig.SHARD_DTYPE, dim=DBConfig.DIMENSION,
+                 block_rows=DBConfig.SHARD_SEARCH_BLOCK_ROWS):
+        check_vector_dtype(dtype)
+        self.root = root
+        self.dtype = dtype
+        self.dim = dim
+        self.block_rows = block_rows
+        self._write_lock = threading.Lock()
+        self._cache = {}            # shard_dir -> ((inode, 檔案大小), vectors, meta, texts)
+        self._cache_lock = threading.Lock()
+
+    def shard_dir(self, user_id, topic_id, file_id):
+        return os.path.join(self.root, str(int(user_id)), str(int(topic_id)), str(int(file_id)))
+
+    def create(self, drop_existing=False):
+        if drop_existing and os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def insert(self, user_id, topic_id, file_id, embeddings, texts):
+        shard_dir = self.shard_dir(user_id, topic_id, file_id)
+        vectors = encode_vectors(embeddings, self.dtype).reshape(-1, self.dim)
+        encoded = [text.encode('utf-8') for text in texts]
+
+        with self._write_lock:
+            os.makedirs(shard_dir, exist_ok=True)
+            info_path = os.path.join(shard_dir, 'shard.json')
+            if os.path.exists(info_path):
+                with open(info_path, 'r', encoding='utf-8') as file:
+                    info = json.load(file)
+                if info['dim'] != self.dim or info['dtype'] != self.dtype:
+                    raise ValueError(f"Shard {shard_dir} 格式不符: {info}")
+            else:
+                with open(info_path, 'w', encoding='utf-8') as file:
+                    json.dump({'dim': self.dim, 'dtype': self.dtype}, file)
+
+            meta_path = os.path.join(shard_dir, 'meta.bin')
+            first_row = os.path.getsize(meta_path) // META_DTYPE.itemsize if os.path.exists(meta_path) else 0
+
+            with open(os.path.join(shard_dir, 'texts.bin'), 'ab') as file:
+                offset = file.tell()
+                file.write(b''.join(encoded))
+
+            meta = np.empty(len(encoded), dtype=META_DTYPE)
+            meta['row'] = np.arange(first_row, first_row + len(encoded))
+            meta['length'] = [len(item) for item in encoded]
+            meta['offset'] = offset + np.concatenate(([0], np.cumsum(meta['length'][:-1], dtype=np.int64)))
+            with open(meta_path, 'ab') as file:
+                file.write(meta.tobytes())
+
+            with open(os.path.join(shard_dir, 'vectors.bin'), 'ab') as file:
+                file.write(vectors.tobytes())
+
+    def _load(self, shard_dir):
+        '''
+        回傳 (vectors, meta, texts) 的 memmap，檔案大小改變 (有新寫入) 時才重新 mmap；shard 不存在時回傳 None
+        vectors 依 shard.json 記錄的 dtype 讀取，SHARD_DTYPE 改變後舊的 shard 仍可正確檢索
+        '''
+        vectors_path = os.path.join(shard_dir, 'vectors.bin')
+        try:
+            stat = os.stat(vectors_path)
+        except FileNotFoundError:
+            return None
+        # 檔案被刪除重建 (inode 改變) 或有新寫入 (大小改變) 時重新 mmap
+        version = (stat.st_ino, stat.st_size)
+        size = stat.st_size
+
+        with self._cache_lock:
+            cached = self._cache.get(shard_dir)
+            if cached is not None and cached[0] == version:
+                return cached[1:]
+
+        with open(os.path.join(shard_dir, 'shard.json'), 'r', encoding='utf-8') as file:
+            info = json.load(file)
+        if info['dim'] != self.dim:
+            raise ValueError(f"Shard {shard_dir} 格式不符: {info}")
+        check_vector_dtype(info['dtype'])
+        dtype = VECTOR_DTYPES[info['dtype']]
+        count = min(size // (self.dim * np.dtype(dtype).itemsize),
+                    os.path.getsize(os.path.join(shard_dir, 'meta.bin')) // META_DTYPE.itemsize)
+        if count == 0:
+            return None
+        vectors = np.memmap(vectors_path, dtype=dtype, mode='r', shape=(count, self.dim))
+        meta = np.memmap(os.path.join(shard_dir, 'meta.bin'), dtype=META_DTYPE, mode='r', shape=(count,))
+        texts_path = os.path.join(shard_dir, 'texts.bin')
+        # 空檔案無法 mmap (所有段落都是空字串時)
+        texts = np.memmap(texts_path, dtype=np.uint8, mode='r') if os.path.getsize(texts_path) else np.zeros(0, np.uint8)
+
+        with self._cache_lock:
+            self._cache[shard_dir] = (version, vectors, meta, texts)
+        return vectors, meta, texts
+
+    def _score(self, vectors, query):
+        '''
+        vectors @ query；float16 / int8 的 memmap 直接相乘會先把整個 shard 轉成 float32 複製一份，
+        因此每 block_rows 列轉換一次，暫存只有一個 block 的大小。int8 shard 的 1/INT8_SCALE 套用在結果上
+        '''
+        if vectors.dtype == np.float32:
+            return vectors @ query
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), self.block_rows):
+            block = vectors[start:start + self.block_rows]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        if vectors.dtype == np.int8:
+            scores /= INT8_SCALE
+        return scores
+
+    def search(self, user_id, topic_id, file_ids, embedding, limit=DBConfig.SEARCH_LIMIT, fresh=False):
+        # 只量化資料，query 維持 float32
+        query = np.asarray(embedding, dtype=np.float32)
+        shards = []
+        scores = []
+        for file_id in dict.fromkeys(int(file_id) for file_id in file_ids):
+            loaded = self._load(self.shard_dir(user_id, topic_id, file_id))
+            if loaded is None:
+                continue
+            shards.append((file_id, loaded))
+            scores.append(self._score(loaded[0], query))
+        if not scores:
+            return []
+
+        all_scores = np.concatenate(scores)
+        shard_index = np.repeat(np.arange(len(shards)), [len(item) for item in scores])
+        row_index = np.concatenate([np.arange(len(item)) for item in scores])
+
+        k = min(limit, len(all_scores))
+        top = np.argpartition(-all_scores, k - 1)[:k]
+        top = top[np.argsort(-all_scores[top])]
+
+        hits = []
+        for i in top:
+            file_id, (_, meta, texts) = shards[shard_index[i]]
+            record = meta[row_index[i]]
+            text = bytes(texts[record['offset']:record['offset'] + record['length']]).decode('utf-8')
+            hits.append({
+                'id': file_id * ROW_ID_SPAN + int(record['row']),
+                'file_id': file_id,
+                'score': float(all_scores[i]),
+                'text': text,
+            })
+        return hits
+
+    def delete(self, user_id, topic_id, file_id):
+        shard_dir = self.shard_dir(user_id, topic_id, file_id)
+        with self._write_lock:
+            with self._cache_lock:
+                self._cache.pop(shard_dir, None)
+            if os.path.isdir(shard_dir):
+                shutil.rmtree(shard_dir)
+                print(f"[INFO] 已刪除 user_id={user_id}, topic_id={topic_id}, file_id={file_id} 的資料")
+            else:
+                print(f"[WARNING] Shard '{shard_dir}' 不存在，無法刪除資料")
+
+    def delete_topic(self, user_id, topic_id):
+        topic_dir = os.path.join(self.root, str(int(user_id)), str(int(topic_id)))
+        with self._write_lock:
+            with self._cache_lock:
+                for shard_dir in [key for key in self._cache if os.path.dirname(key) == topic_dir]:
+                    del self._cache[shard_dir]
+            if os.path.isdir(topic_dir):
+                shutil.rmtree(topic_dir)
+                print(f"[INFO] 已刪除 user_id={user_id}, topic_id={topic_id} 的所有資料")
+
+    def _chunk_count(self, shard_dir):
+        meta_path = os.path.join(shard_dir, 'meta.bin')
+        return os.path.getsize(meta_path) // META_DTYPE.itemsize if os.path.exists(meta_path) else 0
+
+    def iter_file_counts(self, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+        '''
+        逐一列出 shard 目錄，每 batch_size 個檔案回傳一批
+        '''
+        if not os.path.isdir(self.root):
+            return
+        page = Counter()
+        for user_id in os.listdir(self.root):
+            for topic_id in os.listdir(os.path.join(self.root, user_id)):
+                for file_id in os.listdir(os.path.join(self.root, user_id, topic_id)):
+                    chunks = self._chunk_count(self.shard_dir(user_id, topic_id, file_id))
+                    if chunks:
+                        page[(int(user_id), int(topic_id), int(file_id))] = chunks
+                    if len(page) >= batch_size:
+                        yield page
+                        page = Counter()
+        if page:
+            yield page
+
+    def count_chunks(self, user_id, topic_id, file_ids):
+        counts = Counter()
+        for file_id in file_ids:
+            chunks = self._chunk_count(self.shard_dir(user_id, topic_id, file_id))
+            if chunks:
+                counts[int(file_id)] = chunks
+        return counts
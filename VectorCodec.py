@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from pymilvus import DataType
+
+
+# 向量的儲存格式: float32 (原始) / float16 (一半大小) / int8 (scalar quantization，四分之一大小)
+VECTOR_DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+MILVUS_VECTOR_TYPES = {'float32': DataType.FLOAT_VECTOR, 'float16': DataType.FLOAT16_VECTOR, 'int8': DataType.INT8_VECTOR}
+# embedding 為單位向量 (IP 即 cosine)，各分量在 [-1, 1]，int8 以固定比例 x127 量化
+INT8_SCALE = 127
+
+
+def check_vector_dtype(dtype):
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype: {dtype}")
+
+
+def encode_vectors(embeddings, dtype):
+    '''
+    float32 的 embedding ((n, dim) 陣列或 list) -> 儲存格式的陣列，float32 時不複製
+    '''
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if dtype == 'int8':
+        return np.clip(np.rint(vectors * INT8_SCALE), -INT8_SCALE, INT8_SCALE).astype(np.int8)
+    return vectors.astype(VECTOR_DTYPES[dtype], copy=False)
+
+
+def decode_vectors(vectors, dtype):
+    '''
+    encode_vectors 的反向，回傳 float32 陣列；vectors 也可以是 Milvus 查詢回傳的每列 bytes (float16 / int8)
+    '''
+    if len(vectors) and isinstance(vectors[0], (bytes, bytearray)):
+        vectors = np.frombuffer(b''.join(vectors), dtype=VECTOR_DTYPES[dtype]).reshape(len(vectors), -1)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / INT8_SCALE if dtype == 'int8' else vectors
+
+
+def score_scale(dtype):
+    '''
+    查詢與資料都以 int8 量化時，內積是原本的 INT8_SCALE^2 倍，除以此值還原成 cosine
+    '''
+    return INT8_SCALE ** 2 if dtype == 'int8' else 1
+
+
+def milvus_vector_dtype(data_type):
+    '''
+    collection schema 中向量欄位的 DataType -> VECTOR_DTYPES 的名稱
+    '''
+    for dtype, milvus_type in MILVUS_VECTOR_TYPES.items():
+        if data_type == milvus_type:
+            return dtype
+    raise ValueError(f"Unsupported vector field type: {data_type}")
+
+
+def milvus_vector_index(dtype):
+    '''
+    回傳 (index_type, params)；INT8_VECTOR 只支援 HNSW
+    '''
+    if dtype == 'int8':
+        return 'HNSW', {'M': 16, 'efConstruction': 200}
+    return 'AUTOINDEX', {}
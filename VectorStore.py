@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+
+from pymilvus import MilvusClient, DataType
+
+import DBConfig
+
+
+class VectorStore(ABC):
+    '''
+    向量資料庫介面，資料以 (user_id, topic_id, file_id) 區分
+
+    search 回傳 [{'id', 'file_id', 'score', 'text'}]，score 為內積 (越大越相似)，依 score 由大到小排序；
+    id 依寫入順序遞增 (ContextBuilder 以此還原同檔案段落的順序)
+
+    delete_topic 一次刪除整個主題的資料。供 Reconciler 比對 SQL 找出孤兒資料:
+    iter_file_counts 逐批掃描全部資料，每批回傳 Counter{(user_id, topic_id, file_id): 段落數}；
+    count_chunks 回傳指定檔案的 Counter{file_id: 段落數}；compact 在大量刪除後回收空間
+
+    search 的 fresh=True 表示該使用者剛完成上傳，結果必須包含最新寫入的資料
+    (只有 Milvus 的讀取有延遲，本機 backend 寫入後立即可讀，忽略此參數)
+    '''
+
+    @abstractmethod
+    def create(self, drop_existing=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert(self, user_id, topic_id, file_id, embeddings, texts):
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, user_id, topic_id, file_ids, embedding, limit=DBConfig.SEARCH_LIMIT, fresh=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, user_id, topic_id, file_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_topic(self, user_id, topic_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_file_counts(self, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_chunks(self, user_id, topic_id, file_ids):
+        raise NotImplementedError
+
+    def compact(self):
+        # 本機 backend 刪除時已釋放空間
+        pass
+
+
+class MilvusLiteVectorStore(VectorStore):
+    '''
+    Milvus Lite (pip install milvus-lite)：資料存在本機檔案，於 app 行程內執行，沒有網路往返；
+    適合小型部署與測試環境 (同一個檔案只能由一個行程開啟)。Milvus Lite 不分 partition，user_id 存成一般欄位過濾
+    '''
+
+    def __init__(self, path=DBConfig.MILVUS_LITE_PATH, collection_name="NoteBookLM"):
+        self.path = path
+        self.collection_name = collection_name
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # 每個行程各自開啟，fork 後重新建立
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._client = MilvusClient(self.path)
+                self._pid = os.getpid()
+                if not self._client.has_collection(self.collection_name):
+                    self._create_collection()
+            return self._client
+
+    def _create_collection(self):
+        schema = MilvusClient.create_schema(auto_id=True, enable_dynamic_field=False)
+        schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True, auto_id=True)
+        schema.add_field(field_name="user_id", datatype=DataType.INT64)
+        schema.add_field(field_name="topic_id", datatype=DataType.INT64)
+        schema.add_field(field_name="file_id", datatype=DataType.INT64)
+        schema.add_field(field_name="embedding", datatype=DataType.FLOAT_VECTOR, dim=DBConfig.DIMENSION)
+        schema.add_field(field_name="text", datatype=DataType.VARCHAR, max_length=64000)
+
+        index_params = self._client.prepare_index_params()
+        index_params.add_index(field_name="embedding", metric_type="IP", index_type="AUTOINDEX", params={})
+        self._client.create_collection(collection_name=self.collection_name, schema=schema,
+                                       index_params=index_params)
+
+    def create(self, drop_existing=False):
+        client = self.client
+        if drop_existing:
+            client.drop_collection(self.collection_name)
+            self._create_collection()
+
+    def insert(self, user_id, topic_id, file_id, embeddings, texts):
+        data = [
+            {'user_id': user_id, 'topic_id': topic_id, 'file_id': file_id, 'embedding': embedding, 'text': text}
+            for embedding, text in zip(embeddings, texts)
+        ]
+        self.client.insert(collection_name=self.collection_name, data=data)
+
+    def search(self, user_id, topic_id, file_ids, embedding, limit=DBConfig.SEARCH_LIMIT, fresh=False):
+        results = self.client.search(
+            collection_name=self.collection_name,
+            data=[embedding],
+            anns_field='embedding',
+            limit=limit,
+            filter=f"user_id == {int(user_id)} and topic_id == {int(topic_id)} and file_id in {[int(f) for f in file_ids]}",
+            output_fields=['text', 'file_id'],
+            search_params={'metric_type': 'IP'},
+        )
+        return [
+            {'id': hit['id'], 'file_id': hit['entity']['file_id'], 'score': hit['distance'], 'text': hit['entity']['text']}
+            for hits in results for hit in hits
+        ]
+
+    def delete(self, user_id, topic_id, file_id):
+        self.client.delete(
+            collection_name=self.collection_name,
+            filter=f"user_id == {int(user_id)} and topic_id == {int(topic_id)} and file_id == {int(file_id)}",
+        )
+        print(f"[INFO] 已刪除 user_id={user_id}, topic_id={topic_id}, file_id={file_id} 的資料")
+
+    def delete_topic(self, user_id, topic_id):
+        self.client.delete(
+            collection_name=self.collection_name,
+            filter=f"user_id == {int(user_id)} and topic_id == {int(topic_id)}",
+        )
+        print(f"[INFO] 已刪除 user_id={user_id}, topic_id={topic_id} 的所有資料")
+
+    def _iterate_rows(self, filter, output_fields, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+        iterator = self.client.query_iterator(collection_name=self.collection_name, batch_size=batch_size,
+                                              filter=filter, output_fields=output_fields)
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    return
+                yield batch
+        finally:
+            iterator.close()
+
+    def iter_file_counts(self, batch_size=DBConfig.MILVUS_SCAN_BATCH_SIZE):
+        for batch in self._iterate_rows('id >= 0', ['user_id', 'topic_id', 'file_id'], batch_size):
+            yield Counter((row['user_id'], row['topic_id'], row['file_id']) for row in batch)
+
+    def count_chunks(self, user_id, topic_id, file_ids):
+        counts = Counter()
+        filter = f"user_id == {int(user_id)} and topic_id == {int(topic_id)} and file_id in {[int(f) for f in file_ids]}"
+        for batch in self._iterate_rows(filter, ['file_id']):
+            counts.update(row['file_id'] for row in batch)
+        return counts
+
+
+def create_vector_store(backend=DBConfig.VECTOR_STORE_BACKEND):
+    '''
+    依名稱建立 VectorStore：milvus (遠端 Milvus，MilvusController) / milvus_lite (本機) /
+    numpy (本機 mmap shard，ShardVectorStore)
+    '''
+    if backend == 'milvus':
+        from MilvusController import MilvusVectorStore
+        return MilvusVectorStore()
+    if backend == 'milvus_lite':
+        return MilvusLiteVectorStore()
+    if backend == 'numpy':
+        from ShardVectorStore import ShardVectorStore
+        return ShardVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    '''
+    取得 DBConfig.VECTOR_STORE_BACKEND 設定的共用 VectorStore
+    '''
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = create_vector_store()
+        return _store
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+'''
+app 冷啟動時間測試 (Milvus 可連線 / 無法連線)
+
+    python benchmarks/bench_cold_start.py [--runs N]
+
+每次在新的子行程中計時:
+    import        : import MilvusController (不再連線 Milvus)
+    first_call    : 第一次 get_collection() (實際連線)
+    legacy        : import + 連線，等同改寫前 import 時就連線的行為
+「無法連線」情境把 DBConfig.MILVUS_BASE 改成本機未使用的 port，並關閉重試。
+'''
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import sys, time, json
+sys.path.append({root!r})
+import DBConfig
+if {base!r}:
+    DBConfig.MILVUS_BASE = {base!r}
+DBConfig.MILVUS_RECONNECT_RETRIES = 0
+
+start = time.perf_counter()
+import MilvusController
+imported = time.perf_counter()
+error = None
+try:
+    MilvusController.get_collection()
+except Exception as e:
+    error = e.__class__.__name__
+connected = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'first_call': connected - imported,
+                  'legacy': connected - start, 'error': error}}))
+'''
+
+
+def run_child(base):
+    output = subprocess.run([sys.executable, '-c', CHILD.format(root=ROOT, base=base)],
+                            capture_output=True, text=True, cwd=ROOT, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(name, base, runs):
+    results = [run_child(base) for _ in range(runs)]
+    errors = {result['error'] for result in results if result['error']}
+    summary = ', '.join(f"{key} {min(result[key] for result in results) * 1000:.0f} ms"
+                        for key in ('import', 'first_call', 'legacy'))
+    print(f"{name}: {summary}" + (f" | first_call error: {', '.join(errors)}" if errors else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    report('Milvus available  ', '', args.runs)
+    report('Milvus unavailable', 'http://127.0.0.1:1', args.runs)
+
+
+if __name__ == '__main__':
+    main()
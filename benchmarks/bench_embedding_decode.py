@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+'''
+embedding 回傳格式的解碼成本與記憶體比較
+
+    python benchmarks/bench_embedding_decode.py [--chunks 20000] [--batch-size 256] [--runs 1] [--modes legacy float base64]
+
+以 httpx.MockTransport 模擬 embedding server (不需連線)，經 OpenAI SDK 取得 --chunks 段的向量，
+每批 --batch-size 段，依 embed_all 的方式保留全部結果:
+    legacy : 改寫前的做法，不指定 encoding_format (SDK 以 base64 傳輸後 .tolist())，保留 Python list
+    float  : encoding_format="float"，JSON 數字，保留 Python list
+    base64 : encoding_format="base64"，embeddings_to_array 直接解碼，EmbeddingBatcher.embed_all 複製到預先配置的陣列
+    to_array : 寫入前轉成 float32 陣列 (ShardVectorStore / pymilvus 需要的格式) 的額外時間
+記憶體以 tracemalloc 另外執行一次量測 (含 NumPy 配置)；retained 為保留全部向量的大小，peak 為過程中的最大值。
+'''
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tracemalloc
+
+import httpx
+import numpy as np
+from openai import OpenAI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import DBConfig
+from ClientPool import embeddings_to_array
+from EmbeddingBatcher import embed_all as embed_all_array
+
+MODES = ('legacy', 'float', 'base64')
+
+
+def make_client(batch_size):
+    '''
+    依請求的 encoding_format 與筆數回傳預先產生的 response (內容相同的批次重複使用，只計解碼成本)
+    '''
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((batch_size, DBConfig.DIMENSION)).astype(np.float32)
+    bodies = {}
+
+    def body(encoding_format, count):
+        if (encoding_format, count) not in bodies:
+            data = [{'object': 'embedding', 'index': i,
+                     'embedding': base64.b64encode(vector.tobytes()).decode() if encoding_format == 'base64' else vector.tolist()}
+                    for i, vector in enumerate(vectors[:count])]
+            bodies[(encoding_format, count)] = json.dumps({
+                'object': 'list', 'data': data, 'model': DBConfig.EMBEDDING_MODEL_NAME,
+                'usage': {'prompt_tokens': 0, 'total_tokens': 0}}).encode()
+        return bodies[(encoding_format, count)]
+
+    def handler(request):
+        payload = json.loads(request.content)
+        content = body(payload.get('encoding_format', 'float'), len(payload['input']))
+        return httpx.Response(200, content=content, headers={'content-type': 'application/json'})
+
+    client = OpenAI(api_key='bench', base_url='http://embedding.bench/v1', max_retries=0,
+                    http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    return client, {name: len(body(name, batch_size)) for name in ('float', 'base64')}
+
+
+def embed(client, mode, texts):
+    if mode == 'legacy':
+        responses = client.embeddings.create(input=texts, model=DBConfig.EMBEDDING_MODEL_NAME)
+        return [res_data.embedding for res_data in responses.data]
+    responses = client.embeddings.create(input=texts, model=DBConfig.EMBEDDING_MODEL_NAME, encoding_format=mode)
+    if mode == 'float':
+        return [res_data.embedding for res_data in responses.data]
+    return embeddings_to_array(responses.data)
+
+
+def embed_all(client, mode, chunks, batch_size):
+    texts = ['chunk'] * chunks
+    if mode == 'base64':
+        return embed_all_array(texts, lambda batch: embed(client, mode, batch), max_count=batch_size, max_in_flight=1)
+    embeddings = []
+    for start in range(0, chunks, batch_size):
+        embeddings.extend(embed(client, mode, texts[start:start + batch_size]))
+    return embeddings
+
+
+def measure_time(client, mode, args):
+    wall, cpu, convert = [], [], []
+    for _ in range(args.runs):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        embeddings = embed_all(client, mode, args.chunks, args.batch_size)
+        wall.append(time.perf_counter() - start)
+        cpu.append(time.process_time() - start_cpu)
+        start = time.perf_counter()
+        np.asarray(embeddings, dtype=np.float32)
+        convert.append(time.perf_counter() - start)
+        del embeddings
+    return min(wall), min(cpu), min(convert)
+
+
+def measure_memory(client, mode, args):
+    tracemalloc.start()
+    embeddings = embed_all(client, mode, args.chunks, args.batch_size)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del embeddings
+    return retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=DBConfig.BATCH_SIZE)
+    parser.add_argument('--runs', type=int, default=1)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    client, body_sizes = make_client(args.batch_size)
+    print(f"{args.chunks} chunks x {DBConfig.DIMENSION} dim，每批 {args.batch_size} 段；"
+          f"每批 response: float {body_sizes['float'] / 1024:.0f} KB，base64 {body_sizes['base64'] / 1024:.0f} KB")
+    print(f"float32 原始大小 {args.chunks * DBConfig.DIMENSION * 4 / 1024 / 1024:.1f} MB")
+    for mode in args.modes:
+        wall, cpu, convert = measure_time(client, mode, args)
+        retained, peak = measure_memory(client, mode, args)
+        print(f"{mode:7s}: wall {wall:.2f} s | cpu {cpu:.2f} s | to_array {convert * 1000:.0f} ms | "
+              f"retained {retained / 1024 / 1024:.1f} MB | peak {peak / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
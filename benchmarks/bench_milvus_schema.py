@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+'''
+partition / partition_key 兩種 collection 結構的過濾檢索延遲比較 (需要可連線的 Milvus)
+
+    python benchmarks/bench_milvus_schema.py [--users 200] [--topics 5] [--files 4] [--chunks 50] [--queries 200]
+
+在 bench_partition / bench_partition_key 兩個暫時的 collection 寫入相同的隨機資料，
+每次檢索隨機挑一個使用者、一個 topic 與其中一部分檔案 (與 /ask 相同的過濾條件)，結束後刪除兩個 collection。
+'''
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import DBConfig
+from pymilvus import MilvusClient
+from MilvusController import (MILVUS_BASE, MILVUS_USER, MILVUS_PASSWORD, DB_NAME, MILVUS_SCHEMAS,
+                              get_collection, create_db_collection, create_partition_key_collection)
+
+COLLECTIONS = {
+    'partition': 'bench_partition',
+    'partition_key': 'bench_partition_key',
+}
+
+
+def random_vectors(rng, count):
+    vectors = rng.standard_normal((count, DBConfig.DIMENSION)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.tolist()
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--topics', type=int, default=5)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--chunks', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    milvus_client = MilvusClient(uri = MILVUS_BASE, db_name = DB_NAME, user = MILVUS_USER, password = MILVUS_PASSWORD)
+    create_db_collection(milvus_client, COLLECTIONS['partition'])
+    if milvus_client.has_collection(COLLECTIONS['partition_key']):
+        milvus_client.drop_collection(COLLECTIONS['partition_key'])
+    create_partition_key_collection(milvus_client, COLLECTIONS['partition_key'])
+
+    try:
+        rng = np.random.default_rng(0)
+        start = time.perf_counter()
+        for user_id in range(1, args.users + 1):
+            for topic_id in range(1, args.topics + 1):
+                for file_id in range(1, args.files + 1):
+                    data = [
+                                [topic_id] * args.chunks,
+                                [file_id] * args.chunks,
+                                random_vectors(rng, args.chunks),
+                                [f"user {user_id} topic {topic_id} file {file_id} chunk {i}" for i in range(args.chunks)],
+                            ]
+                    for schema, name in COLLECTIONS.items():
+                        MILVUS_SCHEMAS[schema]['insert'](get_collection(name), user_id, data)
+        total = args.users * args.topics * args.files * args.chunks
+        print(f"寫入 {total} 段 x 2 collections，耗時 {time.perf_counter() - start:.1f}s")
+
+        for name in COLLECTIONS.values():
+            get_collection(name).flush()
+
+        random.seed(0)
+        queries = [(random.randint(1, args.users), random.randint(1, args.topics),
+                    random.sample(range(1, args.files + 1), random.randint(1, args.files)))
+                   for _ in range(args.queries)]
+        vectors = random_vectors(rng, args.queries)
+
+        for schema, name in COLLECTIONS.items():
+            collection = get_collection(name)
+            search = MILVUS_SCHEMAS[schema]['search']
+            search(collection, queries[0][0], vectors[0], queries[0][1], queries[0][2])    # 暖機
+            latencies = []
+            for (user_id, topic_id, file_ids), vector in zip(queries, vectors):
+                start = time.perf_counter()
+                search(collection, user_id, vector, topic_id, file_ids)
+                latencies.append(time.perf_counter() - start)
+            print(f"{schema:13s}: p50 {percentile(latencies, 0.5) * 1000:.2f} ms, "
+                  f"p95 {percentile(latencies, 0.95) * 1000:.2f} ms, max {max(latencies) * 1000:.2f} ms")
+    finally:
+        for name in COLLECTIONS.values():
+            milvus_client.drop_collection(name)
+
+
+if __name__ == '__main__':
+    main()
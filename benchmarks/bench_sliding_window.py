@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+'''
+sliding_window 新舊版本比對與效能測試
+
+    python benchmarks/bench_sliding_window.py [file_path ...]
+
+預設使用 uploads/1/ 內的範例檔，另外把範例內的 [圖片插入點] 換成 D:\... 圖片路徑，
+模擬大量圖片引用的文件。
+'''
+import os
+import re
+import sys
+import glob
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from Chunker import sliding_window
+
+
+def legacy_sliding_window(text, window_size=100, overlap=30):
+    '''
+    改寫前的 MilvusController.sliding_window，每個窗口都線性掃描 image_positions
+    '''
+    step = window_size - overlap
+    result = []
+    start = 0
+    title = text.split("##")[0]
+
+    image_pattern = r'D:[^\"\s]*?\.(?:png|jpe?g|gif)'
+    image_positions = [(m.start(), m.end()) for m in re.finditer(image_pattern, text, re.IGNORECASE)]
+
+    def adjust_position(pos):
+        for img_start, img_end in image_positions:
+            if img_start <= pos < img_end:
+                return img_end
+        return pos
+
+    while start < len(text):
+        adjusted_start = adjust_position(start)
+        if adjusted_start > start:
+            start = adjusted_start
+
+        end = start + window_size
+        if end > len(text):
+            end = len(text)
+
+        end = adjust_position(end)
+        result.append(title + text[start:end])
+        start = start + step
+
+    return result
+
+
+def with_image_paths(text, repeat=20):
+    '''
+    把 [圖片插入點]：xxx.png 換成 D:\\images\\xxx.png，並重複 repeat 次加大圖片數量
+    '''
+    text = re.sub(r'\[圖片插入點\]：(\S+)', r'D:\\images\\\1', text)
+    return "##".join([text] * repeat)
+
+
+def timeit(func, text, rounds=3):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(name, text):
+    legacy_time, legacy_result = timeit(legacy_sliding_window, text)
+    new_time, new_result = timeit(sliding_window, text)
+    images = len(re.findall(r'D:[^\"\s]*?\.(?:png|jpe?g|gif)', text, re.IGNORECASE))
+
+    assert new_result == legacy_result, f"{name}: 輸出與舊版不一致"
+    print(f"{name}: {len(text)} chars, {images} images, {len(new_result)} chunks | "
+          f"legacy {legacy_time * 1000:.1f} ms, new {new_time * 1000:.1f} ms, "
+          f"x{legacy_time / new_time:.1f}")
+
+
+def main(file_paths):
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            text = file.read()
+        name = os.path.basename(file_path)
+        run(name, text)
+        run(name + ' (D:\\ images)', with_image_paths(text))
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(ROOT, 'uploads', '1', '*')))
+    main(paths)
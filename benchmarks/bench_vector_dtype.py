@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+'''
+向量儲存格式 (float32 / float16 / int8) 的 recall / 檢索延遲 / 記憶體比較
+
+    python benchmarks/bench_vector_dtype.py --docs 文檔/*.md --questions questions.txt [--k 5]
+                                            [--backends numpy milvus] [--dtypes float32 float16 int8]
+    python benchmarks/bench_vector_dtype.py --synthetic 20000 [--queries 200]     # 不需 embedding server
+
+--docs 依 --chunk-strategy 切分後 embedding (經 EmbeddingCache，重複執行不必重新計算)，每個檔案為一個 file_id；
+--questions 為不曾用來調整設定的問題集 (每行一題，或 JSONL 的 "question" 欄位)。
+--synthetic 以分群的隨機單位向量模擬段落，問題為隨機段落加上雜訊。
+
+正確答案為 float32 向量以 NumPy 精確計算的 top-k:
+    recall@k : 檢索結果與正確答案重疊的比例 (各問題平均)
+    score err: 回傳的 score 與該段落 float32 cosine 的平均絕對誤差 (ask_LLM 的門檻依 score 判斷)
+    memory   : numpy 為 vectors.bin 的大小；milvus 為向量原始大小 (N x dim x bytes)，不含索引本身的額外結構
+資料寫入 user_id=0 / topic_id=0，numpy 使用暫存目錄，milvus 使用暫時的 collection，結束後刪除。
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import DBConfig
+from VectorCodec import VECTOR_DTYPES
+from ShardVectorStore import ShardVectorStore
+
+BENCH_USER_ID = 0
+BENCH_TOPIC_ID = 0
+INSERT_BATCH = 1000
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def normalize(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_data(args):
+    '''
+    回傳 (各檔案的段落向量 list, 問題向量)
+    '''
+    rng = np.random.default_rng(0)
+    centers = normalize(rng.standard_normal((max(1, args.synthetic // 50), DBConfig.DIMENSION)))
+    labels = rng.integers(len(centers), size=args.synthetic)
+    corpus = normalize(centers[labels] + 0.08 * rng.standard_normal((args.synthetic, DBConfig.DIMENSION)))
+    picks = rng.integers(args.synthetic, size=args.queries)
+    questions = normalize(corpus[picks] + 0.05 * rng.standard_normal((args.queries, DBConfig.DIMENSION)))
+    return np.array_split(corpus, args.files), questions
+
+
+def read_questions(path):
+    questions = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                questions.append(json.loads(line)['question'] if line.startswith('{') else line)
+    return questions
+
+
+def document_data(args):
+    from Chunker import iter_file_chunks
+    from MilvusController import post_embedding_model
+
+    files = []
+    for path in args.docs:
+        chunks = list(iter_file_chunks(path, args.chunk_strategy))
+        if chunks:
+            files.append(post_embedding_model(chunks))
+    questions = post_embedding_model(read_questions(args.questions))
+    print(f"{len(args.docs)} 個檔案 / {sum(len(item) for item in files)} 段，{len(questions)} 個問題")
+    return files, questions
+
+
+def create_store(backend, dtype, tmp):
+    if backend == 'numpy':
+        return ShardVectorStore(root=os.path.join(tmp, dtype), dtype=dtype)
+    if backend == 'milvus':
+        from MilvusController import MilvusVectorStore
+        return MilvusVectorStore(name=f"bench_dtype_{dtype}", migration_target=None, vector_dtype=dtype)
+    if backend == 'milvus_lite':
+        if dtype != 'float32':
+            raise ValueError("Milvus Lite 只支援 float32")
+        from VectorStore import MilvusLiteVectorStore
+        return MilvusLiteVectorStore(path=os.path.join(tmp, 'bench_lite.db'))
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def drop_store(backend, store):
+    if backend == 'milvus':
+        from pymilvus import MilvusClient
+        from MilvusController import MILVUS_BASE, MILVUS_USER, MILVUS_PASSWORD, DB_NAME
+        MilvusClient(uri = MILVUS_BASE, db_name = DB_NAME, user = MILVUS_USER, password = MILVUS_PASSWORD).drop_collection(store.name)
+    else:
+        store.delete_topic(BENCH_USER_ID, BENCH_TOPIC_ID)
+
+
+def memory_bytes(backend, store, dtype, count, dim):
+    if backend == 'numpy':
+        return sum(os.path.getsize(os.path.join(folder, name))
+                   for folder, _, names in os.walk(store.root) for name in names if name == 'vectors.bin')
+    return count * dim * np.dtype(VECTOR_DTYPES[dtype]).itemsize
+
+
+def run(backend, dtype, files, questions, truth, corpus, args, tmp):
+    store = create_store(backend, dtype, tmp)
+    store.create(drop_existing=True)
+    file_ids = list(range(1, len(files) + 1))
+    try:
+        offset = 0
+        start = time.perf_counter()
+        for file_id, vectors in zip(file_ids, files):
+            for batch in range(0, len(vectors), INSERT_BATCH):
+                part = vectors[batch:batch + INSERT_BATCH]
+                # text 存全域的段落序號，用來比對正確答案
+                store.insert(BENCH_USER_ID, BENCH_TOPIC_ID, file_id, part,
+                             [str(offset + batch + i) for i in range(len(part))])
+            offset += len(vectors)
+        insert_time = time.perf_counter() - start
+
+        store.search(BENCH_USER_ID, BENCH_TOPIC_ID, file_ids, questions[0], limit=args.k, fresh=True)   # 暖機 (載入索引)
+        latencies, recalls, errors = [], [], []
+        for question, expected in zip(questions, truth):
+            start = time.perf_counter()
+            hits = store.search(BENCH_USER_ID, BENCH_TOPIC_ID, file_ids, question, limit=args.k, fresh=True)
+            latencies.append(time.perf_counter() - start)
+            found = [int(hit['text']) for hit in hits]
+            recalls.append(len(set(found) & set(expected)) / len(expected))
+            errors.extend(abs(hit['score'] - float(corpus[index] @ question)) for hit, index in zip(hits, found))
+
+        memory = memory_bytes(backend, store, dtype, len(corpus), corpus.shape[1])
+        print(f"{backend:11s} {dtype:7s}: recall@{args.k} {np.mean(recalls):.4f} | score err {np.mean(errors):.5f} | "
+              f"search p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p95 {percentile(latencies, 0.95) * 1000:.2f} ms | "
+              f"memory {memory / 1024 / 1024:.1f} MB | insert {insert_time:.2f} s")
+    finally:
+        drop_store(backend, store)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', nargs='+', default=[])
+    parser.add_argument('--questions')
+    parser.add_argument('--chunk-strategy', default=DBConfig.DEFAULT_CHUNK_STRATEGY)
+    parser.add_argument('--synthetic', type=int, default=0, help='以隨機向量模擬的段落數')
+    parser.add_argument('--files', type=int, default=10, help='--synthetic 的檔案數')
+    parser.add_argument('--queries', type=int, default=200, help='--synthetic 的問題數')
+    parser.add_argument('--k', type=int, default=DBConfig.SEARCH_LIMIT)
+    parser.add_argument('--backends', nargs='+', default=['numpy', 'milvus'])
+    parser.add_argument('--dtypes', nargs='+', default=list(VECTOR_DTYPES), choices=list(VECTOR_DTYPES))
+    args = parser.parse_args()
+    if not args.synthetic and not (args.docs and args.questions):
+        parser.error('需要 --docs 與 --questions，或 --synthetic')
+
+    files, questions = synthetic_data(args) if args.synthetic else document_data(args)
+    corpus = np.concatenate(files)
+    scores = np.asarray(questions, dtype=np.float32) @ corpus.T
+    k = min(args.k, len(corpus))
+    truth = [set(row) for row in np.argpartition(-scores, k - 1, axis=1)[:, :k].tolist()]
+    print(f"{len(corpus)} 段 x {corpus.shape[1]} dim，{len(questions)} 個問題，float32 原始大小 {corpus.nbytes / 1024 / 1024:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            for dtype in args.dtypes:
+                try:
+                    run(backend, dtype, files, questions, truth, corpus, args, tmp)
+                except Exception as e:
+                    print(f"{backend:11s} {dtype:7s}: 無法測試 ({e.__class__.__name__}: {e})")
+
+
+if __name__ == '__main__':
+    main()
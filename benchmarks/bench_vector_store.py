@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+'''
+VectorStore 各 backend 的寫入 / 檢索速度比較
+
+    python benchmarks/bench_vector_store.py [--backends numpy milvus_lite milvus] [--chunks 20000] [--queries 200]
+
+以隨機的單位向量模擬 --files 個檔案共 --chunks 段，寫入後以 --queries 個隨機問題檢索全部檔案。
+資料寫入 user_id=0 / topic_id=0 (不會是實際使用者)，結束後刪除。
+numpy / milvus_lite 使用暫存目錄中的新檔案。
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import DBConfig
+from VectorStore import create_vector_store, MilvusLiteVectorStore
+from ShardVectorStore import ShardVectorStore
+
+BENCH_USER_ID = 0
+BENCH_TOPIC_ID = 0
+INSERT_BATCH = 1000
+
+
+def random_vectors(rng, count):
+    vectors = rng.standard_normal((count, DBConfig.DIMENSION)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def run(name, store, args):
+    rng = np.random.default_rng(0)
+    file_ids = list(range(1, args.files + 1))
+    per_file = args.chunks // args.files
+
+    store.create()
+    start = time.perf_counter()
+    for file_id in file_ids:
+        for offset in range(0, per_file, INSERT_BATCH):
+            count = min(INSERT_BATCH, per_file - offset)
+            vectors = random_vectors(rng, count)
+            store.insert(BENCH_USER_ID, BENCH_TOPIC_ID, file_id, vectors.tolist(),
+                         [f"file {file_id} chunk {offset + i}" for i in range(count)])
+    insert_time = time.perf_counter() - start
+
+    queries = random_vectors(rng, args.queries).tolist()
+    store.search(BENCH_USER_ID, BENCH_TOPIC_ID, file_ids, queries[0])   # 暖機 (載入索引)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search(BENCH_USER_ID, BENCH_TOPIC_ID, file_ids, query)
+        latencies.append(time.perf_counter() - start)
+    assert len(hits) == min(DBConfig.SEARCH_LIMIT, per_file * args.files), f"{name}: 回傳筆數不正確"
+
+    for file_id in file_ids:
+        store.delete(BENCH_USER_ID, BENCH_TOPIC_ID, file_id)
+
+    print(f"{name}: {per_file * args.files} chunks | insert {insert_time:.2f} s | "
+          f"search p50 {percentile(latencies, 0.5) * 1000:.2f} ms, p95 {percentile(latencies, 0.95) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', nargs='+', default=['numpy', 'milvus_lite', 'milvus'])
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            if backend == 'numpy':
+                store = ShardVectorStore(root=os.path.join(tmp, 'shards'))
+            elif backend == 'milvus_lite':
+                store = MilvusLiteVectorStore(path=os.path.join(tmp, 'bench_lite.db'))
+            else:
+                store = create_vector_store(backend)
+            try:
+                run(backend, store, args)
+            except Exception as e:
+                print(f"{backend}: 無法測試 ({e.__class__.__name__}: {e})")
+
+
+if __name__ == '__main__':
+    main()
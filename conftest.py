@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+import pytest
+
+# app.py 在 import 時依 DATABASE_URL 建立資料表，並啟動背景佇列 / GC；
+# 測試一律使用暫存的 SQLite (不沿用環境變數，避免 drop_all 清掉實際資料)，並停用背景工作
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='notebooklm-test-'), 'test.db')
+os.environ['BACKGROUND_TASKS'] = '0'
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    '''
+    清空資料表的 app 模組，向量庫改為 tmp_path 下的 ShardVectorStore，上傳目錄改為 tmp_path/uploads
+    '''
+    import VectorStore
+    from ShardVectorStore import ShardVectorStore
+    import app as app_module
+
+    monkeypatch.setattr(VectorStore, '_store', ShardVectorStore(root=str(tmp_path / 'shards'), dim=4))
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    with app_module.app.app_context():
+        app_module.db.drop_all()
+        app_module.db.create_all()
+    for cache in (app_module.retrieval_cache, app_module.answer_cache):
+        if cache is not None:
+            cache.invalidate(1)
+    yield app_module
+    with app_module.app.app_context():
+        app_module.db.session.remove()
+
+
+@pytest.fixture
+def user(app_module):
+    '''
+    建立使用者 (id=1) 與其主題 (id=1)
+    '''
+    with app_module.app.app_context():
+        account = app_module.User(username='tester', email='tester@example.com')
+        account.set_password('secret')
+        app_module.db.session.add(account)
+        app_module.db.session.commit()
+        topic = app_module.Topic(title='topic', date='2026-01-01', user_id=account.id)
+        app_module.db.session.add(topic)
+        app_module.db.session.commit()
+        return account.id, topic.id
+
+
+@pytest.fixture
+def client(app_module, user):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user[0])
+    return client
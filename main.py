@@ -1,7 +1,12 @@
 import os
+import sys
+import json
+import asyncio
+import time
 import logging
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory
+import click
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
@@ -10,8 +15,17 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
-from MilvusController import upload_file_in_milvus, search_similar_embeddings, delete_vector
-from LLM import ask_LLM
+from MilvusController import upload_file_in_milvus, delete_vector, embed_query_async, search_by_embedding
+from ContextBuilder import build_context
+from LLM import ask_LLM_async, stream_ask_LLM, ASK_GATE_MODES
+from AsyncRunner import run_async
+from Metrics import latency_stats
+from IngestionQueue import IngestionQueue, JOB_QUEUED, ACTIVE_STATES
+from RetrievalCache import retrieval_cache
+from AnswerCache import answer_cache
+from GarbageCollector import GarbageCollector
+from Chunker import CHUNK_STRATEGIES, read_window_title
+import DBConfig
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -134,6 +148,48 @@ class FileItem(db.Model):
     def __repr__(self):
         return f'<FileItem {self.file_name}>'
 
+class IngestionJob(db.Model):
+    __tablename__ = 'ingestion_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('files.id'), nullable=False, index=True)
+    topic_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    file_path = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=JOB_QUEUED)  # queued/chunking/embedding/indexing/done/failed
+    error = db.Column(db.Text)
+    owner = db.Column(db.String(255))  # 持有租約的行程 (hostname:pid)，進行中時每隔一段時間更新 updated_at
+    chunk_strategy = db.Column(db.String(20), nullable=False, default=DBConfig.DEFAULT_CHUNK_STRATEGY)
+    chunk_count = db.Column(db.Integer)
+    avg_chunk_chars = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+    finished_at = db.Column(db.DateTime)
+
+    def to_task(self):
+        """Keyword arguments for upload_file_in_milvus"""
+        return {
+            'current_user_id': self.user_id,
+            'topic_id': self.topic_id,
+            'file_id': self.file_id,
+            'file_path': self.file_path,
+            'chunk_strategy': self.chunk_strategy,
+        }
+
+    def to_dict(self):
+        return {
+            'file_id': self.file_id,
+            'status': self.status,
+            'error': self.error,
+            'chunk_strategy': self.chunk_strategy,
+            'chunk_count': self.chunk_count,
+            'avg_chunk_chars': self.avg_chunk_chars,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f'<IngestionJob {self.file_id} {self.status}>'
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -148,6 +204,35 @@ with app.app_context():
     db.create_all()
     logging.info("Database tables created")
 
+def is_cli_command():
+    """Whether the app is being imported by a flask CLI command other than `flask run`"""
+    program = sys.argv[0] if sys.argv else ''
+    is_flask = os.path.basename(program) in ('flask', 'flask.exe') or \
+               program.endswith(os.path.join('flask', '__main__.py'))
+    return is_flask and 'run' not in sys.argv[1:]
+
+# flask CLI 指令 (例如 flask reconcile) 或 BACKGROUND_TASKS=0 時不啟動背景工作
+run_background = os.environ.get("BACKGROUND_TASKS", "1") != "0" and not is_cli_command()
+
+# Background ingestion (切分 / embedding / 寫入 milvus)
+ingestion_queue = IngestionQueue(app, db, IngestionJob, upload_file_in_milvus)
+if run_background:
+    ingestion_queue.resume_pending()
+
+# 刪除主題後的背景清理與定期回收孤兒資料 (向量 / uploads/ 檔案)
+garbage_collector = GarbageCollector(app, db, FileItem, Topic, IngestionJob, UPLOAD_FOLDER,
+                                     enqueue=ingestion_queue.enqueue)
+if run_background:
+    garbage_collector.start()
+
+@app.cli.command('reconcile')
+@click.option('--fix', is_flag=True, help='修正找到的孤兒資料 (預設只回報)')
+@click.option('--no-compact', is_flag=True, help='修正後不觸發 Milvus compaction')
+def reconcile_command(fix, no_compact):
+    """Report (and with --fix, repair) orphans between SQL, uploads/ and the vector store"""
+    report = garbage_collector.reconcile(fix=fix, compact=not no_compact, blocking=True)
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
 # Authentication routes
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -266,8 +351,13 @@ def topic_detail(topic_id):
 
     # Get files for this user (not topic-specific, all user files)
     files = FileItem.query.filter_by(user_id=current_user.id, topic_id=topic_id).order_by(FileItem.created_at.desc()).all()
+    topic_jobs = IngestionJob.query.filter_by(user_id=current_user.id, topic_id=topic_id).order_by(IngestionJob.id).all()
+    jobs = {job.file_id: job for job in topic_jobs}
+    # 預設沿用此主題最近一次上傳的切分策略
+    chunk_strategy = topic_jobs[-1].chunk_strategy if topic_jobs else DBConfig.DEFAULT_CHUNK_STRATEGY
 
-    return render_template('topic_detail.html', topic=topic, files=files)
+    return render_template('topic_detail.html', topic=topic, files=files, jobs=jobs,
+                           chunk_strategies=list(CHUNK_STRATEGIES), chunk_strategy=chunk_strategy)
 
 @app.route('/add_topic', methods=['GET', 'POST'])
 @login_required
@@ -314,10 +404,19 @@ def delete_topic(topic_id):
         return jsonify({'success': False, 'error': '主題不存在'})
 
     try:
+        file_items = FileItem.query.filter_by(topic_id=topic_id, user_id=current_user.id).all()
+        file_paths = [file_item.file_path for file_item in file_items]
+        if file_items:
+            IngestionJob.query.filter(IngestionJob.file_id.in_([file_item.id for file_item in file_items])) \
+                .delete(synchronize_session=False)
+            for file_item in file_items:
+                db.session.delete(file_item)
         db.session.delete(topic)
         db.session.commit()
+        invalidate_caches(current_user.id, topic_id)
         
-        # 刪除 milvus 內的相關資料 (current_user.id, topic_id) 
+        # 刪除 milvus 內的相關資料 (current_user.id, topic_id) 與上傳的檔案，在背景執行
+        garbage_collector.purge_topic(current_user.id, topic_id, file_paths)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -350,11 +449,13 @@ def delete_file(file_id):
             logging.warning(f"File not found: {file_item.file_path}")
 
         # Delete the FileItem from database
+        IngestionJob.query.filter_by(file_id=file_item.id).delete()
         db.session.delete(file_item)
         db.session.commit()
         
         delete_vector(current_user.id, topic_id, file_id)
         # 刪除 milvus 內的相關資料 (current_user.id, topic_id, file_id)
+        invalidate_caches(current_user.id, file_ids=[file_id])
         
         
 
@@ -385,6 +486,11 @@ def add_file(topic_id):
         flash('不支援的檔案格式', 'error')
         return redirect(url_for('topic_detail', topic_id=topic_id))
 
+    chunk_strategy = request.form.get('chunk_strategy', DBConfig.DEFAULT_CHUNK_STRATEGY)
+    if chunk_strategy not in CHUNK_STRATEGIES:
+        flash('不支援的切分方式', 'error')
+        return redirect(url_for('topic_detail', topic_id=topic_id))
+
     try:
         filename = secure_filename(file.filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
@@ -409,11 +515,23 @@ def add_file(topic_id):
             topic_id=topic_id
         )
         db.session.add(file_item)
+        db.session.flush()
+
+        # 切分檔案，上傳到 milvus (current_user.id, topic_id, file_id, file_path) 交給背景佇列處理
+        job = IngestionJob(
+            file_id=file_item.id,
+            topic_id=topic_id,
+            user_id=current_user.id,
+            file_path=file_path,
+            status=JOB_QUEUED,
+            chunk_strategy=chunk_strategy
+        )
+        db.session.add(job)
         db.session.commit()
 
-        flash('檔案上傳成功！', 'success')
-        upload_file_in_milvus(int(current_user.id), int(topic_id), int(file_item.id), file_path)
-        # 切分檔案，上傳到 milvus (current_user.id, topic_id, file_id, file_path)
+        ingestion_queue.enqueue(job.id)
+        invalidate_caches(current_user.id, topic_id)
+        flash('檔案上傳成功！正在背景建立索引', 'success')
 
     except Exception as e:
         db.session.rollback()
@@ -429,6 +547,16 @@ def add_file(topic_id):
 
     return redirect(url_for('topic_detail', topic_id=topic_id))
 
+@app.route('/ingestion_status/<int:file_id>')
+@login_required
+def ingestion_status(file_id):
+    """Background ingestion status of a file"""
+    job = IngestionJob.query.filter_by(file_id=file_id, user_id=current_user.id).order_by(IngestionJob.id.desc()).first()
+    if not job:
+        return jsonify({'success': False, 'error': '找不到索引工作'})
+
+    return jsonify({'success': True, **job.to_dict()})
+
 @app.route('/download/<int:file_id>')
 @login_required
 def download_file(file_id):
@@ -527,29 +655,228 @@ def ask():
     file_ids = data.get('fileIds', [])
     topic_id = data.get('topicId', '')
     question = data.get('question', '')
+    gate_mode = data.get('gateMode', DBConfig.ASK_GATE_MODE)
+    # bypassCache: 不使用快取的回答，重新檢索並產生 (新回答仍會寫入快取)
+    use_cache = not data.get('bypassCache', False)
     print(data)
-    response_msg = ''
+    # WSGI 下此 worker 執行緒會等待到回答完成；以 ASGI 執行時 /ask 由 AsgiApp 直接在 server 的 event loop 上處理
+    return jsonify(run_async(ask_payload(int(current_user.id), file_ids, topic_id, question, gate_mode, use_cache)))
 
+async def ask_payload(user_id, file_ids, topic_id, question, gate_mode, use_cache=True):
+    """JSON body of /ask, shared by the Flask view and the ASGI endpoint in AsgiApp"""
     if file_ids == []:
-        response_msg = '請至少選擇一項參考來源'
-        return jsonify({'success': True, 'ai_answer': response_msg})
-    
+        return {'success': True, 'ai_answer': '請至少選擇一項參考來源'}
+
     if question == '':
-        response_msg = '您想問甚麼呢?'
-        return jsonify({'success': True, 'ai_answer': response_msg})
-    
+        return {'success': True, 'ai_answer': '您想問甚麼呢?'}
+
+    if gate_mode not in ASK_GATE_MODES:
+        return {'success': False, 'error': f'不支援的模式: {gate_mode}'}
+
     file_id_list = [int(file_id) for file_id in file_ids]
-    
-    ref_info = search_similar_embeddings(int(current_user.id), int(topic_id), file_id_list, question)
 
-    if ref_info == []:
-        response_msg = '選取檔案內沒有相關內容'
-        return jsonify({'success': True, 'ai_answer': response_msg})
-    
-    response_msg = ask_LLM(ref_info, question)
-    # 在這裡進行你對選中檔案的處理
-    # ...
-    return jsonify({'success': True, 'ai_answer': response_msg.replace('\n','<br>')})
+    try:
+        response_msg = await answer_question(user_id, int(topic_id), file_id_list, question, gate_mode, use_cache)
+    except PermissionError:
+        return {'success': False, 'error': '找不到選取的檔案'}
+    return {'success': True, 'ai_answer': response_msg.replace('\n','<br>')}
+
+def check_selected_files(user_id, topic_id, file_ids):
+    """
+    Ids in file_ids that belong to this user and topic, whether any of them
+    finished ingestion within MILVUS_SESSION_WINDOW, and whether any is still
+    being ingested (runs in a worker thread)
+    """
+    with app.app_context():
+        rows = db.session.query(FileItem.id).filter(
+            FileItem.id.in_(file_ids),
+            FileItem.user_id == user_id,
+            FileItem.topic_id == topic_id
+        ).all()
+        recent_job = db.session.query(IngestionJob.id).filter(
+            IngestionJob.file_id.in_(file_ids),
+            IngestionJob.finished_at >= datetime.now() - timedelta(seconds=DBConfig.MILVUS_SESSION_WINDOW)
+        ).first()
+        active_job = db.session.query(IngestionJob.id).filter(
+            IngestionJob.file_id.in_(file_ids),
+            IngestionJob.status.in_(ACTIVE_STATES)
+        ).first()
+        return {row.id for row in rows}, recent_job is not None, active_job is not None
+
+def window_titles(file_ids):
+    """
+    {file_id: title} for the files last chunked with the window strategy, i.e. the
+    exact text the chunker put in front of every chunk (runs in a worker thread)
+    """
+    with app.app_context():
+        strategies = {}
+        for job in db.session.query(IngestionJob.file_id, IngestionJob.chunk_strategy).filter(
+                IngestionJob.file_id.in_(file_ids)).order_by(IngestionJob.id):
+            strategies[job.file_id] = job.chunk_strategy
+        paths = {row.id: row.file_path for row in db.session.query(FileItem.id, FileItem.file_path).filter(
+            FileItem.id.in_(file_ids))}
+    titles = {}
+    for file_id, path in paths.items():
+        if strategies.get(file_id) != 'window':
+            continue
+        try:
+            titles[file_id] = read_window_title(path)
+        except (OSError, UnicodeDecodeError) as e:
+            logging.warning(f"Read title of file {file_id} failed: {e}")
+    return titles
+
+def invalidate_caches(user_id, topic_id=None, file_ids=None):
+    """Drop cached retrieval results and answers that involve the given topic / files"""
+    for cache in (retrieval_cache, answer_cache):
+        if cache is not None:
+            cache.invalidate(user_id, topic_id=topic_id, file_ids=file_ids)
+
+async def check_question(user_id, topic_id, file_ids, question, embed=True):
+    """
+    Check file ownership (raises PermissionError) and embed the question concurrently.
+    Returns (embedding, recently_ingested, ingesting); embedding is None when embed=False
+    """
+    check = asyncio.to_thread(check_selected_files, user_id, topic_id, file_ids)
+    if embed:
+        (owned, recently_ingested, ingesting), embedding = await asyncio.gather(check, embed_query_async(question))
+    else:
+        (owned, recently_ingested, ingesting), embedding = await check, None
+    if set(file_ids) - owned:
+        raise PermissionError(f'files {sorted(set(file_ids) - owned)} not owned by user {user_id}')
+    return embedding, recently_ingested, ingesting
+
+async def retrieve_context(user_id, topic_id, file_ids, question, checked=None):
+    """
+    Embed the question and check file ownership concurrently, then search Milvus.
+    Results are served from retrieval_cache when the same question was asked
+    against the same files (the ownership check still runs).
+    checked: result of check_question when the caller already ran it
+    """
+    start = time.perf_counter()
+    cached = retrieval_cache.get(user_id, topic_id, file_ids, question) if retrieval_cache is not None else None
+    if cached is not None:
+        titles = asyncio.to_thread(window_titles, file_ids)
+        if checked is None:
+            _, titles = await asyncio.gather(check_question(user_id, topic_id, file_ids, question, embed=False), titles)
+        else:
+            titles = await titles
+        latency_stats.record('retrieve_context.cached', time.perf_counter() - start)
+        return build_context(cached, titles=titles)
+
+    embedding, recently_ingested, ingesting = checked or await check_question(user_id, topic_id, file_ids, question)
+
+    # 剛上傳完成的檔案要讀到最新資料，其餘情況允許 bounded staleness
+    ref_info, titles = await asyncio.gather(
+        asyncio.to_thread(search_by_embedding, user_id, topic_id, file_ids, embedding, fresh=recently_ingested),
+        asyncio.to_thread(window_titles, file_ids))
+    # 還在建立索引的檔案結果不完整，不放進快取
+    if retrieval_cache is not None and not ingesting:
+        retrieval_cache.put(user_id, topic_id, file_ids, question, ref_info)
+    latency_stats.record('retrieve_context', time.perf_counter() - start)
+    return build_context(ref_info, titles=titles)
+
+async def lookup_answer(user_id, topic_id, file_ids, question, gate_mode, use_cache=True):
+    """
+    Check the selected files and look up answer_cache for a similar question.
+    Returns (cached answer or None, checked); checked is None when answer_cache is disabled.
+    With use_cache=False the lookup is skipped, but the new answer is still stored
+    """
+    if answer_cache is None:
+        return None, None
+    checked = await check_question(user_id, topic_id, file_ids, question)
+    if not use_cache:
+        return None, checked
+    answer, similarity = answer_cache.get(user_id, topic_id, file_ids, gate_mode, checked[0])
+    if answer is not None:
+        print(f"[INFO] 使用快取的回答 (相似度 {similarity:.3f})")
+    return answer, checked
+
+def store_answer(user_id, topic_id, file_ids, gate_mode, checked, answer):
+    # 還在建立索引的檔案回答可能不完整，不放進快取
+    if checked is not None and not checked[2]:
+        answer_cache.put(user_id, topic_id, file_ids, gate_mode, checked[0], answer)
+
+async def answer_question(user_id, topic_id, file_ids, question, gate_mode, use_cache=True):
+    answer, checked = await lookup_answer(user_id, topic_id, file_ids, question, gate_mode, use_cache)
+    if answer is not None:
+        return answer
+    context, scores = await retrieve_context(user_id, topic_id, file_ids, question, checked=checked)
+    if context == '':
+        return '選取檔案內沒有相關內容'
+    answer = await ask_LLM_async(context, question, gate_mode=gate_mode, scores=scores)
+    store_answer(user_id, topic_id, file_ids, gate_mode, checked, answer)
+    return answer
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event"""
+    message = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+@app.route('/ask_stream', methods=['POST'])
+@login_required
+def ask_stream():
+    """Same as /ask, but streams the answer tokens as Server-Sent Events"""
+    start = time.perf_counter()
+    data = request.get_json()
+    file_ids = data.get('fileIds', [])
+    topic_id = data.get('topicId', '')
+    question = data.get('question', '')
+    gate_mode = data.get('gateMode', DBConfig.ASK_GATE_MODE)
+    use_cache = not data.get('bypassCache', False)
+    logging.info(f"ask_stream: topic_id={topic_id}, files={len(file_ids)}, gate_mode={gate_mode}")
+
+    def single_message(response_msg):
+        def generate():
+            yield sse_event({'token': response_msg})
+            yield sse_event({}, event='done')
+        return generate()
+
+    if file_ids == []:
+        events = single_message('請至少選擇一項參考來源')
+    elif question == '':
+        events = single_message('您想問甚麼呢?')
+    elif gate_mode not in ASK_GATE_MODES:
+        return jsonify({'success': False, 'error': f'不支援的模式: {gate_mode}'})
+    else:
+        user_id = int(current_user.id)
+        topic_id = int(topic_id)
+        file_id_list = [int(file_id) for file_id in file_ids]
+        try:
+            answer, checked = run_async(lookup_answer(user_id, topic_id, file_id_list, question, gate_mode, use_cache))
+            if answer is None:
+                context, scores = run_async(retrieve_context(user_id, topic_id, file_id_list, question, checked=checked))
+        except PermissionError:
+            return jsonify({'success': False, 'error': '找不到選取的檔案'})
+
+        if answer is not None:
+            events = single_message(answer)
+        elif context == '':
+            events = single_message('選取檔案內沒有相關內容')
+        else:
+            def generate():
+                tokens = []
+                try:
+                    for token in stream_ask_LLM(context, question, gate_mode=gate_mode, scores=scores, start=start):
+                        tokens.append(token)
+                        yield sse_event({'token': token})
+                    store_answer(user_id, topic_id, file_id_list, gate_mode, checked, ''.join(tokens))
+                except Exception as e:
+                    logging.error(f"Ask stream error: {e}")
+                    yield sse_event({'error': '回答產生失敗，請稍後再試'}, event='error')
+                yield sse_event({}, event='done')
+            events = generate()
+
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+@login_required
+def metrics():
+    """Latency statistics (ms) collected in this process"""
+    return jsonify({'success': True, 'latency': latency_stats.snapshot(),
+                    'retrieval_cache': retrieval_cache.stats() if retrieval_cache is not None else None,
+                    'answer_cache': answer_cache.stats() if answer_cache is not None else None,
+                    'gc': garbage_collector.last_report})
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
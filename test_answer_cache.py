@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from AnswerCache import AnswerCache
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_similar_question_hits_within_group():
+    cache = AnswerCache(threshold=0.95)
+    cache.put(1, 1, [2, 1], 'single', unit(1, 0, 0), '答案')
+    answer, similarity = cache.get(1, 1, [1, 2], 'single', unit(1, 0.1, 0))
+    assert answer == '答案' and similarity > 0.95
+
+    answer, similarity = cache.get(1, 1, [1, 2], 'single', unit(0, 1, 0))
+    assert answer is None and abs(similarity) < 1e-6
+    # 不同 gate_mode / 檔案組合不共用
+    assert cache.get(1, 1, [1, 2], 'two_phase', unit(1, 0, 0)) == (None, 0.0)
+    assert cache.get(1, 1, [1], 'single', unit(1, 0, 0)) == (None, 0.0)
+
+
+def test_ttl_and_max_entries():
+    cache = AnswerCache(ttl=0)
+    cache.put(1, 1, [1], 'single', unit(1, 0), 'a')
+    assert cache.get(1, 1, [1], 'single', unit(1, 0))[0] is None
+    assert cache.stats()['entries'] == 0
+
+    cache = AnswerCache(max_entries=2)
+    for i, answer in enumerate('abc'):
+        cache.put(1, 1, [i], 'single', unit(1, 0), answer)
+    assert cache.stats()['entries'] == 2
+    assert cache.get(1, 1, [0], 'single', unit(1, 0))[0] is None
+    assert cache.get(1, 1, [2], 'single', unit(1, 0))[0] == 'c'
+
+
+def test_invalidate_by_file():
+    cache = AnswerCache()
+    cache.put(1, 1, [1, 2], 'single', unit(1, 0), 'a')
+    cache.put(1, 1, [3], 'single', unit(1, 0), 'b')
+    cache.invalidate(1, topic_id=1, file_ids=[2])
+    assert cache.get(1, 1, [1, 2], 'single', unit(1, 0))[0] is None
+    assert cache.get(1, 1, [3], 'single', unit(1, 0))[0] == 'b'
+    cache.invalidate(1)
+    assert cache.stats()['entries'] == 0
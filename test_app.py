@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import io
+
+import numpy as np
+
+from IngestionQueue import JOB_QUEUED
+
+
+HITS = [{'id': 1, 'file_id': 1, 'score': 0.9, 'text': 'a'}]
+EMBEDDING = np.ones(4, dtype=np.float32)
+
+
+def fill_caches(app_module, user_id, topic_id, file_ids):
+    app_module.retrieval_cache.put(user_id, topic_id, file_ids, 'q', HITS)
+    app_module.answer_cache.put(user_id, topic_id, file_ids, 'single', EMBEDDING, 'answer')
+
+
+def cached(app_module, user_id, topic_id, file_ids):
+    return (app_module.retrieval_cache.get(user_id, topic_id, file_ids, 'q') is not None,
+            app_module.answer_cache.get(user_id, topic_id, file_ids, 'single', EMBEDDING)[0] is not None)
+
+
+def add_file_item(app_module, user_id, topic_id, path):
+    with app_module.app.app_context():
+        item = app_module.FileItem(file_path=str(path), file_name=path.name, original_name=path.name,
+                                   user_id=user_id, topic_id=topic_id)
+        app_module.db.session.add(item)
+        app_module.db.session.commit()
+        return item.id
+
+
+def test_add_file_queues_job_and_invalidates_topic(app_module, user, client, monkeypatch):
+    user_id, topic_id = user
+    queued = []
+    monkeypatch.setattr(app_module.ingestion_queue, 'enqueue', queued.append)
+    fill_caches(app_module, user_id, topic_id, [1])
+    fill_caches(app_module, user_id, topic_id + 1, [2])
+
+    response = client.post(f'/add_file/{topic_id}', data={'file': (io.BytesIO('## 標題\n內容'.encode('utf-8')), 'doc.md')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    with app_module.app.app_context():
+        job = app_module.IngestionJob.query.one()
+        assert job.status == JOB_QUEUED and job.topic_id == topic_id
+        assert queued == [job.id]
+    assert cached(app_module, user_id, topic_id, [1]) == (False, False)
+    assert cached(app_module, user_id, topic_id + 1, [2]) == (True, True)
+
+
+def test_delete_file_invalidates_entries_with_file(app_module, user, client, tmp_path, monkeypatch):
+    user_id, topic_id = user
+    deleted = []
+    monkeypatch.setattr(app_module, 'delete_vector', lambda *args: deleted.append(args))
+    path = tmp_path / 'doc.md'
+    path.write_text('內容', encoding='utf-8')
+    file_id = add_file_item(app_module, user_id, topic_id, path)
+    fill_caches(app_module, user_id, topic_id, [file_id, 99])
+    fill_caches(app_module, user_id, topic_id, [99])
+
+    response = client.post(f'/delete_file/{file_id}?topic_id={topic_id}')
+    assert response.get_json() == {'success': True}
+    assert not path.exists()
+    assert deleted == [(user_id, str(topic_id), file_id)]
+    assert cached(app_module, user_id, topic_id, [file_id, 99]) == (False, False)
+    assert cached(app_module, user_id, topic_id, [99]) == (True, True)
+
+
+def test_ask_stream_requires_login(app_module, user):
+    response = app_module.app.test_client().post('/ask_stream', json={'fileIds': [1], 'question': 'q', 'topicId': 1})
+    assert response.status_code == 302
+    assert '/login' in response.headers['Location']
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import asyncio
+
+import pytest
+
+pytest.importorskip('asgiref')
+
+
+def http_scope(path='/ask', method='POST', headers=()):
+    return {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(key.lower().encode(), value.encode()) for key, value in headers],
+            'client': ('127.0.0.1', 1234), 'server': ('testserver', 80)}
+
+
+async def call(asgi_app, scope, body=b''):
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi_app(scope, receive, send)
+    status = sent[0]['status']
+    return status, dict(sent[0]['headers']), b''.join(message.get('body', b'') for message in sent[1:])
+
+
+def test_load_user_id_from_session_cookie(app_module, user, client):
+    import AsgiApp
+    cookie = client.get_cookie('session')
+    assert AsgiApp.load_user_id([('Cookie', f'session={cookie.value}')]) == user[0]
+    assert AsgiApp.load_user_id([]) is None
+
+
+def test_ask_serves_concurrent_questions_on_one_loop(app_module, user, monkeypatch):
+    import AsgiApp
+    monkeypatch.setattr(AsgiApp, 'load_user_id', lambda headers: user[0])
+    running = 0
+    peak = 0
+
+    async def answer_question(user_id, topic_id, file_ids, question, gate_mode, use_cache=True):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.2)
+        running -= 1
+        return f'{question}\n答案'
+
+    monkeypatch.setattr(app_module, 'answer_question', answer_question)
+    body = lambda i: json.dumps({'fileIds': [1], 'topicId': 1, 'question': f'q{i}'}).encode()
+
+    async def main():
+        return await asyncio.gather(*[call(AsgiApp.asgi_app, http_scope(), body(i)) for i in range(20)])
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    assert time.perf_counter() - start < 2
+    assert peak == 20
+    assert [json.loads(body) for _, _, body in results][3] == {'success': True, 'ai_answer': 'q3<br>答案'}
+
+
+def test_ask_validation_and_fallback_to_flask(app_module, user, monkeypatch):
+    import AsgiApp
+    status, _, body = asyncio.run(call(AsgiApp.asgi_app, http_scope(), json.dumps({'fileIds': []}).encode()))
+    # 未登入: 交給 Flask 處理，不會進入 ask_payload
+    assert status != 200
+
+    monkeypatch.setattr(AsgiApp, 'load_user_id', lambda headers: user[0])
+    status, _, body = asyncio.run(call(AsgiApp.asgi_app, http_scope(), json.dumps({'fileIds': []}).encode()))
+    assert (status, json.loads(body)) == (200, {'success': True, 'ai_answer': '請至少選擇一項參考來源'})
+    status, _, body = asyncio.run(call(AsgiApp.asgi_app, http_scope(), json.dumps(
+        {'fileIds': [1], 'question': 'q', 'topicId': 1, 'gateMode': 'nope'}).encode()))
+    assert json.loads(body)['success'] is False
+
+    # 其他路由由 Flask 處理
+    status, headers, _ = asyncio.run(call(AsgiApp.asgi_app, http_scope('/login', 'GET')))
+    assert status == 200 and headers[b'content-type'].startswith(b'text/html')
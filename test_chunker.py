@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import re
+import random
+
+import pytest
+
+from Chunker import sliding_window, iter_sliding_window, iter_sliding_window_stream, iter_file_chunks, chunk_text, get_tokenizer
+
+
+def legacy_sliding_window(text, window_size=100, overlap=30):
+    '''
+    原本 MilvusController.sliding_window 的實作 (逐一掃描 image_positions)，作為比對基準
+    '''
+    step = window_size - overlap
+    result = []
+    start = 0
+    title = text.split("##")[0]
+    image_positions = [(m.start(), m.end()) for m in re.finditer(r'D:[^\"\s]*?\.(?:png|jpe?g|gif)', text, re.IGNORECASE)]
+
+    def adjust_position(pos):
+        for img_start, img_end in image_positions:
+            if img_start <= pos < img_end:
+                return img_end
+        return pos
+
+    while start < len(text):
+        adjusted_start = adjust_position(start)
+        if adjusted_start > start:
+            start = adjusted_start
+        end = min(start + window_size, len(text))
+        end = adjust_position(end)
+        result.append(title + text[start:end])
+        start = start + step
+    return result
+
+
+def random_text(rng, length, title=True):
+    '''
+    隨機的文字、換行、引號與圖片路徑 (部分大寫副檔名、部分路徑很長)
+    '''
+    parts = ['標題 ' + 'x' * rng.randint(0, 40) + '\n## 第一節\n'] if title else []
+    size = sum(len(part) for part in parts)
+    while size < length:
+        kind = rng.random()
+        if kind < 0.15:
+            name = 'a' * rng.randint(1, 150 if rng.random() < 0.2 else 10)
+            part = f' D:\\images\\{name}.{rng.choice(["png", "PNG", "jpg", "jpeg", "gif"])} '
+        elif kind < 0.2:
+            part = f'"D:/img/{rng.randint(0, 99)}.png"'
+        elif kind < 0.25:
+            part = '\n## 小節\n'
+        else:
+            part = ''.join(rng.choice('abc 中文字\n') for _ in range(rng.randint(1, 30)))
+        parts.append(part)
+        size += len(part)
+    return ''.join(parts)
+
+
+def blocks_of(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_sliding_window_matches_legacy(seed):
+    rng = random.Random(seed)
+    text = random_text(rng, rng.randint(0, 3000), title=seed % 2 == 0)
+    assert sliding_window(text) == legacy_sliding_window(text)
+    assert sliding_window(text, 50, 10) == legacy_sliding_window(text, 50, 10)
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('block_size', [1, 7, 64, 4096])
+def test_stream_matches_legacy(seed, block_size):
+    rng = random.Random(seed)
+    text = random_text(rng, rng.randint(0, 3000))
+    assert list(iter_sliding_window_stream(blocks_of(text, block_size))) == legacy_sliding_window(text)
+
+
+def test_stream_without_title_marker():
+    # 整份文件短於 title_max_chars 且沒有 ##: 與原本相同，整份文件即 title
+    text = 'abc ' * 100
+    assert list(iter_sliding_window_stream(blocks_of(text, 16))) == legacy_sliding_window(text)
+    # 超過 title_max_chars 仍找不到 ##: 不加 title
+    chunks = list(iter_sliding_window_stream(blocks_of(text, 16), title_max_chars=50))
+    assert chunks == [text[i:i + 100] for i in range(0, len(text), 70)]
+
+
+def test_stream_long_unseparated_text():
+    text = '## t\n' + 'x' * 20000
+    assert list(iter_sliding_window_stream(blocks_of(text, 1000))) == legacy_sliding_window(text)
+
+
+def test_iter_file_chunks_matches_legacy(tmp_path):
+    text = random_text(random.Random(1), 5000)
+    path = tmp_path / 'doc.md'
+    path.write_text(text, encoding='utf-8')
+    assert list(iter_file_chunks(str(path), 'window', block_size=100)) == legacy_sliding_window(text)
+    assert list(iter_sliding_window(text)) == list(chunk_text(text, 'window'))
+
+
+def test_get_tokenizer_from_local_file(tmp_path):
+    # TOKENIZER_NAME 可為本機 tokenizer.json，不需連線到 HF hub
+    tokenizers = pytest.importorskip('tokenizers')
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel({'[UNK]': 0, 'abc': 1}, unk_token='[UNK]'))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    path = tmp_path / 'tokenizer.json'
+    tokenizer.save(str(path))
+    assert get_tokenizer(str(path)).encode('abc xyz').ids == [1, 0]
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        list(chunk_text('abc', 'nope'))
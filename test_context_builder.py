@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from Chunker import iter_file_chunks, read_window_title
+from ContextBuilder import merge_file_hits, build_context
+
+
+def hit(id, text, file_id=1, score=0.5):
+    return {'id': id, 'file_id': file_id, 'score': score, 'text': text}
+
+
+def test_shared_leading_text_is_not_cut_without_title():
+    hits = [hit(1, '標題\n第一章 介紹 A'), hit(2, '標題\n第一章 結論 B')]
+    merged = merge_file_hits(hits)
+    assert merged['title'] == ''
+    assert merged['bodies'] == ['標題\n第一章 介紹 A', '標題\n第一章 結論 B']
+
+
+def test_known_title_is_stripped_exactly():
+    hits = [hit(1, '標題\n第一章 介紹 A'), hit(2, '標題\n第一章 結論 B')]
+    merged = merge_file_hits(hits, '標題\n')
+    assert merged['title'] == '標題\n'
+    assert merged['bodies'] == ['第一章 介紹 A', '第一章 結論 B']
+
+
+def test_overlapping_window_chunks_are_joined():
+    title = 'T\n'
+    merged = merge_file_hits([hit(2, title + 'cdefghijklmnopqr'), hit(1, title + 'abcdefghijklmnop')], title)
+    assert merged['bodies'] == ['abcdefghijklmnopqr']
+
+
+def test_build_context_uses_titles_per_file():
+    hits = [hit(1, 'T\nbody one', score=0.9), hit(2, 'T\nbody two', score=0.8), hit(3, 'T\nother', file_id=2, score=0.7)]
+    context, scores = build_context(hits, titles={1: 'T\n'})
+    assert scores == [0.9, 0.8, 0.7]
+    assert context.startswith('T\nbody one\n...\nbody two')
+    assert 'T\nother' in context
+
+
+@pytest.mark.parametrize('text', ['標題\n## 一\n內容 ' * 20, '沒有標題的短文件', 'x' * 1500 + '## 太晚', ''])
+def test_read_window_title_matches_chunks(tmp_path, text):
+    path = tmp_path / 'doc.md'
+    path.write_text(text, encoding='utf-8')
+    title = read_window_title(str(path))
+    assert all(chunk.startswith(title) for chunk in iter_file_chunks(str(path), 'window', block_size=64))
+    if '##' in text[:1000]:
+        assert title == text[:text.find('##')]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from EmbeddingCache import EmbeddingCache, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text(' ＡＢＣ　 d\n\te ') == 'ABC d e'
+
+
+def test_round_trip_and_normalized_keys(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / 'cache.db'))
+    vectors = np.arange(6, dtype=np.float32).reshape(2, 3)
+    cache.put_many('m', ['a  b', 'c'], vectors)
+
+    found = cache.get_many('m', ['a b', 'x', 'c', 'a b'])
+    assert found[1] is None
+    np.testing.assert_array_equal(found[0], vectors[0])
+    np.testing.assert_array_equal(found[2], vectors[1])
+    np.testing.assert_array_equal(found[3], vectors[0])
+    # 不同模型不共用
+    assert cache.get_many('other', ['c']) == [None]
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / 'cache.db'), max_entries=10)
+    for i in range(12):
+        cache.put_many('m', [str(i)], [np.full(2, i, dtype=np.float32)])
+    cache.get_many('m', ['0'])
+    assert cache.evict() == 3
+    found = cache.get_many('m', [str(i) for i in range(12)])
+    assert found[0] is not None
+    assert sum(item is None for item in found) == 3
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from IngestionQueue import IngestionQueue, JOB_QUEUED, JOB_CHUNKING, JOB_EMBEDDING, JOB_INDEXING, JOB_DONE, JOB_FAILED
+
+
+@pytest.fixture
+def make_job(app_module, user):
+    user_id, topic_id = user
+
+    def make(status=JOB_QUEUED, age=0, owner=None):
+        with app_module.app.app_context():
+            item = app_module.FileItem(file_path='doc.md', file_name='doc.md', original_name='doc.md',
+                                       user_id=user_id, topic_id=topic_id)
+            app_module.db.session.add(item)
+            app_module.db.session.flush()
+            job = app_module.IngestionJob(file_id=item.id, topic_id=topic_id, user_id=user_id, file_path='doc.md',
+                                          status=status, owner=owner,
+                                          updated_at=datetime.now() - timedelta(seconds=age))
+            app_module.db.session.add(job)
+            app_module.db.session.commit()
+            return job.id
+    return make
+
+
+def make_queue(app_module, handler, **kwargs):
+    return IngestionQueue(app_module.app, app_module.db, app_module.IngestionJob, handler, max_workers=1, **kwargs)
+
+
+def get_job(app_module, job_id):
+    with app_module.app.app_context():
+        job = app_module.db.session.get(app_module.IngestionJob, job_id)
+        app_module.db.session.expunge(job)
+        return job
+
+
+def test_run_records_result_and_runs_once(app_module, make_job):
+    calls = []
+
+    def handler(progress_callback, **task):
+        calls.append(task['file_id'])
+        progress_callback(JOB_EMBEDDING)
+        progress_callback(JOB_INDEXING)
+        return {'chunk_count': 3, 'avg_chunk_chars': 10.0}
+
+    queue = make_queue(app_module, handler)
+    job_id = make_job()
+    queue._run(job_id)
+    queue._run(job_id)
+    job = get_job(app_module, job_id)
+    assert len(calls) == 1
+    assert (job.status, job.chunk_count, job.avg_chunk_chars) == (JOB_DONE, 3, 10.0)
+    assert job.owner == IngestionQueue._owner() and job.finished_at is not None
+
+
+def test_failed_handler_marks_job_failed(app_module, make_job):
+    def handler(progress_callback, **task):
+        raise RuntimeError('embedding server down')
+
+    job_id = make_job()
+    make_queue(app_module, handler)._run(job_id)
+    job = get_job(app_module, job_id)
+    assert (job.status, job.error) == (JOB_FAILED, 'embedding server down')
+
+
+def test_resume_only_queued_and_expired_leases(app_module, make_job, monkeypatch):
+    queue = make_queue(app_module, None, lease_seconds=60)
+    enqueued = []
+    monkeypatch.setattr(queue, 'enqueue', enqueued.append)
+    queued = make_job()
+    expired = make_job(status=JOB_EMBEDDING, age=120, owner='other:1')
+    make_job(status=JOB_EMBEDDING, age=10, owner='other:2')
+    make_job(status=JOB_DONE, age=120)
+    assert queue.resume_pending() == [queued, expired]
+    assert enqueued == [queued, expired]
+    # 只排入佇列，狀態由 _claim 接手時才改變
+    assert get_job(app_module, expired).status == JOB_EMBEDDING
+
+
+def test_claim_takes_over_only_expired_lease(app_module, make_job):
+    queue = make_queue(app_module, None, lease_seconds=60)
+    fresh = make_job(status=JOB_EMBEDDING, age=10, owner='other:2')
+    expired = make_job(status=JOB_EMBEDDING, age=120, owner='other:1')
+    done = make_job(status=JOB_DONE, age=120)
+    with app_module.app.app_context():
+        assert not queue._claim(fresh, 'me:1')
+        assert not queue._claim(done, 'me:1')
+        assert queue._claim(expired, 'me:1')
+        # 已被接手 (updated_at 已更新) 的工作不會再被取得
+        assert not queue._claim(expired, 'me:2')
+    assert get_job(app_module, expired).owner == 'me:1'
+
+
+def test_heartbeat_keeps_long_job_from_being_taken_over(app_module, make_job):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def handler(progress_callback, **task):
+        calls.append(task['file_id'])
+        started.set()
+        release.wait(5)
+        return {}
+
+    first = make_queue(app_module, handler, lease_seconds=0.3, heartbeat_seconds=0.05)
+    second = make_queue(app_module, handler, lease_seconds=0.3, heartbeat_seconds=0.05)
+    job_id = make_job()
+    worker = threading.Thread(target=first._run, args=(job_id,))
+    worker.start()
+    assert started.wait(5)
+    # 執行時間已超過 lease_seconds，但 heartbeat 持續續約
+    release.wait(0.6)
+    assert second.resume_pending() == []
+    second._run(job_id)
+    release.set()
+    worker.join(5)
+    assert len(calls) == 1
+    assert get_job(app_module, job_id).status == JOB_DONE
+
+
+def test_lost_lease_stops_stale_worker(app_module, make_job):
+    def handler(progress_callback, **task):
+        with app_module.app.app_context():
+            job = app_module.db.session.get(app_module.IngestionJob, job_id)
+            job.owner = 'other:1'
+            app_module.db.session.commit()
+        progress_callback(JOB_EMBEDDING)
+        return {}
+
+    job_id = make_job()
+    make_queue(app_module, handler)._run(job_id)
+    job = get_job(app_module, job_id)
+    # 原本的 worker 不會覆寫已被接手的工作
+    assert (job.status, job.owner) == (JOB_CHUNKING, 'other:1')
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from LLM import NOT_FOUND_MESSAGE, NOT_FOUND_SENTINEL, is_not_found, resolve_single_answer, filter_not_found
+
+
+def pieces(text, size=3):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('text, expected', [
+    (NOT_FOUND_SENTINEL, NOT_FOUND_MESSAGE),
+    (f'\n  {NOT_FOUND_SENTINEL}\n', NOT_FOUND_MESSAGE),
+    (f'{NOT_FOUND_SENTINEL} 其他文字', NOT_FOUND_MESSAGE),
+    (f'答案是 A。{NOT_FOUND_SENTINEL}', f'答案是 A。{NOT_FOUND_SENTINEL}'),
+    ('[[NOT', '[[NOT'),
+    ('一般的回答', '一般的回答'),
+])
+def test_ask_and_stream_agree(text, expected):
+    assert resolve_single_answer(text) == expected
+    for size in (1, 3, 100):
+        assert ''.join(filter_not_found(pieces(text, size))) == expected
+
+
+def test_is_not_found():
+    assert is_not_found(f'  {NOT_FOUND_SENTINEL}')
+    assert not is_not_found(f'x{NOT_FOUND_SENTINEL}')
+
+
+def test_stream_passes_through_after_prefix():
+    stream = filter_not_found(iter(['[', '[N', 'X] rest', ' more']))
+    assert list(stream) == ['[[NX] rest', ' more']
+    assert list(filter_not_found([])) == []
+    assert list(filter_not_found(['  ', '\n'])) == []
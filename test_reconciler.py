@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+import VectorStore
+from Reconciler import Reconciler
+from IngestionQueue import JOB_QUEUED, JOB_DONE, JOB_FAILED, JOB_EMBEDDING
+
+
+def vectors(count):
+    return np.ones((count, 4), dtype=np.float32)
+
+
+@pytest.fixture
+def env(app_module, user, tmp_path):
+    '''
+    回傳 (app 模組, Reconciler, 排入佇列的 job id, 建立 FileItem 的函式)
+    '''
+    user_id, topic_id = user
+    uploads = tmp_path / 'uploads'
+    (uploads / str(user_id)).mkdir(parents=True)
+    queued = []
+    reconciler = Reconciler(app_module.app, app_module.db, app_module.FileItem, app_module.Topic,
+                            app_module.IngestionJob, str(uploads), enqueue=queued.append, page_size=2)
+    store = VectorStore.get_vector_store()
+
+    def add(name, topic=topic_id, upload=True, chunks=3, status=JOB_DONE):
+        path = uploads / str(user_id) / name
+        if upload:
+            path.write_text('x' * 100, encoding='utf-8')
+            os.utime(path, (0, 0))
+        with app_module.app.app_context():
+            item = app_module.FileItem(file_path=str(path), file_name=name, original_name=name,
+                                       user_id=user_id, topic_id=topic)
+            app_module.db.session.add(item)
+            app_module.db.session.commit()
+            app_module.db.session.add(app_module.IngestionJob(
+                file_id=item.id, topic_id=topic, user_id=user_id, file_path=str(path), status=status,
+                chunk_count=chunks if status == JOB_DONE else None))
+            app_module.db.session.commit()
+            file_id = item.id
+        if chunks and status == JOB_DONE:
+            store.insert(user_id, topic, file_id, vectors(chunks), ['a'] * chunks)
+        return file_id
+
+    return app_module, reconciler, queued, add, store, uploads
+
+
+def jobs_for(app_module, file_id):
+    with app_module.app.app_context():
+        return [job.status for job in app_module.IngestionJob.query.filter_by(file_id=file_id).order_by(app_module.IngestionJob.id)]
+
+
+def test_report_only_changes_nothing(env, user):
+    app_module, reconciler, queued, add, store, uploads = env
+    user_id, topic_id = user
+    add('ok.md')
+    add('gone.md', upload=False)
+    report = reconciler.run(fix=False)
+    assert report['file_no_upload'] == 1 and not report['fixed']
+    with app_module.app.app_context():
+        assert app_module.FileItem.query.count() == 2
+
+
+def test_fix_paths(env, user):
+    app_module, reconciler, queued, add, store, uploads = env
+    user_id, topic_id = user
+    ok = add('ok.md')
+    empty = add('empty.md', chunks=0)                           # 沒有段落的檔案不算孤兒
+    gone = add('gone.md', upload=False)                         # file_no_upload
+    failed = add('failed.md', chunks=0, status=JOB_FAILED)      # file_no_vectors
+    orphan_topic = add('old.md', topic=topic_id + 10)           # file_no_topic
+    store.insert(user_id, topic_id, 999, vectors(2), ['x', 'y'])  # vectors_no_file
+    stray = uploads / str(user_id) / 'stray.md'                 # upload_no_file
+    stray.write_text('s', encoding='utf-8')
+    os.utime(stray, (0, 0))
+    fresh = uploads / str(user_id) / 'fresh.md'                 # 仍在 grace 期間內
+    fresh.write_text('s', encoding='utf-8')
+
+    report = reconciler.run(fix=True)
+    assert {kind: report[kind] for kind in ('file_no_topic', 'file_no_upload', 'file_no_vectors',
+                                            'vectors_no_file', 'upload_no_file')} == dict.fromkeys(
+        ('file_no_topic', 'file_no_upload', 'file_no_vectors', 'vectors_no_file', 'upload_no_file'), 1)
+
+    with app_module.app.app_context():
+        remaining = {item.id for item in app_module.FileItem.query}
+    assert remaining == {ok, empty, failed}
+    assert jobs_for(app_module, gone) == [] and jobs_for(app_module, orphan_topic) == []
+    assert jobs_for(app_module, failed) == [JOB_FAILED, JOB_QUEUED]
+    assert len(queued) == 1
+    counts = {key: count for page in store.iter_file_counts() for key, count in page.items()}
+    assert counts == {(user_id, topic_id, ok): 3}
+    assert sorted(os.listdir(uploads / str(user_id))) == ['empty.md', 'failed.md', 'fresh.md', 'ok.md']
+
+    # 修正後再次比對沒有孤兒，也不會重複排入工作
+    report = reconciler.run(fix=True)
+    assert sum(report[kind] for kind in ('file_no_topic', 'file_no_upload', 'file_no_vectors',
+                                         'vectors_no_file', 'upload_no_file')) == 0
+    assert len(queued) == 1
+
+
+def test_requeue_skips_files_with_active_job(env):
+    app_module, reconciler, queued, add, store, uploads = env
+    file_id = add('failed.md', chunks=0, status=JOB_FAILED)
+    with app_module.app.app_context():
+        item = app_module.db.session.get(app_module.FileItem, file_id)
+        last_job = app_module.IngestionJob.query.filter_by(file_id=file_id).one()
+        reconciler.requeue([(item, last_job)])
+        # 掃描之後才建立的工作 (例如另一個行程已排入)，不論是 queued 或已在進行中都不再建立
+        reconciler.requeue([(item, last_job)])
+        assert jobs_for(app_module, file_id) == [JOB_FAILED, JOB_QUEUED]
+
+        job = app_module.IngestionJob.query.filter_by(file_id=file_id, status=JOB_QUEUED).one()
+        job.status = JOB_EMBEDDING
+        app_module.db.session.commit()
+        reconciler.requeue([(item, last_job)])
+        assert jobs_for(app_module, file_id) == [JOB_FAILED, JOB_EMBEDDING]
+    assert len(queued) == 1
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from RetrievalCache import RetrievalCache
+
+
+HITS = [{'id': 1, 'file_id': 1, 'score': 0.9, 'text': 'a'}]
+
+
+def test_key_normalizes_question_and_file_order():
+    cache = RetrievalCache()
+    cache.put(1, 2, [3, 1, 3], '  問題　ＡＢＣ ', HITS)
+    assert cache.get(1, 2, [1, 3], '問題 ABC') == HITS
+    assert cache.get(1, 2, [1], '問題 ABC') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_ttl_and_lru_eviction():
+    cache = RetrievalCache(max_entries=2, ttl=0)
+    cache.put(1, 1, [1], 'q', HITS)
+    assert cache.get(1, 1, [1], 'q') is None
+
+    cache = RetrievalCache(max_entries=2, ttl=60)
+    cache.put(1, 1, [1], 'a', HITS)
+    cache.put(1, 1, [1], 'b', HITS)
+    cache.get(1, 1, [1], 'a')
+    cache.put(1, 1, [1], 'c', HITS)
+    assert cache.get(1, 1, [1], 'b') is None
+    assert cache.get(1, 1, [1], 'a') == HITS
+
+
+def test_invalidate_by_user_topic_and_file():
+    cache = RetrievalCache()
+    cache.put(1, 1, [1, 2], 'q', HITS)
+    cache.put(1, 1, [3], 'q', HITS)
+    cache.put(1, 2, [4], 'q', HITS)
+    cache.put(2, 1, [1], 'q', HITS)
+
+    cache.invalidate(1, topic_id=1, file_ids=[2])
+    assert cache.get(1, 1, [1, 2], 'q') is None
+    assert cache.get(1, 1, [3], 'q') == HITS
+
+    cache.invalidate(1, topic_id=1)
+    assert cache.get(1, 1, [3], 'q') is None
+    assert cache.get(1, 2, [4], 'q') == HITS
+
+    cache.invalidate(1)
+    assert cache.get(1, 2, [4], 'q') is None
+    assert cache.get(2, 1, [1], 'q') == HITS
+    assert cache.stats()['invalidations'] == 3
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from ShardVectorStore import ShardVectorStore, ROW_ID_SPAN
+
+
+def unit_vectors(count, dim=8, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize('dtype, tolerance', [('float32', 1e-6), ('float16', 2e-3), ('int8', 0.05)])
+def test_search_matches_exact_scores(tmp_path, dtype, tolerance):
+    # block_rows 小於 shard 筆數，檢查分段計算的結果
+    store = ShardVectorStore(root=str(tmp_path), dtype=dtype, dim=8, block_rows=7)
+    vectors = unit_vectors(40)
+    store.insert(1, 1, 1, vectors[:25], [f't{i}' for i in range(25)])
+    store.insert(1, 1, 2, vectors[25:], [f't{i}' for i in range(25, 40)])
+    query = vectors[3] + 0.01
+
+    hits = store.search(1, 1, [1, 2], query, limit=5)
+    exact = vectors @ query
+    assert hits[0]['text'] == 't3' and hits[0]['id'] == 1 * ROW_ID_SPAN + 3
+    for hit in hits:
+        assert abs(hit['score'] - exact[int(hit['text'][1:])]) <= tolerance
+    assert [hit['score'] for hit in hits] == sorted((hit['score'] for hit in hits), reverse=True)
+    assert store.search(1, 1, [2], query, limit=50)[-1]['file_id'] == 2
+    assert len(store.search(1, 1, [2], query, limit=50)) == 15
+
+
+def test_search_reads_shard_dtype(tmp_path):
+    # SHARD_DTYPE 改為 int8 後，既有的 float32 shard 仍以 float32 讀取
+    vectors = unit_vectors(10)
+    ShardVectorStore(root=str(tmp_path), dtype='float32', dim=8).insert(1, 1, 1, vectors, [f't{i}' for i in range(10)])
+    store = ShardVectorStore(root=str(tmp_path), dtype='int8', dim=8)
+    hits = store.search(1, 1, [1], vectors[3], limit=3)
+    assert hits[0]['text'] == 't3'
+    assert abs(hits[0]['score'] - 1.0) <= 1e-6
+
+    with pytest.raises(ValueError):
+        ShardVectorStore(root=str(tmp_path), dtype='float32', dim=4).search(1, 1, [1], vectors[3][:4], limit=3)
+
+
+def test_delete_and_counts(tmp_path):
+    store = ShardVectorStore(root=str(tmp_path), dim=8)
+    store.insert(1, 1, 1, unit_vectors(3), ['a', 'b', ''])
+    store.insert(1, 2, 2, unit_vectors(2), ['c', 'd'])
+    assert {key: count for page in store.iter_file_counts() for key, count in page.items()} == {
+        (1, 1, 1): 3, (1, 2, 2): 2}
+    assert {hit['text'] for hit in store.search(1, 1, [1], unit_vectors(1)[0], limit=3)} == {'a', 'b', ''}
+
+    store.delete(1, 1, 1)
+    assert store.search(1, 1, [1], unit_vectors(1)[0]) == []
+    store.delete_topic(1, 2)
+    assert list(store.iter_file_counts()) == []
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from pymilvus import DataType
+
+from VectorCodec import (VECTOR_DTYPES, INT8_SCALE, check_vector_dtype, encode_vectors, decode_vectors,
+                         score_scale, milvus_vector_dtype, milvus_vector_index)
+
+
+def unit_vectors(count, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize('dtype, tolerance', [('float32', 0), ('float16', 1e-3), ('int8', 0.5 / INT8_SCALE + 1e-6)])
+def test_round_trip(dtype, tolerance):
+    vectors = unit_vectors(50)
+    encoded = encode_vectors(vectors, dtype)
+    assert encoded.dtype == VECTOR_DTYPES[dtype]
+    decoded = decode_vectors(encoded, dtype)
+    assert decoded.dtype == np.float32
+    assert np.abs(decoded - vectors).max() <= tolerance
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'int8'])
+def test_decode_row_bytes(dtype):
+    encoded = encode_vectors(unit_vectors(3), dtype)
+    rows = [row.tobytes() for row in encoded]
+    np.testing.assert_array_equal(decode_vectors(rows, dtype), decode_vectors(encoded, dtype))
+
+
+def test_float32_encode_does_not_copy():
+    vectors = unit_vectors(4)
+    assert encode_vectors(vectors, 'float32') is vectors
+
+
+def test_int8_clips_and_scales_scores():
+    encoded = encode_vectors([[1.5, -2.0, 0.5]], 'int8')
+    assert encoded.tolist() == [[INT8_SCALE, -INT8_SCALE, 64]]
+    a, b = encode_vectors(unit_vectors(2), 'int8').astype(np.int32)
+    exact = unit_vectors(2)[0] @ unit_vectors(2)[1]
+    assert abs(int(a @ b) / score_scale('int8') - exact) < 0.02
+    assert score_scale('float16') == 1
+
+
+def test_milvus_types():
+    for dtype in VECTOR_DTYPES:
+        check_vector_dtype(dtype)
+    with pytest.raises(ValueError):
+        check_vector_dtype('bfloat16')
+    assert milvus_vector_dtype(DataType.FLOAT16_VECTOR) == 'float16'
+    with pytest.raises(ValueError):
+        milvus_vector_dtype(DataType.BINARY_VECTOR)
+    assert milvus_vector_index('int8')[0] == 'HNSW'
+    assert milvus_vector_index('float32') == ('AUTOINDEX', {})
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from VectorStore import VectorStore, MilvusLiteVectorStore
+from ShardVectorStore import ShardVectorStore
+from MilvusController import MilvusVectorStore
+
+
+def test_backends_implement_interface(tmp_path):
+    # 每個 backend 都實作了全部的抽象方法 (建構時不連線)
+    MilvusVectorStore()
+    MilvusLiteVectorStore(path=str(tmp_path / 'lite.db'))
+    ShardVectorStore(root=str(tmp_path))
+
+
+def test_incomplete_backend_fails_at_construction():
+    class PartialStore(VectorStore):
+        def search(self, user_id, topic_id, file_ids, embedding, limit=10, fresh=False):
+            return []
+
+    with pytest.raises(TypeError):
+        PartialStore()